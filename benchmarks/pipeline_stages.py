@@ -0,0 +1,148 @@
+"""
+Time each stage of the backend pipeline on synthetic CLIF extracts of increasing size.
+
+For every size, `synthetic_clif.py` writes an extract and the stages run as in
+`code/backend.py` (base table loads, medication dose change points, `sbt.sql`, `sat.sql`,
+`sofa.sql`, the LTV rollups and the overall summary) in an in-memory DuckDB database. Prints
+seconds per stage for each size and the scaling exponent of each stage (slope
+of log time against log hospitalizations; 1.0 is linear).
+
+    uv run python benchmarks/pipeline_stages.py --sizes 1000 10000 100000 --data-dir /tmp/clif_synthetic
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+
+from loaders import (  # noqa: E402
+    ADT_COLUMNS, CODE_STATUS_COLUMNS, HOSP_COLUMNS, RESP_COLUMNS, SAT_MED_GROUPS, SOFA_LABS, SOFA_VITALS,
+    VASOACTIVE_MEDS, categorize, gcs_sql, labs_sql, meds_changes_sql, rass_sql, register_cohort, scan_sql,
+    vasoactive_sql, vitals_sql, vitals_summary_sql,
+)
+from overall_summary import build_next_adt_index, summarize_units  # noqa: E402
+from pipeline_db import connect, create_views, read_sql  # noqa: E402
+from stage_sql import HEIGHT_SQL, IBW_SQL, LTV_ROLLUPS_SQL  # noqa: E402
+from synthetic_clif import generate  # noqa: E402
+
+TABLES = ['hospitalization', 'adt', 'code_status', 'vitals', 'labs', 'patient_assessments',
+          'medication_admin_continuous', 'patient']
+
+
+def _table(con, name: str, query: str) -> None:
+    con.execute(f"CREATE OR REPLACE TABLE {name} AS {query.strip().rstrip(';')}")
+
+
+def run_stages(data_dir, timezone: str) -> dict:
+    """Run the pipeline stages on the extract in `data_dir`; returns {stage: seconds}."""
+    con = connect(":memory:", timezone)
+    create_views(con, {
+        **{f"clif_{t}": f"{data_dir}/clif_{t}.parquet" for t in TABLES},
+        "resp_processed_bf": f"{data_dir}/resp_processed_bf.parquet",
+    })
+    # Every hospitalization, with the integer keys the base tables use
+    cohort = register_cohort("clif_hospitalization", con=con)
+
+    def load_vitals():
+        _table(con, "vitals_summary", vitals_summary_sql("clif_vitals", cohort=cohort))
+        _table(con, "last_vitals_df", "FROM vitals_summary SELECT hospitalization_id, recorded_dttm")
+
+    def sat():
+        # The SAT script reads respiratory support as resp_df
+        con.execute("CREATE OR REPLACE VIEW resp_df AS FROM resp_p")
+        _table(con, "sat_days", read_sql(ROOT / "code" / "sat.sql"))
+
+    def load_sofa_inputs():
+        _table(con, "sofa_labs", labs_sql("clif_labs", SOFA_LABS, cohort=cohort))
+        _table(con, "sofa_vitals", vitals_sql("clif_vitals", SOFA_VITALS, cohort=cohort))
+        _table(con, "gcs_df", gcs_sql("clif_patient_assessments", cohort=cohort))
+        _table(con, "vasoactive_df", vasoactive_sql("clif_medication_admin_continuous", VASOACTIVE_MEDS, cohort=cohort))
+
+    def ltv():
+        _table(con, "patient_df", "FROM clif_patient SELECT patient_id, sex_category")
+        _table(con, "height_df", HEIGHT_SQL)
+        _table(con, "ibw_df", IBW_SQL)
+        _table(con, "ltv_rollups", LTV_ROLLUPS_SQL)
+
+    stages = {
+        "load_resp_p": lambda: _table(con, "resp_p", scan_sql("resp_processed_bf", RESP_COLUMNS, cohort=cohort)),
+        "load_hosp_df": lambda: _table(con, "hosp_df", scan_sql("clif_hospitalization", HOSP_COLUMNS, cohort=cohort)),
+        "load_adt_df": lambda: _table(con, "adt_df", scan_sql("clif_adt", ADT_COLUMNS, cohort=cohort)),
+        "load_cs_df": lambda: _table(con, "cs_df", scan_sql("clif_code_status", CODE_STATUS_COLUMNS, cohort=cohort)),
+        "load_vitals_summary": load_vitals,
+        "load_rass_df": lambda: _table(con, "rass_df", rass_sql("clif_patient_assessments", cohort=cohort)),
+        "meds_changes": lambda: _table(
+            con, "meds_df", meds_changes_sql("clif_medication_admin_continuous", SAT_MED_GROUPS, cohort=cohort),
+        ),
+        "sbt_sql": lambda: _table(con, "sbt_events", read_sql(ROOT / "code" / "sbt.sql")),
+        "sat_sql": sat,
+        "load_sofa_inputs": load_sofa_inputs,
+        "sofa_sql": lambda: _table(con, "sofa_days", read_sql(ROOT / "code" / "sofa.sql")),
+        "ltv": ltv,
+    }
+    timings = {}
+    for stage, run in stages.items():
+        start = time.perf_counter()
+        run()
+        timings[stage] = time.perf_counter() - start
+
+    # Overall summary: every ICU unit over the whole extract (backend), then one unit for a week (dashboard)
+    start = time.perf_counter()
+    adt_pdf = categorize(con.table("adt_df").df())
+    adt_index = build_next_adt_index(adt_pdf, categorize(con.table("hosp_df").df()))
+    icu_units = sorted(adt_pdf.loc[adt_pdf['location_category'] == 'icu', 'location_name'].unique())
+    summarize_units(adt_index, icu_units, '2024-01-01', '2024-12-31', tz=timezone)
+    timings["overall_summary_all_units"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summarize_units(adt_index, [icu_units[0]], '2024-06-01', '2024-06-07', tz=timezone)
+    timings["overall_summary_one_unit"] = time.perf_counter() - start
+    con.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numbers of hospitalizations to benchmark")
+    parser.add_argument("--data-dir", help="Keep the extracts here (one subdirectory per size) and reuse them")
+    parser.add_argument("--timezone", default="America/Chicago")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="Also write the timings to this CSV file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_hosp in args.sizes:
+            data_dir = Path(args.data_dir or tmp) / f"n{n_hosp}"
+            if not (data_dir / "resp_processed_bf.parquet").exists():
+                start = time.perf_counter()
+                generate(n_hosp, data_dir, args.seed)
+                print(f"Generated {n_hosp:,} hospitalizations in {time.perf_counter() - start:.1f}s")
+            results[n_hosp] = run_stages(data_dir, args.timezone)
+
+    timings = pd.DataFrame(results).rename_axis("stage")
+    timings.loc["total"] = timings.sum()
+    if len(args.sizes) > 1:
+        log_n = np.log(timings.columns.to_numpy(dtype=float))
+        timings["exponent"] = [np.polyfit(log_n, np.log(np.maximum(row, 1e-6)), 1)[0]
+                               for row in timings.to_numpy()]
+
+    print(f"\n{'stage':>26}" + "".join(f"{f'{n:,}':>12}" for n in args.sizes)
+          + (f"{'exponent':>10}" if "exponent" in timings else ""))
+    for stage, row in timings.iterrows():
+        print(f"{stage:>26}" + "".join(f"{row[n]:>12.3f}" for n in args.sizes)
+              + (f"{row['exponent']:>10.2f}" if "exponent" in timings else ""))
+    if args.csv:
+        timings.to_csv(args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark the window-frame SAT flags in code/sat.sql against the correlated-subquery
+formulation kept in docs/ref_sat_correlated.sql.
+
+Both scripts run on the same synthetic SAT inputs (resp_df, meds_df dose change points, rass_df, adt_df);
+the day-level outputs must be identical.
+
+    uv run python benchmarks/sat_window_flags.py --sizes 250 1000 4000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "code"))
+
+from loaders import SAT_MED_GROUPS  # noqa: E402
+
+SAT_SQL = ROOT / "code" / "sat.sql"
+REF_SQL = ROOT / "docs" / "ref_sat_correlated.sql"
+
+SEDATION_MEDS = ['fentanyl', 'propofol', 'lorazepam', 'midazolam', 'hydromorphone', 'morphine']
+PARALYTIC_MEDS = SAT_MED_GROUPS['paralytic']
+
+
+def _event_times(rng, starts, ends, mean_gap_min):
+    """Irregular timestamps between each start and end, with their hospitalization index."""
+    n_events = np.maximum(((ends - starts) / np.timedelta64(1, 'm') / mean_gap_min).astype(int), 1)
+    owner = np.repeat(np.arange(len(starts)), n_events)
+    offsets = rng.random(len(owner)) * ((ends - starts) / np.timedelta64(1, 'm'))[owner]
+    times = starts[owner] + (offsets * 60).astype('timedelta64[s]')
+    return owner, times
+
+
+def make_sat_inputs(n_hosp: int, seed: int = 0) -> dict:
+    """Synthetic ventilated ICU stays with sedation drips, cessations and RASS assessments."""
+    rng = np.random.default_rng(seed)
+    hosp_ids = np.array([f"H{i:07d}" for i in range(n_hosp)])
+    in_dttm = np.datetime64('2024-01-01T00:00') + rng.integers(0, 365 * 24 * 60, n_hosp).astype('timedelta64[m]')
+    out_dttm = in_dttm + rng.integers(2 * 24 * 60, 6 * 24 * 60, n_hosp).astype('timedelta64[m]')
+
+    adt_df = pd.DataFrame({
+        'hospitalization_id': hosp_ids,
+        'in_dttm': pd.to_datetime(in_dttm).tz_localize('UTC'),
+        'location_category': 'icu',
+    })
+
+    owner, times = _event_times(rng, in_dttm, out_dttm, 60)
+    resp_df = pd.DataFrame({
+        'hospitalization_id': hosp_ids[owner],
+        'recorded_dttm': pd.to_datetime(times).tz_localize('UTC'),
+        'device_category': np.where(rng.random(len(owner)) < 0.97, 'imv', 'nasal cannula'),
+    })
+
+    # Dose change points in long format, as `meds_changes_sql` loads them
+    owner, times = _event_times(rng, in_dttm, out_dttm, 45)
+    drug = np.array(SEDATION_MEDS + PARALYTIC_MEDS)[
+        np.where(rng.random(len(owner)) < 0.03, rng.integers(6, 9, len(owner)), rng.integers(0, 2, len(owner)) + owner % 5)
+    ]
+    dose = np.where(rng.random(len(owner)) < 0.15, 0.0, rng.choice([12.5, 25.0, 50.0, 100.0], len(owner)))
+    meds_df = pd.DataFrame({
+        'hospitalization_id': hosp_ids[owner],
+        'med_category': drug,
+        'recorded_dttm': pd.to_datetime(times).tz_localize('UTC'),
+        'med_dose': dose,
+    })
+    meds_df['med_group'] = meds_df['med_category'].map(
+        {med: group for group, meds in SAT_MED_GROUPS.items() for med in meds}
+    )
+    meds_df = meds_df.drop_duplicates(['hospitalization_id', 'med_category', 'recorded_dttm'])
+
+    owner, times = _event_times(rng, in_dttm, out_dttm, 40)
+    rass_df = pd.DataFrame({
+        'hospitalization_id': hosp_ids[owner],
+        'recorded_dttm': pd.to_datetime(times).tz_localize('UTC'),
+        'rass': rng.integers(-4, 3, len(owner)).astype(float),
+    })
+    return {'resp_df': resp_df, 'meds_df': meds_df, 'rass_df': rass_df, 'adt_df': adt_df}
+
+
+def run_sat(sql_path: Path, inputs: dict):
+    """Run a SAT script on a fresh connection; returns (day-level output, seconds)."""
+    con = duckdb.connect()
+    con.execute("SET TimeZone = 'UTC'")
+    for name, df in inputs.items():
+        con.register(name, df)
+    query = sql_path.read_text()
+    start = time.perf_counter()
+    result = con.sql(query).df()
+    elapsed = time.perf_counter() - start
+    con.close()
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 4000],
+                        help="Numbers of hospitalizations to benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'hospitalizations':>16} {'events':>10} {'correlated_s':>13} {'window_s':>9} {'speedup':>8} {'eligible_days':>14}")
+    for n_hosp in args.sizes:
+        inputs = make_sat_inputs(n_hosp, args.seed)
+        n_events = sum(len(df) for df in inputs.values())
+        ref_days, ref_s = run_sat(REF_SQL, inputs)
+        sat_days, sat_s = run_sat(SAT_SQL, inputs)
+        # Day-level flags must be identical
+        pd.testing.assert_frame_equal(ref_days, sat_days)
+        print(f"{n_hosp:>16,} {n_events:>10,} {ref_s:>13.2f} {sat_s:>9.2f} {ref_s / sat_s:>7.1f}x {len(sat_days):>14,}")
+
+
+if __name__ == "__main__":
+    main()
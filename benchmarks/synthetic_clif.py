@@ -0,0 +1,321 @@
+"""
+Synthetic CLIF extract for benchmarking the pipeline.
+
+Writes `clif_hospitalization`, `clif_adt`, `clif_patient`, `clif_code_status`,
+`clif_vitals`, `clif_labs`, `clif_patient_assessments`,
+`clif_medication_admin_continuous` and `resp_processed_bf` as parquet files
+for a given number of hospitalizations. Stays run ED -> ICU -> ward/stepdown,
+some with an ICU readmission; about half of ICU stays are ventilated, with
+sedation drips, RASS assessments, mode changes, extubation and occasional
+reintubation. ICU stays also get vasopressor drips, GCS and the SOFA labs.
+Event densities are set in `DENSITY`.
+
+Hospitalizations are generated in chunks and appended to each file, so
+memory stays bounded at any size.
+
+    uv run python benchmarks/synthetic_clif.py 10000 /tmp/clif_10k
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+START = np.datetime64('2024-01-01T00:00')
+ICU_UNITS = ['MICU', 'SICU', 'CICU', 'NCCU']
+WARD_UNITS = ['W-1', 'W-2', 'W-3']
+DISCHARGE_CATEGORIES = ['Home', 'Expired', 'Hospice', 'Skilled Nursing Facility (SNF)',
+                        'Acute Inpatient Rehab Facility']
+DISCHARGE_P = [0.6, 0.12, 0.08, 0.12, 0.08]
+SEDATION_MEDS = ['fentanyl', 'propofol', 'lorazepam', 'midazolam', 'hydromorphone', 'morphine']
+PARALYTIC_MEDS = ['cisatracurium', 'vecuronium', 'rocuronium']
+OTHER_MEDS = ['norepinephrine', 'epinephrine', 'vasopressin', 'insulin', 'heparin']
+# Weight-based drips (mcg/kg/min); the rest are charted in mcg/hr
+VASOPRESSORS = ['norepinephrine', 'epinephrine']
+CONTROLLED_MODES = ['assist control-volume control', 'pressure control', 'pressure-regulated volume control']
+ALL_MODES = CONTROLLED_MODES + ['pressure support/cpap', 'simv']
+ICU_VITALS = ['heart_rate', 'sbp', 'dbp', 'map', 'spo2', 'respiratory_rate', 'temp_c']
+
+# Mean minutes between events
+DENSITY = {
+    'icu_vitals': 60,
+    'ward_vitals': 240,
+    'resp': 55,
+    'meds': 90,
+    'rass': 120,
+    'gcs': 240,
+    'labs': 720,
+    'abg': 480,
+}
+CHUNK_SIZE = 5_000
+
+
+def _minutes(rng, low, high, n):
+    return rng.integers(low, high, n).astype('timedelta64[m]')
+
+
+def _event_times(rng, starts, ends, mean_gap_min):
+    """Uniformly placed timestamps between each start and end, sorted within each interval."""
+    span_min = np.maximum((ends - starts) / np.timedelta64(1, 'm'), 0)
+    n_events = np.maximum((span_min / mean_gap_min).astype(int), 1)
+    owner = np.repeat(np.arange(len(starts)), n_events)
+    offsets = np.sort(rng.random(len(owner)) + owner) - owner
+    times = starts[owner] + (offsets * span_min[owner] * 60).astype('timedelta64[s]')
+    return owner, times
+
+
+def _utc(times):
+    return pd.to_datetime(times).tz_localize('UTC')
+
+
+def _categorical(values):
+    return pd.Categorical(values)
+
+
+def generate_chunk(first_id: int, n_hosp: int, rng) -> dict:
+    """All tables for hospitalizations `first_id` to `first_id + n_hosp - 1`."""
+    ids = np.arange(first_id, first_id + n_hosp)
+    hosp_ids = np.char.add('H', np.char.zfill(ids.astype(str), 8))
+    patient_ids = np.char.add('P', np.char.zfill((ids // 2).astype(str), 8))
+    admission = START + _minutes(rng, 0, 365 * 24 * 60, n_hosp)
+
+    # ADT: ED, ICU, then ward/stepdown (60%) and an ICU readmission (15% of those)
+    ed_out = admission + _minutes(rng, 60, 600, n_hosp)
+    icu_out = ed_out + _minutes(rng, 600, 8 * 24 * 60, n_hosp)
+    to_ward = rng.random(n_hosp) < 0.6
+    ward_out = icu_out + _minutes(rng, 600, 5 * 24 * 60, n_hosp)
+    readmit = to_ward & (rng.random(n_hosp) < 0.15)
+    readmit_out = ward_out + _minutes(rng, 600, 3 * 24 * 60, n_hosp)
+    discharge = np.where(readmit, readmit_out, np.where(to_ward, ward_out, icu_out))
+    icu_unit = np.array(ICU_UNITS)[rng.integers(0, len(ICU_UNITS), n_hosp)]
+    ward_unit = np.array(WARD_UNITS)[rng.integers(0, len(WARD_UNITS), n_hosp)]
+    ward_category = np.where(rng.random(n_hosp) < 0.7, 'ward', 'stepdown')
+
+    segments = [
+        (np.ones(n_hosp, bool), admission, ed_out, np.full(n_hosp, 'ED'), np.full(n_hosp, 'ed')),
+        (np.ones(n_hosp, bool), ed_out, icu_out, icu_unit, np.full(n_hosp, 'icu')),
+        (to_ward, icu_out, ward_out, ward_unit, ward_category),
+        (readmit, ward_out, readmit_out, icu_unit, np.full(n_hosp, 'icu')),
+    ]
+    adt = pd.DataFrame({
+        'hospitalization_id': np.concatenate([hosp_ids[m] for m, *_ in segments]),
+        'in_dttm': _utc(np.concatenate([a[m] for m, a, *_ in segments])),
+        'out_dttm': _utc(np.concatenate([b[m] for m, _, b, *_ in segments])),
+        'location_name': _categorical(np.concatenate([n[m] for m, _, _, n, _ in segments])),
+        'location_category': _categorical(np.concatenate([c[m] for m, _, _, _, c in segments])),
+        'location_type': _categorical(np.full(sum(m.sum() for m, *_ in segments), 'adult')),
+    }).sort_values(['hospitalization_id', 'in_dttm'], kind='stable')
+
+    hospitalization = pd.DataFrame({
+        'patient_id': patient_ids,
+        'hospitalization_id': hosp_ids,
+        'admission_dttm': _utc(admission),
+        'discharge_dttm': _utc(discharge),
+        'discharge_category': _categorical(rng.choice(DISCHARGE_CATEGORIES, n_hosp, p=DISCHARGE_P)),
+        'age_at_admission': rng.integers(18, 95, n_hosp),
+    })
+    first_of_patient = ids % 2 == 0
+    patient = pd.DataFrame({
+        'patient_id': patient_ids[first_of_patient],
+        'sex_category': _categorical(rng.choice(['Female', 'Male'], first_of_patient.sum())),
+    })
+    code_status = pd.DataFrame({
+        'hospitalization_id': hosp_ids,
+        'patient_id': patient_ids,
+        'start_dttm': _utc(admission),
+        'code_status_category': _categorical(rng.choice(['Full', 'DNR', 'DNR/DNI'], n_hosp, p=[0.8, 0.1, 0.1])),
+    })
+
+    # Vitals: hourly in the ICU, every 4 hours elsewhere, plus height and weight at admission
+    in_icu = np.concatenate([ed_out, ward_out[readmit]]), np.concatenate([icu_out, readmit_out[readmit]])
+    icu_owner = np.concatenate([np.arange(n_hosp), np.flatnonzero(readmit)])
+    o, t = _event_times(rng, in_icu[0], in_icu[1], DENSITY['icu_vitals'])
+    icu_vitals_owner = np.repeat(icu_owner[o], len(ICU_VITALS))
+    icu_vitals_time = np.repeat(t, len(ICU_VITALS))
+    icu_vitals_category = np.tile(ICU_VITALS, len(o))
+    w_starts = np.concatenate([admission, icu_out[to_ward]])
+    w_ends = np.concatenate([ed_out, ward_out[to_ward]])
+    w_owner = np.concatenate([np.arange(n_hosp), np.flatnonzero(to_ward)])
+    o, t = _event_times(rng, w_starts, w_ends, DENSITY['ward_vitals'])
+    ward_vitals_owner = np.repeat(w_owner[o], 3)
+    ward_vitals_time = np.repeat(t, 3)
+    ward_vitals_category = np.tile(['heart_rate', 'sbp', 'spo2'], len(o))
+    vitals_owner = np.concatenate([icu_vitals_owner, ward_vitals_owner, np.arange(n_hosp), np.arange(n_hosp)])
+    vitals_category = np.concatenate([icu_vitals_category, ward_vitals_category,
+                                      np.full(n_hosp, 'height_cm'), np.full(n_hosp, 'weight_kg')])
+    vital_ranges = {'heart_rate': (50, 140), 'sbp': (80, 180), 'dbp': (40, 100), 'map': (55, 120),
+                    'spo2': (85, 100), 'respiratory_rate': (10, 35), 'temp_c': (35, 40),
+                    'height_cm': (150, 195), 'weight_kg': (45, 130)}
+    vitals_category = pd.Categorical(vitals_category, categories=list(vital_ranges))
+    low, high = np.array(list(vital_ranges.values()), dtype=float)[vitals_category.codes].T
+    vitals = pd.DataFrame({
+        'hospitalization_id': hosp_ids[vitals_owner],
+        'recorded_dttm': _utc(np.concatenate([icu_vitals_time, ward_vitals_time, admission, admission])),
+        'vital_category': vitals_category,
+        'vital_value': np.round(low + rng.random(len(low)) * (high - low), 1),
+    })
+
+    # Ventilation in the first ICU stay for 55% of hospitalizations
+    vented = np.flatnonzero(rng.random(n_hosp) < 0.55)
+    vent_start = ed_out[vented] + _minutes(rng, 0, 120, len(vented))
+    vent_end = np.minimum(icu_out[vented], vent_start + _minutes(rng, 600, 6 * 24 * 60, len(vented)))
+    vent_end = np.maximum(vent_end, vent_start + np.timedelta64(60, 'm'))
+    o, t = _event_times(rng, vent_start, vent_end, DENSITY['resp'])
+    # Mode changes start new runs of rows with a random mode
+    new_run = np.r_[True, o[1:] != o[:-1]] | (rng.random(len(o)) < 0.08)
+    run_mode = np.array(ALL_MODES)[
+        np.where(rng.random(new_run.sum()) < 0.75, rng.integers(0, 3, new_run.sum()), rng.integers(3, 5, new_run.sum()))
+    ]
+    mode = run_mode[np.cumsum(new_run) - 1]
+    trach = (rng.random(len(vented)) < 0.05)[o] & (t > (vent_start + np.timedelta64(24, 'h'))[o])
+    reintubated = rng.random(len(vented)) < 0.15
+    reintub_time = vent_end + _minutes(rng, 60, 30 * 60, len(vented))
+    n_imv = len(o)
+    resp = pd.DataFrame({
+        'hospitalization_id': np.concatenate([hosp_ids[vented][o], hosp_ids[vented], hosp_ids[vented][reintubated]]),
+        'recorded_dttm': _utc(np.concatenate([t, vent_end, reintub_time[reintubated]])),
+        'device_category': _categorical(np.concatenate([
+            np.full(n_imv, 'imv'),
+            rng.choice(['nasal cannula', 'room air', 'high flow nc'], len(vented)),
+            np.full(reintubated.sum(), 'imv'),
+        ])),
+        'device_name': _categorical(np.concatenate([
+            np.where(rng.random(n_imv) < 0.02, 't-piece', 'vent'),
+            np.full(len(vented), 'nc'),
+            np.full(reintubated.sum(), 'vent'),
+        ])),
+        'mode_category': _categorical(np.concatenate([mode, np.full(len(vented), None), np.full(reintubated.sum(), ALL_MODES[0])])),
+        'fio2_set': np.concatenate([rng.choice([0.3, 0.4, 0.6], n_imv), np.full(len(vented), 0.21), np.full(reintubated.sum(), 0.4)]),
+        'peep_set': np.concatenate([rng.choice([5.0, 8.0, 10.0], n_imv), np.full(len(vented), np.nan), np.full(reintubated.sum(), 5.0)]),
+        'pressure_support_set': np.concatenate([rng.choice([5.0, 8.0, 10.0, 12.0], n_imv), np.full(len(vented), np.nan), np.full(reintubated.sum(), 10.0)]),
+        'tidal_volume_set': np.concatenate([rng.choice([350.0, 400.0, 450.0, 500.0, 550.0], n_imv), np.full(len(vented), np.nan), np.full(reintubated.sum(), 450.0)]),
+        'tracheostomy': np.concatenate([trach.astype(float), np.zeros(len(vented)), np.zeros(reintubated.sum())]),
+    })
+    resp['mode_name'] = resp['mode_category']
+
+    # Continuous medications: one or two sedatives over the ventilation, stopped at extubation
+    n_drips = rng.integers(1, 3, len(vented))
+    drip_owner = np.repeat(np.arange(len(vented)), n_drips)
+    # A second drip uses the next sedative in the list, so the two never repeat
+    drip_index = np.arange(len(drip_owner)) - np.repeat(np.cumsum(n_drips) - n_drips, n_drips)
+    drip_med = np.array(SEDATION_MEDS)[(rng.integers(0, len(SEDATION_MEDS), len(vented))[drip_owner] + drip_index)
+                                       % len(SEDATION_MEDS)]
+    o, t = _event_times(rng, vent_start[drip_owner], vent_end[drip_owner], DENSITY['meds'])
+    dose = np.where(rng.random(len(o)) < 0.1, 0.0, rng.choice([5.0, 12.5, 25.0, 50.0, 100.0], len(o)))
+    paralyzed = np.flatnonzero(rng.random(len(vented)) < 0.1)
+    # Non-sedation drips on the ICU stay, filtered out by the loaders
+    other_owner = np.flatnonzero(rng.random(n_hosp) < 0.3)
+    oo, ot = _event_times(rng, ed_out[other_owner], icu_out[other_owner], DENSITY['meds'] * 2)
+    meds_hosp = np.concatenate([
+        hosp_ids[vented][drip_owner][o], hosp_ids[vented][drip_owner],
+        np.repeat(hosp_ids[vented][paralyzed], 2), hosp_ids[other_owner][oo],
+    ])
+    other_med = np.array(OTHER_MEDS)[rng.integers(0, len(OTHER_MEDS), len(oo))]
+    weight_based = np.isin(other_med, VASOPRESSORS)
+    meds_category = np.concatenate([
+        drip_med[o], drip_med,
+        np.repeat(np.array(PARALYTIC_MEDS)[rng.integers(0, 3, len(paralyzed))], 2),
+        other_med,
+    ])
+    meds = pd.DataFrame({
+        'hospitalization_id': meds_hosp,
+        'admin_dttm': _utc(np.concatenate([
+            t, vent_end[drip_owner],
+            np.stack([vent_start[paralyzed] + np.timedelta64(2, 'h'),
+                      vent_start[paralyzed] + np.timedelta64(8, 'h')], axis=1).ravel(),
+            ot,
+        ])),
+        'med_category': _categorical(meds_category),
+        'med_dose': np.concatenate([
+            dose, np.zeros(len(drip_owner)),
+            np.tile([5.0, 0.0], len(paralyzed)), rng.random(len(oo)) * np.where(weight_based, 0.5, 10),
+        ]),
+        'med_dose_unit': _categorical(np.concatenate([
+            np.full(len(meds_hosp) - len(oo), 'mcg/hr'), np.where(weight_based, 'mcg/kg/min', 'mcg/hr'),
+        ])),
+    })
+    meds['med_name'] = meds['med_category']
+
+    # Assessments: RASS during ventilation and 4 hours after, GCS through the ICU stay
+    o, t = _event_times(rng, vent_start, vent_end + np.timedelta64(4, 'h'), DENSITY['rass'])
+    go, gt = _event_times(rng, ed_out, icu_out, DENSITY['gcs'])
+    assessments = pd.DataFrame({
+        'hospitalization_id': np.concatenate([hosp_ids[vented][o], hosp_ids[go]]),
+        'recorded_dttm': _utc(np.concatenate([t, gt])),
+        'assessment_category': _categorical(np.concatenate([np.full(len(o), 'RASS'), np.full(len(go), 'gcs_total')])),
+        'assessment_value': np.concatenate([rng.integers(-5, 3, len(o)), rng.integers(3, 16, len(go))]).astype(str),
+    })
+
+    # Labs: creatinine, bilirubin and platelets through the ICU stay, arterial PO2 during ventilation
+    lo, lt = _event_times(rng, ed_out, icu_out, DENSITY['labs'])
+    ao, at = _event_times(rng, vent_start, vent_end, DENSITY['abg'])
+    lab_ranges = {'creatinine': (0.5, 5.0), 'bilirubin_total': (0.3, 14.0),
+                  'platelet_count': (20, 350), 'po2_arterial': (50, 200)}
+    lab_category = pd.Categorical(
+        np.concatenate([np.tile(list(lab_ranges)[:3], len(lo)), np.full(len(ao), 'po2_arterial')]),
+        categories=list(lab_ranges),
+    )
+    low, high = np.array(list(lab_ranges.values()), dtype=float)[lab_category.codes].T
+    lab_value = np.round(low + rng.random(len(low)) * (high - low), 1)
+    lab_collect = np.concatenate([np.repeat(lt, 3), at])
+    labs = pd.DataFrame({
+        'hospitalization_id': np.concatenate([np.repeat(hosp_ids[lo], 3), hosp_ids[vented][ao]]),
+        'lab_collect_dttm': _utc(lab_collect),
+        'lab_result_dttm': _utc(lab_collect + np.timedelta64(1, 'h')),
+        'lab_category': lab_category,
+        'lab_value': lab_value.astype(str),
+        'lab_value_numeric': lab_value,
+    })
+
+    return {
+        'clif_hospitalization': hospitalization,
+        'clif_adt': adt,
+        'clif_patient': patient,
+        'clif_code_status': code_status,
+        'clif_vitals': vitals,
+        'clif_labs': labs,
+        'clif_patient_assessments': assessments,
+        'clif_medication_admin_continuous': meds,
+        'resp_processed_bf': resp,
+    }
+
+
+def generate(n_hosp: int, out_dir, seed: int = 0, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Write every synthetic table to `out_dir`; returns the row count of each table."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    writers, n_rows = {}, {}
+    try:
+        for first_id in range(0, n_hosp, chunk_size):
+            for name, df in generate_chunk(first_id, min(chunk_size, n_hosp - first_id), rng).items():
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                # Dictionaries differ between chunks; store plain strings
+                table = table.cast(pa.schema([
+                    pa.field(f.name, pa.string()) if pa.types.is_dictionary(f.type) else f for f in table.schema
+                ]))
+                if name not in writers:
+                    writers[name] = pq.ParquetWriter(out_dir / f"{name}.parquet", table.schema)
+                writers[name].write_table(table)
+                n_rows[name] = n_rows.get(name, 0) + len(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("n_hosp", type=int, help="Number of hospitalizations")
+    parser.add_argument("out_dir", help="Directory for the parquet files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, n in generate(args.n_hosp, args.out_dir, args.seed).items():
+        print(f"{name:>34}: {n:>12,} rows")
+
+
+if __name__ == "__main__":
+    main()
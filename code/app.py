@@ -16,6 +16,8 @@ def _():
 
 @app.cell
 def _(Path, json):
+    from profiling import RunLog
+
     # Load configuration
     config_path = Path(__file__).parent.parent / "config" / "config.json"
 
@@ -31,53 +33,51 @@ def _(Path, json):
     print(f"Tables path: {tables_path}")
     print(f"File type: {file_type}")
     print(f"Timezone: {timezone}")
-    return file_type, tables_path
-
 
-@app.cell
-def _(Path, file_type, json, tables_path):
-    from clifpy.tables import Adt, Hospitalization
-
-    # Get timezone from config
-    _cfg_path = Path(__file__).parent.parent / "config" / "config.json"
-    with open(_cfg_path) as _cfg_file:
-        _cfg = json.load(_cfg_file)
-    site_timezone = _cfg.get("timezone", "America/Chicago")
-
-    # Load ADT table using clifpy (handles datetime conversion automatically)
-    adt_table = Adt.from_file(
-        data_directory=tables_path,
-        filetype=file_type,
-        timezone=site_timezone
+    # Run log of each load and summary step under output/intermediate
+    run_log = RunLog(
+        Path(__file__).parent.parent / "output" / "intermediate" / f"{site_name.lower()}_run_logs", "app"
     )
-    adt_df = adt_table.df
+    return file_type, run_log, site_name, tables_path, timezone
 
-    # Load hospitalization table using clifpy
-    hosp_table = Hospitalization.from_file(
-        data_directory=tables_path,
-        filetype=file_type,
-        timezone=site_timezone
-    )
-    hosp_df = hosp_table.df
+
+@app.cell
+def _(file_type, run_log, tables_path, timezone):
+    import duckdb
+    from loaders import AdtWindow
+    from pipeline_db import create_views
+
+    # ADT and hospitalization files are read lazily by DuckDB, in the site's local time
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{timezone}'")
+    create_views(con, {
+        f"clif_{table}": f"{tables_path}/clif_{table}.{file_type}" for table in ["adt", "hospitalization"]
+    })
+    adt_window = AdtWindow(con, "clif_adt", "clif_hospitalization")
 
     # Get unique ICU locations
-    location_df = adt_df[['location_name', 'location_category', 'location_type']].drop_duplicates()
-    icu_locations = location_df[location_df['location_category'].str.lower() == 'icu'].copy()
+    with run_log.stage("load_locations") as _record:
+        location_df = adt_window.locations()
+        icu_locations = location_df[location_df['location_category'] == 'icu'].copy()
+        _record['rows_out'] = len(location_df)
 
-    print(f"Loaded {len(adt_df)} ADT records, {len(hosp_df)} hospitalizations")
     print(f"Found {len(icu_locations)} unique ICU locations")
-    return adt_df, hosp_df, icu_locations
+    return adt_window, icu_locations
 
 
 @app.cell
-def _(adt_df, datetime):
-    # Get min and max dates from ADT table (already converted to datetime)
-    min_date = min(adt_df['in_dttm'].min(), adt_df['out_dttm'].min())
-    max_date = max(adt_df['in_dttm'].max(), adt_df['out_dttm'].max())
-
-    # Convert to date objects
-    min_date_obj = datetime.date(2024, 1, 1)
-    max_date_obj = datetime.date(2024, 12, 31)
+def _(adt_window, datetime):
+    # Get min and max dates from the ADT table
+    min_date, max_date = adt_window.date_bounds()
+
+    # The date picker spans the days of the ADT table, in the site's local time; an empty table
+    # keeps the default range
+    if min_date is None or max_date is None:
+        min_date_obj = datetime.date(2024, 1, 1)
+        max_date_obj = datetime.date(2024, 12, 31)
+    else:
+        min_date_obj = min_date.date()
+        max_date_obj = max_date.date()
 
     print(f"\nDate range in database:")
     print(f"  Min date: {min_date_obj}")
@@ -111,158 +111,191 @@ def _(datetime, icu_locations, max_date_obj, min_date_obj, mo):
 
 
 @app.cell
-def _(adt_df, date_range, hosp_df, pd, unit_dropdown):
-    # Generate overall_summary dataframe based on selected location and date range
-    selected_location = unit_dropdown.value
-    start_date = pd.Timestamp(date_range.value[0])
-    end_date = pd.Timestamp(date_range.value[1])
-
-    # Filter ADT data for selected location
-    location_adt = adt_df[adt_df['location_name'] == selected_location].copy()
-
-    # Get timezone from ADT data (set by clifpy)
-    adt_tz = adt_df['in_dttm'].dt.tz
-
-    # Create a date range for iteration
-    date_list = pd.date_range(start=start_date, end=end_date, freq='D')
-
-    summary_records = []
-
-    for day in date_list:
-        # Day is defined as 7 AM to 7 AM next day (timezone-aware)
-        day_start = pd.Timestamp(day.date()).replace(hour=7).tz_localize(adt_tz)
-        day_end = pd.Timestamp((day + pd.Timedelta(days=1)).date()).replace(hour=7).tz_localize(adt_tz)
-        census_7am = pd.Timestamp(day.date()).replace(hour=7).tz_localize(adt_tz)
-        census_7pm = pd.Timestamp(day.date()).replace(hour=19).tz_localize(adt_tz)
-
-        # Total admissions: in_dttm within this day (7 AM to 7 AM next day)
-        admissions = location_adt[
-            (location_adt['in_dttm'] >= day_start) &
-            (location_adt['in_dttm'] < day_end)
-        ]
-        day_admissions_count = len(admissions)
-
-        # Census at 7 AM: patients present at 7 AM
-        census_7am_count = len(location_adt[
-            (location_adt['in_dttm'] <= census_7am) &
-            ((location_adt['out_dttm'].isna()) | (location_adt['out_dttm'] > census_7am))
-        ])
-
-        # Census at 7 PM: patients present at 7 PM
-        census_7pm_count = len(location_adt[
-            (location_adt['in_dttm'] <= census_7pm) &
-            ((location_adt['out_dttm'].isna()) | (location_adt['out_dttm'] > census_7pm))
-        ])
-
-        # Total discharges from ICU: out_dttm within this day (7 AM to 7 AM next day)
-        icu_discharges = location_adt[
-            (location_adt['out_dttm'] >= day_start) &
-            (location_adt['out_dttm'] < day_end)
-        ].copy()
-        day_discharges_count = len(icu_discharges)
-
-        # Merge with hospitalization data to get discharge categories
-        icu_discharges_with_hosp = icu_discharges.merge(
-            hosp_df[['hospitalization_id', 'discharge_category', 'discharge_dttm']],
-            on='hospitalization_id',
-            how='left'
+def _(adt_window, run_log):
+    from overall_summary import build_next_adt_index
+
+    # Index of the last window read; rebuilt only when another window is loaded
+    adt_indexes = {}
+
+    def adt_index(start_date, end_date):
+        """Index of every ADT segment's next location and hospital discharge over `[start_date, end_date]`."""
+        with run_log.stage("load_adt") as _record:
+            adt_df, hosp_df = adt_window.load(start_date, end_date)
+            _record['rows_out'] = len(adt_df)
+        if adt_indexes.get('window') != adt_window.window:
+            with run_log.stage("adt_index", rows_in=len(adt_df)) as _record:
+                adt_indexes.update(window=adt_window.window, index=build_next_adt_index(adt_df, hosp_df))
+                _record['rows_out'] = len(adt_indexes['index'])
+            print(f"Loaded {len(adt_df)} ADT records, {len(hosp_df)} hospitalizations")
+        return adt_indexes['index']
+    return (adt_index,)
+
+
+@app.cell
+def _(Path, adt_index, max_date_obj, min_date_obj, pd, run_log, site_name):
+    import functools
+    from overall_summary import summarize_units
+    from unit_metrics import UnitCube, day_slice, output_path, percent, read_unit_days
+
+    output_dir = Path(__file__).parent.parent / "output" / "intermediate"
+
+    # Days read for a reporting period: through the end of its last month, and at least a year back from there
+    HISTORY_LOOKBACK_DAYS = 365
+
+    def history_span(start_date, end_date):
+        """The span of days read for the period `[start_date, end_date]`, within the picker's days."""
+        history_end = min(end_date + pd.offsets.MonthEnd(0), pd.Timestamp(max_date_obj))
+        lookback_start = max(history_end - pd.Timedelta(days=HISTORY_LOOKBACK_DAYS - 1), pd.Timestamp(min_date_obj))
+        return min(start_date, lookback_start), history_end
+
+    # Additive daily columns of each backend table; reporting-period totals come from their prefix sums
+    cube_columns = {
+        "overall_summary": [
+            'total_admissions', 'census_7AM', 'total_discharges', 'floor_transfers',
+            'deaths_in_icu', 'discharges_to_hospice', 'discharges_to_facility',
+        ],
+        "bed_strain": ['occupied_beds', 'bed_capacity'],
+        "lpv_metrics": ['TV_less_8_cc_kg_IBW', 'total_controlled_IMV_hours'],
+        "sat_metrics": [
+            'total_IMV_patients_7AM', 'sat_complete_cessation_N_7AM_7PM',
+            'sat_sedation_cessation_N_7AM_7PM', 'sat_dose_reduction_N_7AM_7PM',
+        ],
+        "sbt_metrics": ['total_IMV_patients_7AM', 'sbt_pressure_support_7AM_7PM_N', 'sbt_successful_extubation_7PM_N'],
+    }
+
+    @functools.lru_cache(maxsize=16)
+    def unit_history(location_name, history_start, history_end):
+        """
+        Every day of one unit over `[history_start, history_end]`, read once per unit and span.
+
+        Returns the prefix-sum cube (columns named `{table}.{column}`), the
+        tables backend.py has built, and the daily SOFA-2 maxima and hourly
+        tidal volumes behind the medians (None when not built).
+        """
+        with run_log.stage("unit_history") as _record:
+            _record['status'] = 'read'
+            daily = {}
+            for table, columns in cube_columns.items():
+                rows = read_unit_days(
+                    output_path(output_dir, site_name, table), location_name, history_start, history_end,
+                    columns=['day', *columns],
+                )
+                if table == "overall_summary" and (
+                    rows is None or len(rows) != (history_end - history_start).days + 1
+                ):
+                    # Otherwise compute every day of the span at once (7 AM to 7 AM clinical days)
+                    rows = summarize_units(
+                        adt_index(history_start, history_end), [location_name], history_start, history_end
+                    )[['day', *columns]]
+                    _record['status'] = 'built'
+                if rows is not None:
+                    daily[table] = rows.rename(columns={c: f"{table}.{c}" for c in columns})
+            cube = UnitCube(
+                pd.concat(daily.values()),
+                [f"{table}.{c}" for table in daily for c in cube_columns[table]],
+                history_start, history_end,
+            )
+            sofa_days = read_unit_days(
+                output_path(output_dir, site_name, "sofa_days"), location_name, history_start, history_end,
+                columns=['day', 'sofa_max'],
+            )
+            lpv_hours = read_unit_days(
+                output_path(output_dir, site_name, "lpv_hours"), location_name, history_start, history_end,
+                columns=['day', 'vt_cc_kg'],
+            )
+            _record['rows_out'] = len(cube.days)
+        return cube, set(daily), sofa_days, lpv_hours
+
+    @functools.lru_cache(maxsize=256)
+    def period_metrics(location_name, start_date, end_date):
+        """Dashboard tile values for one unit and reporting period, from the unit's cube."""
+        cube, tables, sofa_days, lpv_hours = unit_history(
+            location_name, *history_span(start_date, end_date)
+        )
+        totals = cube.totals(start_date, end_date)
+        metrics = {
+            # Column 1 metrics
+            'total_admissions': int(totals['overall_summary.total_admissions']),
+            'daily_census': (
+                round(totals['overall_summary.census_7AM'] / totals['n_days'], 1) if totals['n_days'] else "N/A"
+            ),
+            # Column 2 metrics
+            **{
+                col: int(totals[f"overall_summary.{col}"])
+                for col in ['total_discharges', 'floor_transfers', 'deaths_in_icu',
+                            'discharges_to_hospice', 'discharges_to_facility']
+            },
+        }
+
+        # Column 3 metrics
+        # Bed strain: average hourly occupancy as a percent of the unit's bed capacity, from the hourly series built by backend.py
+        metrics['bed_strain_pct'] = "N/A" if "bed_strain" not in tables else percent(
+            totals['bed_strain.occupied_beds'], totals['bed_strain.bed_capacity']
+        )
+        # SOFA-2: median and IQR of every patient's daily max SOFA-2 in the period
+        metrics['sofa_median'], metrics['sofa_q1'], metrics['sofa_q3'] = "N/A", "N/A", "N/A"
+        period_sofa = None if sofa_days is None else day_slice(sofa_days, start_date, end_date)
+        if period_sofa is not None and len(period_sofa) > 0:
+            metrics['sofa_q1'], metrics['sofa_median'], metrics['sofa_q3'] = (
+                round(q, 1) for q in period_sofa['sofa_max'].quantile([0.25, 0.5, 0.75])
+            )
+
+        # Lung-Protective Ventilation metrics from the hourly LPV tables built by backend.py
+        metrics['lpv_adherence_pct'] = "N/A" if "lpv_metrics" not in tables else percent(
+            totals['lpv_metrics.TV_less_8_cc_kg_IBW'], totals['lpv_metrics.total_controlled_IMV_hours']
         )
+        # Median over every controlled-mode IMV hour in the period
+        metrics['median_vt'] = "N/A"
+        period_vt = None if lpv_hours is None else day_slice(lpv_hours, start_date, end_date)['vt_cc_kg']
+        if period_vt is not None and period_vt.notna().any():
+            metrics['median_vt'] = round(period_vt.median(), 1)
+
+        # Spontaneous Awakening Trials: daily rates over patients on IMV at 7 AM, SAT delivered between 7 AM and 7 PM
+        for outcome in ['complete_cessation', 'sedation_cessation', 'dose_reduction']:
+            metrics[f"sat_{outcome}_pct"] = "N/A" if "sat_metrics" not in tables else percent(
+                totals[f"sat_metrics.sat_{outcome}_N_7AM_7PM"], totals['sat_metrics.total_IMV_patients_7AM']
+            )
+
+        # Spontaneous Breathing Trials: daily rates over patients on a controlled IMV mode at 7 AM
+        for name, column in [('pressure_support', 'sbt_pressure_support_7AM_7PM_N'),
+                             ('successful_extubation', 'sbt_successful_extubation_7PM_N')]:
+            metrics[f"sbt_{name}_pct"] = "N/A" if "sbt_metrics" not in tables else percent(
+                totals[f"sbt_metrics.{column}"], totals['sbt_metrics.total_IMV_patients_7AM']
+            )
+        return metrics
+    return (period_metrics,)
 
-        # Floor transfers: ICU discharges where next ADT location is ward or stepdown
-        # Get the next location for each ICU discharge
-        floor_transfers_count = 0
-        for idx, row in icu_discharges.iterrows():
-            hosp_id = row['hospitalization_id']
-            out_time = row['out_dttm']
-
-            # Find next ADT location after ICU discharge
-            next_location = adt_df[
-                (adt_df['hospitalization_id'] == hosp_id) &
-                (adt_df['in_dttm'] >= out_time) &
-                (adt_df['in_dttm'] <= out_time + pd.Timedelta(hours=24))
-            ].sort_values('in_dttm').head(1)
-
-            if not next_location.empty:
-                next_loc_category = next_location.iloc[0]['location_category'].lower()
-                if next_loc_category in ['ward', 'stepdown']:
-                    floor_transfers_count += 1
-
-        # Deaths in ICU: discharge_category = 'Expired' and discharge occurred this day
-        deaths_in_icu_count = len(icu_discharges_with_hosp[
-            (icu_discharges_with_hosp['discharge_category'] == 'Expired') &
-            (icu_discharges_with_hosp['discharge_dttm'] >= day_start) &
-            (icu_discharges_with_hosp['discharge_dttm'] < day_end)
-        ])
-
-        # Discharges to hospice
-        discharges_to_hospice_count = len(icu_discharges_with_hosp[
-            (icu_discharges_with_hosp['discharge_category'] == 'Hospice') &
-            (icu_discharges_with_hosp['discharge_dttm'] >= day_start) &
-            (icu_discharges_with_hosp['discharge_dttm'] < day_end)
-        ])
-
-        # Discharges to facility: SNF, LTACH, Rehab, Assisted Living
-        facility_categories = [
-            'Skilled Nursing Facility (SNF)',
-            'Long Term Care Hospital (LTACH)',
-            'Acute Inpatient Rehab Facility',
-            'Assisted Living'
-        ]
-        discharges_to_facility_count = len(icu_discharges_with_hosp[
-            (icu_discharges_with_hosp['discharge_category'].isin(facility_categories)) &
-            (icu_discharges_with_hosp['discharge_dttm'] >= day_start) &
-            (icu_discharges_with_hosp['discharge_dttm'] < day_end)
-        ])
-
-        summary_records.append({
-            'location_name': selected_location,
-            'day': day.strftime('%m/%d/%y'),
-            'total_admissions': day_admissions_count,
-            'census_7AM': census_7am_count,
-            'census_7PM': census_7pm_count,
-            'total_discharges': day_discharges_count,
-            'floor_transfers': floor_transfers_count,
-            'deaths_in_icu': deaths_in_icu_count,
-            'discharges_to_hospice': discharges_to_hospice_count,
-            'discharges_to_facility': discharges_to_facility_count,
-            'sofa_median': None,  # To be calculated later
-            'sofa_q1': None,
-            'sofa_q3': None
-        })
-
-    overall_summary_df = pd.DataFrame(summary_records)
-
-    # Compute weekly summary metrics from overall_summary_df
+
+@app.cell
+def _(date_range, pd, period_metrics, unit_dropdown):
+    # Summary metrics of the selected unit and reporting period; repeated and overlapping ranges are O(1)
+    metrics = period_metrics(
+        unit_dropdown.value, pd.Timestamp(date_range.value[0]), pd.Timestamp(date_range.value[1])
+    )
 
     # Column 1 metrics
-    total_admissions = int(overall_summary_df['total_admissions'].sum())
-    daily_census = round(overall_summary_df['census_7AM'].mean(), 1)
+    total_admissions = metrics['total_admissions']
+    daily_census = metrics['daily_census']
 
     # Column 2 metrics
-    total_discharges = int(overall_summary_df['total_discharges'].sum())
-    floor_transfers = int(overall_summary_df['floor_transfers'].sum())
-    deaths_in_icu = int(overall_summary_df['deaths_in_icu'].sum())
-    discharges_to_hospice = int(overall_summary_df['discharges_to_hospice'].sum())
-    discharges_to_facility = int(overall_summary_df['discharges_to_facility'].sum())
-
-    # Column 3 metrics (placeholders - need additional data)
-    bed_strain_pct = "N/A"  # Requires max bed capacity
-    sofa_median = "N/A"  # Not yet implemented
-    sofa_q1 = "N/A"
-    sofa_q3 = "N/A"
-
-    # Lung-Protective Ventilation metrics (placeholders - not yet implemented)
-    lpv_adherence_pct = "N/A"
-    median_vt = "N/A"
-
-    # Spontaneous Awakening Trials metrics (placeholders - not yet implemented)
-    sat_complete_cessation_pct = "N/A"
-    sat_sedation_cessation_pct = "N/A"
-    sat_dose_reduction_pct = "N/A"
-
-    # Spontaneous Breathing Trials metrics (placeholders - not yet implemented)
-    sbt_pressure_support_pct = "N/A"
-    sbt_successful_extubation_pct = "N/A"
+    total_discharges = metrics['total_discharges']
+    floor_transfers = metrics['floor_transfers']
+    deaths_in_icu = metrics['deaths_in_icu']
+    discharges_to_hospice = metrics['discharges_to_hospice']
+    discharges_to_facility = metrics['discharges_to_facility']
+
+    # Column 3 metrics
+    bed_strain_pct = metrics['bed_strain_pct']
+    sofa_median, sofa_q1, sofa_q3 = metrics['sofa_median'], metrics['sofa_q1'], metrics['sofa_q3']
+
+    # Quality metrics
+    lpv_adherence_pct = metrics['lpv_adherence_pct']
+    median_vt = metrics['median_vt']
+    sat_complete_cessation_pct = metrics['sat_complete_cessation_pct']
+    sat_sedation_cessation_pct = metrics['sat_sedation_cessation_pct']
+    sat_dose_reduction_pct = metrics['sat_dose_reduction_pct']
+    sbt_pressure_support_pct = metrics['sbt_pressure_support_pct']
+    sbt_successful_extubation_pct = metrics['sbt_successful_extubation_pct']
     return (
         bed_strain_pct,
         daily_census,
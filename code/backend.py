@@ -21,6 +21,8 @@ def _(mo):
         ## Data Sources
         - **resp_p**: Waterfall-processed respiratory support (`output/intermediate/{site}_resp_processed_bf.parquet`)
         - **CLIF tables**: Raw tables from the data directory specified in `config/config.json`
+
+        All stages run in a persistent DuckDB database (`output/intermediate/{site}_pipeline.duckdb` by default, or `duckdb_path` in the config). The CLIF files are views, each stage is a table, and a restart reuses every stage whose SQL and inputs are unchanged.
         """
     )
     return
@@ -42,6 +44,9 @@ def _():
 
 @app.cell
 def _(json, os):
+    from pipeline_db import connect
+    from profiling import RunLog
+
     # Load configuration
     CONFIG_PATH = "config/config.json"
 
@@ -52,144 +57,294 @@ def _(json, os):
     DATA_DIR = config["data_directory"]
     FILETYPE = config["filetype"]
     TIMEZONE = config["timezone"]
+    # Optional reporting period; hospitalizations overlapping it are loaded in full
+    START_DATE = config.get("start_date")
+    END_DATE = config.get("end_date")
+
+    # Out-of-core mode: DuckDB memory limit with spilling, and SAT/SBT run one admission month at a time
+    MEMORY_LIMIT = config.get("memory_limit")
+    TEMP_DIRECTORY = config.get("temp_directory") or (
+        f"output/intermediate/{SITE_NAME}_duckdb_tmp" if MEMORY_LIMIT else None
+    )
+    CHUNK_BY_ADMISSION_MONTH = config.get("chunk_by_admission_month", False)
+
+    # Hash buckets of hospitalizations for the SAT/SBT scripts; 1 runs each script in one query
+    PARALLEL_BUCKETS = config.get("parallel_buckets", 1)
+    # Admission-month chunks run one at a time unless workers are set explicitly
+    PARALLEL_WORKERS = config.get("parallel_workers") or (1 if CHUNK_BY_ADMISSION_MONTH else os.cpu_count())
+
+    # Persistent pipeline database; dates and 7 AM anchors in SQL are evaluated in the site's local time
+    DB_PATH = config.get("duckdb_path", f"output/intermediate/{SITE_NAME}_pipeline.duckdb")
+    con = connect(DB_PATH, TIMEZONE, MEMORY_LIMIT, TEMP_DIRECTORY)
+
+    # Run log of every stage (time, rows, memory and DuckDB query profiles) under output/intermediate
+    run_log = RunLog(
+        f"output/intermediate/{SITE_NAME}_run_logs", "backend", profile_queries=config.get("profile_queries", True)
+    )
 
     print(f"Site: {SITE_NAME}")
     print(f"Data directory: {DATA_DIR}")
-    return CONFIG_PATH, DATA_DIR, FILETYPE, SITE_NAME, TIMEZONE, config
+    print(f"Pipeline database: {DB_PATH}")
+    if MEMORY_LIMIT:
+        print(f"Memory limit: {MEMORY_LIMIT} (spilling to {TEMP_DIRECTORY})")
+    print(f"Run log: {run_log.run_dir}")
+    return (
+        CHUNK_BY_ADMISSION_MONTH,
+        CONFIG_PATH,
+        DATA_DIR,
+        DB_PATH,
+        END_DATE,
+        FILETYPE,
+        MEMORY_LIMIT,
+        PARALLEL_BUCKETS,
+        PARALLEL_WORKERS,
+        SITE_NAME,
+        START_DATE,
+        TEMP_DIRECTORY,
+        TIMEZONE,
+        con,
+        config,
+        run_log,
+    )
 
 
 @app.cell
-def _(Path):
-    def run_query_from_file(sql_file_path: str, con=None) -> "duckdb.DuckDBPyRelation":
-        """
-        Loads a query from a .sql file and executes it using DuckDB.
+def _(
+    CHUNK_BY_ADMISSION_MONTH,
+    MEMORY_LIMIT,
+    PARALLEL_BUCKETS,
+    PARALLEL_WORKERS,
+    SITE_NAME,
+    TEMP_DIRECTORY,
+    TIMEZONE,
+):
+    from partitioned import partitioned_build
+    # SQL scripts are read from disk once per version of the file
+    from pipeline_db import read_sql
+
+    def script_build(tables: dict):
+        """Run a script over hash buckets or admission-month chunks in a process pool, or in one query (None)."""
+        return partitioned_build(
+            tables, PARALLEL_BUCKETS, PARALLEL_WORKERS, f"output/intermediate/{SITE_NAME}_partitions", TIMEZONE,
+            chunk_by_admission_month=CHUNK_BY_ADMISSION_MONTH,
+            memory_limit=MEMORY_LIMIT,
+            temp_directory=TEMP_DIRECTORY,
+        )
+    return partitioned_build, read_sql, script_build
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(
+        r"""
+        ## Incremental Refresh
+
+        With `"incremental_refresh": true` in `config/config.json`, only the clinical days touched by rows newer than the last run's watermark are recomputed, for every hospitalization in an ICU on those days, and merged into the saved outputs. Summaries below then describe the refreshed hospitalizations only. Delete `output/intermediate/{site}_watermark.json` to force a full rebuild.
         """
-        import duckdb
-        print(f"--- Loading and executing query from {sql_file_path} ---")
-        query = Path(sql_file_path).read_text()
-        if con is None:
-            result = duckdb.sql(query)
+    )
+    return
+
+
+@app.cell
+def _(DATA_DIR, SITE_NAME, con, config, mo, run_log):
+    from refresh import current_watermark, extract_end, read_watermark, refresh_scope, watermark_sources
+
+    INCREMENTAL = config.get("incremental_refresh", False)
+    resp_p_path = f"output/intermediate/{SITE_NAME}_resp_processed_bf.parquet"
+    watermark_path = f"output/intermediate/{SITE_NAME}_watermark.json"
+    refresh_sources = watermark_sources(DATA_DIR, resp_p_path)
+
+    # Watermark to store after this run, and the one left by the previous run
+    with run_log.stage("refresh_scope") as _record:
+        new_watermark = current_watermark(refresh_sources, con)
+        # Patients still in a unit (no out_dttm) count as present until the end of the extract
+        EXTRACT_END = extract_end(new_watermark)
+        last_watermark = read_watermark(watermark_path) if INCREMENTAL else None
+        if last_watermark is None:
+            refresh_days, refresh_hosp_ids = None, None
         else:
-            result = con.sql(query)
-        print("Query executed successfully.")
-        return result
-    return (run_query_from_file,)
+            refresh_days, refresh_hosp_ids = refresh_scope(refresh_sources, last_watermark, con, EXTRACT_END)
+            _record['rows_out'] = len(refresh_hosp_ids)
+
+    if last_watermark is None:
+        print("Full run: recomputing all history")
+    else:
+        print(f"Incremental refresh: {len(refresh_days):,} days, {len(refresh_hosp_ids):,} hospitalizations")
+    mo.stop(
+        refresh_hosp_ids is not None and len(refresh_hosp_ids) == 0,
+        mo.md("No new rows since the last run; outputs are up to date."),
+    )
+    return (
+        EXTRACT_END,
+        INCREMENTAL,
+        new_watermark,
+        refresh_days,
+        refresh_hosp_ids,
+        refresh_sources,
+        resp_p_path,
+        watermark_path,
+    )
 
 
 @app.cell(hide_code=True)
 def _(mo):
-    mo.md(r"""## Load Base Tables""")
+    mo.md(
+        r"""
+        ## Load Base Tables
+
+        The CLIF files are exposed as views, and each base table is materialized by DuckDB (`loaders.py`) with only the columns the SQL scripts use. Category filters and the cohort (the optional `start_date`/`end_date` reporting period and the incremental refresh scope) are applied in the scan.
+        """
+    )
     return
 
 
 @app.cell
-def _(DATA_DIR, SITE_NAME, pd):
+def _(DATA_DIR, END_DATE, START_DATE, con, refresh_hosp_ids, refresh_sources, resp_p_path):
+    from loaders import register_cohort
+    from pipeline_db import create_views, file_fingerprint
+
+    clif_sources = {
+        f"clif_{table}": f"{DATA_DIR}/clif_{table}.parquet"
+        for table in [
+            "hospitalization", "adt", "code_status", "vitals", "labs",
+            "patient_assessments", "medication_admin_continuous", "patient",
+        ]
+    }
+    create_views(con, {**clif_sources, "resp_processed_bf": resp_p_path})
+
+    # Hospitalizations to load, with the integer keys every base table uses in place of hospitalization_id
+    cohort = register_cohort("clif_hospitalization", START_DATE, END_DATE, refresh_hosp_ids, con=con)
+
+    # Base tables are rebuilt when a source file, the reporting period or the refresh cohort changes
+    source_key = [
+        file_fingerprint([*clif_sources.values(), resp_p_path]),
+        START_DATE,
+        END_DATE,
+        None if refresh_hosp_ids is None else sorted(refresh_hosp_ids),
+    ]
+    return clif_sources, cohort, source_key
+
+
+@app.cell
+def _(cohort, con, run_log, source_key):
+    from loaders import RESP_COLUMNS, scan_sql
+
+    # Every stage is materialized through the run log
+    materialize = run_log.materialize
+
     # Load resp_p (waterfall-processed respiratory support)
-    resp_p_path = f"output/intermediate/{SITE_NAME}_resp_processed_bf.parquet"
-    resp_p = pd.read_parquet(resp_p_path)
-    resp_p['tracheostomy'] = resp_p['tracheostomy'].fillna(0).astype(int)
-    print(f"Loaded resp_p: {len(resp_p):,} rows")
-    resp_p.head()
-    return resp_p, resp_p_path
+    resp_p = materialize(con, "resp_p", scan_sql("resp_processed_bf", RESP_COLUMNS, cohort=cohort), source_key)
+    print(f"Loaded resp_p: {resp_p.shape[0]:,} rows")
+    resp_p.limit(5).df()
+    return materialize, resp_p, scan_sql
 
 
 @app.cell
-def _(DATA_DIR, pd):
+def _(cohort, con, materialize, scan_sql, source_key):
+    from loaders import HOSP_COLUMNS
+
     # Load hospitalization table
-    hosp_path = f"{DATA_DIR}/clif_hospitalization.parquet"
-    hosp_df = pd.read_parquet(hosp_path)
-    print(f"Loaded hosp_df: {len(hosp_df):,} rows")
-    hosp_df.head()
-    return hosp_df, hosp_path
+    hosp_df = materialize(con, "hosp_df", scan_sql("clif_hospitalization", HOSP_COLUMNS, cohort=cohort), source_key)
+    print(f"Loaded hosp_df: {hosp_df.shape[0]:,} rows")
+    hosp_df.limit(5).df()
+    return (hosp_df,)
 
 
 @app.cell
-def _(DATA_DIR, pd):
+def _(cohort, con, materialize, scan_sql, source_key):
+    from loaders import ADT_COLUMNS
+
     # Load ADT table
-    adt_path = f"{DATA_DIR}/clif_adt.parquet"
-    adt_df = pd.read_parquet(adt_path)
-    print(f"Loaded adt_df: {len(adt_df):,} rows")
-    adt_df.head()
-    return adt_df, adt_path
+    adt_df = materialize(con, "adt_df", scan_sql("clif_adt", ADT_COLUMNS, cohort=cohort), source_key)
+    print(f"Loaded adt_df: {adt_df.shape[0]:,} rows")
+    adt_df.limit(5).df()
+    return (adt_df,)
 
 
 @app.cell
-def _(DATA_DIR, pd):
+def _(cohort, con, materialize, scan_sql, source_key):
+    from loaders import CODE_STATUS_COLUMNS
+
     # Load code status table
-    cs_path = f"{DATA_DIR}/clif_code_status.parquet"
-    cs_df = pd.read_parquet(cs_path)
-    print(f"Loaded cs_df: {len(cs_df):,} rows")
-    cs_df.head()
-    return cs_df, cs_path
+    cs_df = materialize(con, "cs_df", scan_sql("clif_code_status", CODE_STATUS_COLUMNS, cohort=cohort), source_key)
+    print(f"Loaded cs_df: {cs_df.shape[0]:,} rows")
+    cs_df.limit(5).df()
+    return (cs_df,)
 
 
 @app.cell
-def _(DATA_DIR, duckdb, pd):
-    # Load vitals - get last vitals for each hospitalization (needed for SBT)
-    vitals_path = f"{DATA_DIR}/clif_vitals.parquet"
-    q = f"""
-    FROM '{vitals_path}'
-    SELECT hospitalization_id
-        , MAX(recorded_dttm) AS recorded_dttm
-    GROUP BY hospitalization_id
-    """
-    last_vitals_df = duckdb.sql(q).df()
-    print(f"Loaded last_vitals_df: {len(last_vitals_df):,} rows")
-    last_vitals_df.head()
-    return last_vitals_df, q, vitals_path
+def _(clif_sources, cohort, con, materialize, scan_sql, source_key):
+    from loaders import vitals_summary_sql
+    from pipeline_db import file_fingerprint as _file_fingerprint
+
+    # Summarize vitals in one scan: last vitals timestamp (needed for SBT) and latest height/weight (needed for IBW).
+    # The summary of every hospitalization is kept until the vitals file changes.
+    vitals_summary_all = materialize(
+        con, "vitals_summary_all", vitals_summary_sql("clif_vitals"),
+        [_file_fingerprint([clif_sources["clif_vitals"]])],
+    )
+    vitals_summary = materialize(
+        con, "vitals_summary", scan_sql("vitals_summary_all", ["*"], cohort=cohort),
+        [vitals_summary_all, source_key],
+    )
+    last_vitals_df = materialize(
+        con, "last_vitals_df", "FROM vitals_summary SELECT hospitalization_id, recorded_dttm", [vitals_summary]
+    )
+    print(f"Loaded vitals_summary: {vitals_summary.shape[0]:,} rows")
+    vitals_summary.limit(5).df()
+    return last_vitals_df, vitals_summary, vitals_summary_all
 
 
 @app.cell
-def _(DATA_DIR, duckdb, pd):
+def _(cohort, con, materialize, source_key):
+    from loaders import rass_sql
+
     # Load patient assessments - filter to RASS only
-    assessments_path = f"{DATA_DIR}/clif_patient_assessments.parquet"
-    q_rass = f"""
-    FROM '{assessments_path}'
-    WHERE LOWER(assessment_category) = 'rass'
-    SELECT hospitalization_id, recorded_dttm
-        , rass: assessment_value::FLOAT
-    """
-    rass_df = duckdb.sql(q_rass).df()
-    print(f"Loaded rass_df: {len(rass_df):,} rows")
-    rass_df.head()
-    return assessments_path, q_rass, rass_df
+    rass_df = materialize(con, "rass_df", rass_sql("clif_patient_assessments", cohort=cohort), source_key)
+    print(f"Loaded rass_df: {rass_df.shape[0]:,} rows")
+    rass_df.limit(5).df()
+    return (rass_df,)
+
+
+@app.cell
+def _(cohort, con, materialize, source_key):
+    from loaders import SOFA_LABS, SOFA_VITALS, VASOACTIVE_MEDS, gcs_sql, labs_sql, vasoactive_sql, vitals_sql
+
+    # Load the SOFA-2 inputs: labs, MAP and SpO2, GCS, and vasoactive drips in long format with their units
+    sofa_labs = materialize(con, "sofa_labs", labs_sql("clif_labs", SOFA_LABS, cohort=cohort), source_key)
+    sofa_vitals = materialize(con, "sofa_vitals", vitals_sql("clif_vitals", SOFA_VITALS, cohort=cohort), source_key)
+    gcs_df = materialize(con, "gcs_df", gcs_sql("clif_patient_assessments", cohort=cohort), source_key)
+    vasoactive_df = materialize(
+        con, "vasoactive_df", vasoactive_sql("clif_medication_admin_continuous", VASOACTIVE_MEDS, cohort=cohort),
+        source_key,
+    )
+    print(f"Loaded sofa_labs: {sofa_labs.shape[0]:,} rows, sofa_vitals: {sofa_vitals.shape[0]:,} rows")
+    print(f"Loaded gcs_df: {gcs_df.shape[0]:,} rows, vasoactive_df: {vasoactive_df.shape[0]:,} rows")
+    sofa_labs.limit(5).df()
+    return gcs_df, sofa_labs, sofa_vitals, vasoactive_df
 
 
 @app.cell(hide_code=True)
 def _(mo):
-    mo.md(r"""## Load and Pivot Medications (Wide Format)""")
+    mo.md(r"""## Load Medication Dose Changes""")
     return
 
 
 @app.cell
-def _(DATA_DIR, duckdb, pd):
-    # Load continuous medications and pivot to wide format
-    meds_path = f"{DATA_DIR}/clif_medication_admin_continuous.parquet"
+def _(cohort, con, config, materialize, source_key):
+    from loaders import SAT_MED_GROUPS, meds_changes_sql
 
-    # Define the medications we need for SAT
-    sedation_meds = ['fentanyl', 'propofol', 'lorazepam', 'midazolam', 'hydromorphone', 'morphine']
-    paralytic_meds = ['cisatracurium', 'vecuronium', 'rocuronium']
-    all_meds = sedation_meds + paralytic_meds
+    # Medications of the SAT definitions by group (opioid, sedative, paralytic); a site can add drugs in the config
+    med_groups = config.get("sat_medications") or SAT_MED_GROUPS
 
-    q_meds = f"""
-    WITH filtered AS (
-        FROM '{meds_path}'
-        WHERE LOWER(med_category) IN ({', '.join([f"'{m}'" for m in all_meds])})
-        SELECT hospitalization_id
-            , admin_dttm AS recorded_dttm
-            , LOWER(med_category) AS med_category
-            , med_dose
+    # Load continuous medications as per-drug dose change points (long format)
+    # Each drug's dose holds until its next change point; the SQL carries it forward per drug
+    meds_df = materialize(
+        con, "meds_df", meds_changes_sql("clif_medication_admin_continuous", med_groups, cohort=cohort), source_key
     )
-    PIVOT filtered
-    ON med_category
-    USING MAX(med_dose)
-    ORDER BY hospitalization_id, recorded_dttm
-    """
-    meds_df = duckdb.sql(q_meds).df()
-    print(f"Loaded meds_df (pivoted wide): {len(meds_df):,} rows")
-    print(f"Columns: {list(meds_df.columns)}")
-    meds_df.head()
-    return all_meds, meds_df, meds_path, paralytic_meds, q_meds, sedation_meds
+    print(f"Loaded meds_df (dose change points): {meds_df.shape[0]:,} rows")
+    meds_df.limit(5).df()
+    return med_groups, meds_df
 
 
 @app.cell(hide_code=True)
@@ -209,41 +364,36 @@ def _(mo):
 
 
 @app.cell
-def _(cs_df, duckdb, hosp_df, last_vitals_df, resp_p, run_query_from_file):
-    # Register tables for SBT query
-    duckdb.register("resp_p", resp_p)
-    duckdb.register("cs_df", cs_df)
-    duckdb.register("hosp_df", hosp_df)
-    duckdb.register("last_vitals_df", last_vitals_df)
-
-    # Run SBT SQL
-    sbt_result = run_query_from_file("code/sbt.sql")
-    sbt_events = sbt_result.df()
-    print(f"SBT events: {len(sbt_events):,} rows")
-    sbt_events.head()
-    return sbt_events, sbt_result
+def _(con, cs_df, hosp_df, last_vitals_df, materialize, read_sql, resp_p, script_build):
+    # Run SBT SQL on the resp_p, cs_df, hosp_df and last_vitals_df tables
+    sbt_events = materialize(
+        con, "sbt_events", read_sql("code/sbt.sql"), [resp_p, cs_df, hosp_df, last_vitals_df],
+        build=script_build({"resp_p": "resp_p", "cs_df": "cs_df", "hosp_df": "hosp_df", "last_vitals_df": "last_vitals_df"}),
+    )
+    print(f"SBT events: {sbt_events.shape[0]:,} rows")
+    sbt_events.limit(5).df()
+    return (sbt_events,)
 
 
 @app.cell
-def _(duckdb, sbt_events):
+def _(con, materialize, sbt_events):
     # Aggregate SBT to day level
     q_sbt_daily = """
     FROM sbt_events
     SELECT hospitalization_id
         , event_dttm::DATE AS event_date
-        , CONCAT(hospitalization_id, '_', event_dttm::DATE) AS hosp_id_day_key
         , MAX(sbt_done) AS sbt_done
         , MAX(_extub_1st) AS extub_1st
         , MAX(_success_extub) AS success_extub
         , MAX(_trach_1st) AS trach_1st
         , MAX(_fail_extub) AS fail_extub
         , MIN(CASE WHEN sbt_done = 1 THEN event_dttm END) AS sbt_first_dttm
-    GROUP BY hospitalization_id, event_date, hosp_id_day_key
+    GROUP BY hospitalization_id, event_date
     ORDER BY hospitalization_id, event_date
     """
-    sbt_days = duckdb.sql(q_sbt_daily).df()
-    print(f"SBT days: {len(sbt_days):,} rows")
-    sbt_days.head()
+    sbt_days = materialize(con, "sbt_days", q_sbt_daily, [sbt_events])
+    print(f"SBT days: {sbt_days.shape[0]:,} rows")
+    sbt_days.limit(5).df()
     return q_sbt_daily, sbt_days
 
 
@@ -255,7 +405,7 @@ def _(mo):
 
         The SAT script requires:
         - `resp_df`: Respiratory support (using resp_p)
-        - `meds_df`: Pivoted wide medications table
+        - `meds_df`: Per-drug medication dose change points
         - `rass_df`: RASS assessments
         - `adt_df`: ADT with location_category
         """
@@ -264,19 +414,66 @@ def _(mo):
 
 
 @app.cell
-def _(adt_df, duckdb, meds_df, rass_df, resp_p, run_query_from_file):
-    # Register tables for SAT query
-    duckdb.register("resp_df", resp_p)
-    duckdb.register("meds_df", meds_df)
-    duckdb.register("rass_df", rass_df)
-    duckdb.register("adt_df", adt_df)
+def _(adt_df, con, materialize, meds_df, rass_df, read_sql, resp_p, script_build):
+    # The SAT script reads respiratory support as resp_df
+    con.execute("CREATE OR REPLACE VIEW resp_df AS FROM resp_p")
 
     # Run SAT SQL
-    sat_result = run_query_from_file("code/sat.sql")
-    sat_days = sat_result.df()
-    print(f"SAT days (eligible): {len(sat_days):,} rows")
-    sat_days.head()
-    return sat_days, sat_result
+    sat_days = materialize(
+        con, "sat_days", read_sql("code/sat.sql"), [resp_p, meds_df, rass_df, adt_df],
+        build=script_build({"resp_df": "resp_p", "meds_df": "meds_df", "rass_df": "rass_df", "adt_df": "adt_df"}),
+    )
+    print(f"SAT days (eligible): {sat_days.shape[0]:,} rows")
+    sat_days.limit(5).df()
+    return (sat_days,)
+
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(
+        r"""
+        ## Run SOFA-2 SQL Script
+
+        The SOFA-2 script scores every ICU patient-hour and keeps the daily maximum per hospitalization. It requires:
+        - `adt_df` and `hosp_df`: ICU stays, the hourly grid every source is joined onto
+        - `resp_p`: Respiratory support and FiO2
+        - `sofa_labs`: Creatinine, bilirubin, platelets and arterial PO2
+        - `sofa_vitals`: MAP and SpO2
+        - `gcs_df`: GCS totals
+        - `vasoactive_df`: Vasopressor and inotrope doses, with `vitals_summary` weights
+        """
+    )
+    return
+
+
+@app.cell
+def _(
+    adt_df,
+    con,
+    gcs_df,
+    hosp_df,
+    materialize,
+    read_sql,
+    resp_p,
+    script_build,
+    sofa_labs,
+    sofa_vitals,
+    vasoactive_df,
+    vitals_summary,
+):
+    # Run SOFA-2 SQL: daily max SOFA-2 per hospitalization, ICU unit and clinical day
+    sofa_days = materialize(
+        con, "sofa_days", read_sql("code/sofa.sql"),
+        [adt_df, hosp_df, resp_p, sofa_labs, sofa_vitals, gcs_df, vasoactive_df, vitals_summary],
+        build=script_build({
+            "adt_df": "adt_df", "hosp_df": "hosp_df", "resp_p": "resp_p", "sofa_labs": "sofa_labs",
+            "sofa_vitals": "sofa_vitals", "gcs_df": "gcs_df", "vasoactive_df": "vasoactive_df",
+            "vitals_summary": "vitals_summary",
+        }),
+    )
+    print(f"SOFA-2 days: {sofa_days.shape[0]:,} rows")
+    sofa_days.limit(5).df()
+    return (sofa_days,)
 
 
 @app.cell(hide_code=True)
@@ -286,11 +483,11 @@ def _(mo):
 
 
 @app.cell
-def _(duckdb, sat_days, sbt_days):
+def _(con, materialize, sat_days, sbt_days):
     # Join SAT and SBT day-level results
     q_merged = """
     FROM sbt_days sbt
-    LEFT JOIN sat_days sat USING (hosp_id_day_key)
+    LEFT JOIN sat_days sat USING (hospitalization_id, event_date)
     SELECT sbt.*
         , sat.sat_eligible
         , sat.SAT_EHR_delivery
@@ -301,24 +498,25 @@ def _(duckdb, sat_days, sbt_days):
         , sat.SAT_rass_first_neg_30_last45_nonneg
     ORDER BY sbt.hospitalization_id, sbt.event_date
     """
-    merged_days = duckdb.sql(q_merged).df()
-    print(f"Merged day-level data: {len(merged_days):,} rows")
-    merged_days.head()
+    merged_days = materialize(con, "merged_days", q_merged, [sbt_days, sat_days])
+    print(f"Merged day-level data: {merged_days.shape[0]:,} rows")
+    merged_days.limit(5).df()
     return merged_days, q_merged
 
 
 @app.cell
 def _(merged_days, mo):
     # Summary statistics
+    merged_days_df = merged_days.df()
     stats = {
-        "Total patient-days": len(merged_days),
-        "Unique hospitalizations": merged_days["hospitalization_id"].nunique(),
-        "Days with SBT done": merged_days["sbt_done"].sum(),
-        "SBT rate (%)": round(merged_days["sbt_done"].mean() * 100, 1),
-        "Days SAT eligible": merged_days["sat_eligible"].sum() if "sat_eligible" in merged_days.columns else "N/A",
-        "SAT_EHR_delivery": merged_days["SAT_EHR_delivery"].sum() if "SAT_EHR_delivery" in merged_days.columns else "N/A",
-        "SAT_modified_delivery": merged_days["SAT_modified_delivery"].sum() if "SAT_modified_delivery" in merged_days.columns else "N/A",
-        "Successful extubations": merged_days["success_extub"].sum(),
+        "Total patient-days": len(merged_days_df),
+        "Unique hospitalizations": merged_days_df["hospitalization_id"].nunique(),
+        "Days with SBT done": merged_days_df["sbt_done"].sum(),
+        "SBT rate (%)": round(merged_days_df["sbt_done"].mean() * 100, 1),
+        "Days SAT eligible": merged_days_df["sat_eligible"].sum() if "sat_eligible" in merged_days_df.columns else "N/A",
+        "SAT_EHR_delivery": merged_days_df["SAT_EHR_delivery"].sum() if "SAT_EHR_delivery" in merged_days_df.columns else "N/A",
+        "SAT_modified_delivery": merged_days_df["SAT_modified_delivery"].sum() if "SAT_modified_delivery" in merged_days_df.columns else "N/A",
+        "Successful extubations": merged_days_df["success_extub"].sum(),
     }
 
     mo.md(f"""
@@ -328,20 +526,27 @@ def _(merged_days, mo):
     |--------|-------|
     {"".join([f"| {k} | {v} |" + chr(10) for k, v in stats.items()])}
     """)
-    return (stats,)
+    return merged_days_df, stats
 
 
 @app.cell
-def _(SITE_NAME, merged_days, os, sbt_events, sat_days):
-    # Save outputs
+def _(SITE_NAME, con, merged_days, os, refresh_hosp_ids, run_log, sat_days, sbt_events):
+    from loaders import with_hosp_ids
+    from refresh import merge_hospitalizations
+
+    # Save outputs (an incremental refresh replaces only the refreshed hospitalizations)
     os.makedirs("output/intermediate", exist_ok=True)
 
-    sbt_events.to_parquet(f"output/intermediate/{SITE_NAME}_sbt_events.parquet", index=False)
-    sat_days.to_parquet(f"output/intermediate/{SITE_NAME}_sat_days.parquet", index=False)
-    merged_days.to_parquet(f"output/intermediate/{SITE_NAME}_sat_sbt_merged_days.parquet", index=False)
+    for _name, _df in [("sbt_events", sbt_events), ("sat_days", sat_days), ("sat_sbt_merged_days", merged_days)]:
+        _path = f"output/intermediate/{SITE_NAME}_{_name}.parquet"
+        with run_log.stage(f"save_{_name}", rows_in=_df.shape[0]) as _record:
+            _export = with_hosp_ids(con, _df.alias, day_key=_name != "sbt_events")
+            _saved = merge_hospitalizations(_path, _export, refresh_hosp_ids)
+            _saved.to_parquet(_path, index=False)
+            _record['rows_out'] = len(_saved)
 
     print(f"Saved outputs to output/intermediate/")
-    return
+    return (with_hosp_ids,)
 
 
 @app.cell(hide_code=True)
@@ -351,7 +556,7 @@ def _(mo):
 
 
 @app.cell
-def _(duckdb, merged_days):
+def _(con, materialize, merged_days):
     # Check SAT flag distributions
     q_sat_flags = """
     SELECT
@@ -365,13 +570,13 @@ def _(duckdb, merged_days):
         SUM(CASE WHEN SAT_rass_first_neg_30_last45_nonneg = 1 THEN 1 ELSE 0 END) AS sat_rass_transition
     FROM merged_days
     """
-    sat_summary = duckdb.sql(q_sat_flags).df()
+    sat_summary = materialize(con, "sat_summary", q_sat_flags, [merged_days]).df()
     sat_summary.T
     return q_sat_flags, sat_summary
 
 
 @app.cell
-def _(duckdb, merged_days):
+def _(con, materialize, merged_days):
     # Check SBT and extubation outcomes
     q_sbt_outcomes = """
     SELECT
@@ -383,7 +588,7 @@ def _(duckdb, merged_days):
         SUM(trach_1st) AS tracheostomies
     FROM merged_days
     """
-    sbt_summary = duckdb.sql(q_sbt_outcomes).df()
+    sbt_summary = materialize(con, "sbt_summary", q_sbt_outcomes, [merged_days]).df()
     sbt_summary.T
     return q_sbt_outcomes, sbt_summary
 
@@ -409,188 +614,104 @@ def _(mo):
 
 
 @app.cell
-def _(DATA_DIR, duckdb):
+def _(con, materialize, source_key):
     # Load patient table for sex_category
-    patient_path = f"{DATA_DIR}/clif_patient.parquet"
-    q_patient = f"""
-    FROM '{patient_path}'
+    q_patient = """
+    FROM clif_patient
     SELECT patient_id, sex_category
     """
-    patient_df = duckdb.sql(q_patient).df()
-    print(f"Loaded patient_df: {len(patient_df):,} rows")
-    patient_df.head()
-    return patient_df, patient_path, q_patient
-
-
-@app.cell
-def _(DATA_DIR, duckdb):
-    # Load height from vitals table (vital_category = 'height_cm')
-    # Get the most recent height for each hospitalization
-    vitals_path_height = f"{DATA_DIR}/clif_vitals.parquet"
-    q_height = f"""
-    WITH height_vitals AS (
-        FROM '{vitals_path_height}'
-        WHERE LOWER(vital_category) = 'height_cm'
-            AND vital_value IS NOT NULL
-        SELECT hospitalization_id, recorded_dttm, vital_value AS height_cm
-    )
-    SELECT hospitalization_id
-        , height_cm
-    FROM height_vitals
-    QUALIFY ROW_NUMBER() OVER (PARTITION BY hospitalization_id ORDER BY recorded_dttm DESC) = 1
-    """
-    height_df = duckdb.sql(q_height).df()
-    print(f"Loaded height_df: {len(height_df):,} rows")
-    height_df.head()
-    return height_df, q_height, vitals_path_height
+    patient_df = materialize(con, "patient_df", q_patient, source_key)
+    print(f"Loaded patient_df: {patient_df.shape[0]:,} rows")
+    patient_df.limit(5).df()
+    return patient_df, q_patient
+
+
+@app.cell
+def _(con, materialize, vitals_summary):
+    from stage_sql import HEIGHT_SQL
+
+    # Most recent height for each hospitalization, from the vitals summary
+    q_height = HEIGHT_SQL
+    height_df = materialize(con, "height_df", q_height, [vitals_summary])
+    print(f"Loaded height_df: {height_df.shape[0]:,} rows")
+    height_df.limit(5).df()
+    return height_df, q_height
 
 
 @app.cell
-def _(duckdb, height_df, hosp_df, patient_df, resp_p):
+def _(con, height_df, hosp_df, materialize, patient_df):
+    from stage_sql import IBW_SQL
+
     # Join patient sex with hospitalization to get sex per hospitalization_id
     # Then join with height to compute IBW
-    duckdb.register("patient_df", patient_df)
-    duckdb.register("height_df", height_df)
-
-    q_ibw = """
-    WITH hosp_patient AS (
-        -- Join hospitalization with patient to get sex_category per hospitalization
-        FROM hosp_df h
-        LEFT JOIN patient_df p USING (patient_id)
-        SELECT h.hospitalization_id, p.sex_category
-    )
-    , hosp_with_height AS (
-        -- Join with height
-        FROM hosp_patient hp
-        LEFT JOIN height_df ht USING (hospitalization_id)
-        SELECT hp.hospitalization_id
-            , hp.sex_category
-            , ht.height_cm
-    )
-    SELECT hospitalization_id
-        , sex_category
-        , height_cm
-        -- Calculate IBW based on sex
-        -- Female: IBW = 45.5 + 0.9 × (height_cm - 152)
-        -- Male: IBW = 50 + 0.9 × (height_cm - 152)
-        , CASE
-            WHEN LOWER(sex_category) = 'female' THEN 45.5 + 0.9 * (height_cm - 152)
-            WHEN LOWER(sex_category) = 'male' THEN 50.0 + 0.9 * (height_cm - 152)
-            ELSE NULL
-          END AS ibw_kg
-    FROM hosp_with_height
-    WHERE height_cm IS NOT NULL
-    """
-    ibw_df = duckdb.sql(q_ibw).df()
-    print(f"Computed IBW for {len(ibw_df):,} hospitalizations")
-    print(f"IBW stats:\n{ibw_df['ibw_kg'].describe()}")
-    ibw_df.head()
+    q_ibw = IBW_SQL
+    ibw_df = materialize(con, "ibw_df", q_ibw, [hosp_df, patient_df, height_df])
+    print(f"Computed IBW for {ibw_df.shape[0]:,} hospitalizations")
+    print(f"IBW stats:\n{ibw_df.df()['ibw_kg'].describe()}")
+    ibw_df.limit(5).df()
     return ibw_df, q_ibw
 
 
 @app.cell
-def _(duckdb, ibw_df, resp_p):
+def _(adt_df, con, ibw_df, materialize, resp_p):
+    from stage_sql import CONTROLLED_MODES, LTV_ROLLUPS_SQL
+
     # Calculate low tidal volume proportion
     # Denominator: IMV hours on controlled mode
     # Numerator: IMV hours on controlled mode with tidal_volume_set/IBW < 8 cc/kg
 
-    # Controlled modes (case-insensitive matching)
-    controlled_modes = [
-        'assist control-volume control',
-        'pressure control',
-        'pressure-regulated volume control'
-    ]
+    # Overall, by-mode, by-unit and by-day rollups from one scan of resp_p (GROUPING SETS), on the controlled modes
+    q_ltv_rollups = LTV_ROLLUPS_SQL
+    ltv_rollups = materialize(con, "ltv_rollups", q_ltv_rollups, [resp_p, ibw_df, adt_df])
 
-    duckdb.register("ibw_df", ibw_df)
-
-    q_ltv = f"""
-    WITH resp_with_ibw AS (
-        -- Join respiratory data with IBW
-        FROM resp_p r
-        LEFT JOIN ibw_df i USING (hospitalization_id)
-        SELECT r.hospitalization_id
-            , r.recorded_dttm
-            , r.device_category
-            , r.mode_category
-            , r.tidal_volume_set
-            , i.ibw_kg
-            , i.sex_category
-            , i.height_cm
-    )
-    , controlled_mode_hours AS (
-        -- Filter to IMV on controlled modes
-        FROM resp_with_ibw
-        WHERE LOWER(device_category) = 'imv'
-            AND LOWER(mode_category) IN ({', '.join([f"'{m}'" for m in controlled_modes])})
-        SELECT *
-            -- Calculate tidal volume in cc/kg
-            , tidal_volume_set / NULLIF(ibw_kg, 0) AS tv_cc_per_kg
-            -- Flag for low tidal volume (< 8 cc/kg)
-            , CASE
-                WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL
-                    AND (tidal_volume_set / ibw_kg) < 8
-                THEN 1
-                ELSE 0
-              END AS is_low_tv
+    ltv_summary = (
+        ltv_rollups.filter("rollup = 'overall'")
+        .select("total_controlled_mode_rows, rows_with_valid_data, low_tv_rows, low_tv_percentage")
+        .df()
     )
-    SELECT
-        -- Total controlled mode hours (denominator)
-        COUNT(*) AS total_controlled_mode_rows,
-        -- Rows with valid IBW and TV for calculation
-        SUM(CASE WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL THEN 1 ELSE 0 END) AS rows_with_valid_data,
-        -- Low tidal volume hours (numerator)
-        SUM(is_low_tv) AS low_tv_rows,
-        -- Percentage
-        ROUND(100.0 * SUM(is_low_tv) / NULLIF(SUM(CASE WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL THEN 1 ELSE 0 END), 0), 1) AS low_tv_percentage
-    FROM controlled_mode_hours
-    """
-    ltv_summary = duckdb.sql(q_ltv).df()
     print("Low Tidal Volume Summary:")
     ltv_summary
-    return controlled_modes, ltv_summary, q_ltv
-
-
-@app.cell
-def _(duckdb, ibw_df, resp_p, controlled_modes):
-    # Detailed breakdown by mode category
-    q_ltv_by_mode = f"""
-    WITH resp_with_ibw AS (
-        FROM resp_p r
-        LEFT JOIN ibw_df i USING (hospitalization_id)
-        SELECT r.hospitalization_id
-            , r.recorded_dttm
-            , r.device_category
-            , r.mode_category
-            , r.tidal_volume_set
-            , i.ibw_kg
-    )
-    , controlled_mode_hours AS (
-        FROM resp_with_ibw
-        WHERE LOWER(device_category) = 'imv'
-            AND LOWER(mode_category) IN ({', '.join([f"'{m}'" for m in controlled_modes])})
-        SELECT *
-            , tidal_volume_set / NULLIF(ibw_kg, 0) AS tv_cc_per_kg
-            , CASE
-                WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL
-                    AND (tidal_volume_set / ibw_kg) < 8
-                THEN 1
-                ELSE 0
-              END AS is_low_tv
+    return CONTROLLED_MODES, ltv_rollups, ltv_summary, q_ltv_rollups
+
+
+@app.cell
+def _(ltv_rollups):
+    # Detailed breakdown by mode category, from the same rollups
+    ltv_by_mode = (
+        ltv_rollups.filter("rollup = 'mode'")
+        .select("""
+            mode_category
+            , total_rows: total_controlled_mode_rows
+            , valid_rows: rows_with_valid_data
+            , low_tv_rows
+            , low_tv_pct: low_tv_percentage
+        """)
+        .order("total_rows DESC")
+        .df()
     )
-    SELECT
-        mode_category,
-        COUNT(*) AS total_rows,
-        SUM(CASE WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL THEN 1 ELSE 0 END) AS valid_rows,
-        SUM(is_low_tv) AS low_tv_rows,
-        ROUND(100.0 * SUM(is_low_tv) / NULLIF(SUM(CASE WHEN ibw_kg IS NOT NULL AND tidal_volume_set IS NOT NULL THEN 1 ELSE 0 END), 0), 1) AS low_tv_pct
-    FROM controlled_mode_hours
-    GROUP BY mode_category
-    ORDER BY total_rows DESC
-    """
-    ltv_by_mode = duckdb.sql(q_ltv_by_mode).df()
     print("Low Tidal Volume by Mode:")
     ltv_by_mode
-    return ltv_by_mode, q_ltv_by_mode
+    return (ltv_by_mode,)
+
+
+@app.cell
+def _(ltv_rollups):
+    # Breakdown by the unit the patient was in at the time of each row, from the same rollups
+    ltv_by_unit = (
+        ltv_rollups.filter("rollup = 'unit'")
+        .select("""
+            location_name
+            , total_rows: total_controlled_mode_rows
+            , valid_rows: rows_with_valid_data
+            , low_tv_rows
+            , low_tv_pct: low_tv_percentage
+        """)
+        .order("total_rows DESC")
+        .df()
+    )
+    print("Low Tidal Volume by Unit:")
+    ltv_by_unit
+    return (ltv_by_unit,)
 
 
 @app.cell
@@ -611,11 +732,310 @@ def _(ltv_summary, mo):
     | Rows with low tidal volume (< 8 cc/kg) | {low_tv_rows:,} |
     | **Low tidal volume percentage** | **{low_tv_pct}%** |
 
-    *Note: Each row represents one respiratory support measurement. For hourly analysis,
-    data should be aggregated to hourly intervals.*
+    *Note: Each row represents one respiratory support measurement. The hourly LPV
+    metrics per ICU unit and day (`lpv_metrics`) are built under Backend Outputs.*
     """)
     return low_tv_pct, low_tv_rows, total_rows, valid_rows
 
 
+
+@app.cell(hide_code=True)
+def _(mo):
+    mo.md(
+        r"""
+        ## Backend Outputs (All Units, All Days)
+
+        Build the per-`location_name` per-day tables defined in `specs/backend_outputs/`
+        for every ICU unit and every day in one grouped pass, and save them as parquet
+        partitioned by `location_name`. The dashboard reads these rows instead of
+        recomputing a unit whenever the selection changes.
+
+        Days are clinical days running from 7 AM to 7 AM the next morning.
+        """
+    )
+    return
+
+
+@app.cell
+def _(con, materialize, sofa_days):
+    # SOFA-2 per ICU unit and clinical day: median and IQR of the patients' daily max
+    q_sofa_metrics = """
+    FROM sofa_days
+    SELECT location_name
+        , day
+        , sofa_median: MEDIAN(sofa_max)
+        , sofa_q1: QUANTILE_CONT(sofa_max, 0.25)
+        , sofa_q3: QUANTILE_CONT(sofa_max, 0.75)
+    GROUP BY location_name, day
+    ORDER BY location_name, day
+    """
+    sofa_metrics = materialize(con, "sofa_metrics", q_sofa_metrics, [sofa_days])
+    print(f"SOFA-2 metrics: {sofa_metrics.shape[0]:,} unit-days")
+    sofa_metrics.limit(5).df()
+    return q_sofa_metrics, sofa_metrics
+
+
+@app.cell
+def _(EXTRACT_END, adt_df, con, materialize, meds_df, resp_p):
+    from stage_sql import daily_anchors_sql
+
+    # Location, ventilator and sedation state of every ICU hospitalization-day at the 7 AM and 7 PM anchors
+    q_daily_anchors = daily_anchors_sql(EXTRACT_END)
+    daily_anchors = materialize(con, "daily_anchors", q_daily_anchors, [adt_df, resp_p, meds_df])
+    print(f"Daily anchor snapshots: {daily_anchors.shape[0]:,} rows")
+    daily_anchors.limit(5).df()
+    return daily_anchors, q_daily_anchors
+
+
+@app.cell
+def _(
+    END_DATE,
+    EXTRACT_END,
+    START_DATE,
+    TIMEZONE,
+    adt_df,
+    con,
+    daily_anchors,
+    hosp_df,
+    materialize,
+    pd,
+    run_log,
+    scan_sql,
+    sofa_metrics,
+    source_key,
+):
+    from loaders import ADT_COLUMNS as _ADT_COLUMNS
+    from loaders import categorize
+    from overall_summary import add_census, add_sofa, build_next_adt_index, clinical_day, summarize_units
+
+    # 7 AM / 7 PM census of every ICU unit from the anchor snapshots
+    q_anchor_census = """
+    FROM daily_anchors
+    SELECT location_name
+        , day
+        , census_7AM: COUNT(*) FILTER (WHERE anchor = '7AM')
+        , census_7PM: COUNT(*) FILTER (WHERE anchor = '7PM')
+    WHERE in_icu
+    GROUP BY location_name, day
+    """
+    anchor_census = materialize(con, "anchor_census", q_anchor_census, [daily_anchors])
+
+    # ICU units and their first admission in the whole ADT table, not only the run's cohort: an incremental
+    # refresh then writes every unit's refreshed days, with zeros for units none of the refreshed patients were in
+    q_icu_units = f"""
+    FROM ({scan_sql("clif_adt", _ADT_COLUMNS)})
+    SELECT location_name
+        , first_in_dttm: MIN(in_dttm)
+    WHERE location_category = 'icu'
+        AND location_name IS NOT NULL
+    GROUP BY location_name
+    ORDER BY location_name
+    """
+    icu_units = materialize(con, "icu_units", q_icu_units, [source_key[0]]).df()
+
+    # Overall summary for every ICU location over the full span of the ADT table (or the reporting period)
+    with run_log.stage("overall_summary", rows_in=adt_df.shape[0]) as _record:
+        adt_pdf = categorize(adt_df.df())
+        icu_location_names = icu_units['location_name'].tolist()
+        first_day = clinical_day(icu_units['first_in_dttm'], TIMEZONE).min()
+        # Up to the end of the extract, where patients still in a unit stop counting
+        last_day = clinical_day(pd.Series([pd.Timestamp(EXTRACT_END)]), TIMEZONE).iloc[0]
+        if START_DATE is not None:
+            first_day = max(first_day, pd.Timestamp(START_DATE))
+        if END_DATE is not None:
+            last_day = min(last_day, pd.Timestamp(END_DATE))
+
+        adt_index = build_next_adt_index(adt_pdf, categorize(hosp_df.df()))
+        overall_summary_all = summarize_units(adt_index, icu_location_names, first_day, last_day, tz=TIMEZONE)
+        overall_summary_all = add_census(overall_summary_all, anchor_census.df())
+        overall_summary_all = add_sofa(overall_summary_all, sofa_metrics.df())
+        _record['rows_out'] = len(overall_summary_all)
+    print(f"Overall summary: {len(icu_location_names)} ICU units x {overall_summary_all['day'].nunique():,} days")
+    overall_summary_all.head()
+    return (
+        adt_index,
+        anchor_census,
+        icu_location_names,
+        icu_units,
+        overall_summary_all,
+        q_anchor_census,
+        q_icu_units,
+    )
+
+
+@app.cell
+def _(EXTRACT_END, con, config, materialize, scan_sql, source_key):
+    from loaders import ADT_COLUMNS as _ADT_COLUMNS
+    from stage_sql import bed_strain_sql
+
+    # Licensed beds per ICU unit; units missing from the config use their highest occupancy over the whole extract
+    bed_capacity = config.get("bed_capacity") or {}
+
+    # Bed strain: occupied beds of every ICU unit at the top of every hour, from one sweep over the ADT events.
+    # Occupancy counts everyone in the unit, so it is built from the whole ADT table rather than the run's cohort:
+    # incremental and reporting-period runs then give the same rows and capacity as a full run.
+    q_bed_strain = bed_strain_sql(scan_sql("clif_adt", _ADT_COLUMNS), EXTRACT_END, bed_capacity)
+    bed_strain = materialize(con, "bed_strain", q_bed_strain, [source_key[0]])
+    print(f"Bed strain: {bed_strain.shape[0]:,} unit-hours")
+    bed_strain.limit(5).df()
+    return bed_capacity, bed_strain, q_bed_strain
+
+
+@app.cell
+def _(EXTRACT_END, adt_df, con, hosp_df, ibw_df, materialize, resp_p):
+    from stage_sql import lpv_hours_sql
+
+    # LPV at hourly resolution: every hour on a controlled IMV mode, with the tidal volume and ICU unit at that hour
+    q_lpv_hours = lpv_hours_sql(EXTRACT_END)
+    lpv_hours = materialize(con, "lpv_hours", q_lpv_hours, [resp_p, hosp_df, ibw_df, adt_df])
+
+    # Hours per ICU unit and clinical day; hours without IBW or tidal volume count only in the total
+    q_lpv_metrics = """
+    FROM lpv_hours
+    SELECT location_name
+        , day
+        , total_controlled_IMV_hours: COUNT(*)
+        , TV_less_8_cc_kg_IBW: COUNT(*) FILTER (WHERE vt_cc_kg < 8)
+        , median_VT_cc_kg_IBW: MEDIAN(vt_cc_kg)
+    GROUP BY location_name, day
+    ORDER BY location_name, day
+    """
+    lpv_metrics = materialize(con, "lpv_metrics", q_lpv_metrics, [lpv_hours])
+    print(f"LPV: {lpv_hours.shape[0]:,} controlled-mode IMV hours, {lpv_metrics.shape[0]:,} unit-days")
+    lpv_metrics.limit(5).df()
+    return lpv_hours, lpv_metrics, q_lpv_hours, q_lpv_metrics
+
+
+@app.cell
+def _(con, daily_anchors, materialize, sat_days):
+    # SAT: patients on IMV at 7 AM (unit as of 7 AM) and the SAT delivered between 7 AM and 7 PM that day
+    q_sat_metrics = """
+    FROM daily_anchors d
+    LEFT JOIN sat_days s
+        ON s.hospitalization_id = d.hospitalization_id
+        AND s.event_date = d.day
+    SELECT d.location_name
+        , d.day
+        , total_IMV_patients_7AM: COUNT(*)
+        -- Complete cessation of all analgesia and sedation
+        , sat_complete_cessation_N_7AM_7PM: COALESCE(SUM(s.SAT_EHR_delivery_7AM_7PM), 0)
+        -- Cessation of propofol and benzodiazepine drips
+        , sat_sedation_cessation_N_7AM_7PM: COALESCE(SUM(s.SAT_modified_delivery_7AM_7PM), 0)
+        -- Sedation dose halved
+        , sat_dose_reduction_N_7AM_7PM: COALESCE(SUM(s.SAT_med_halved_rass_pos_7AM_7PM), 0)
+    WHERE d.anchor = '7AM'
+        AND d.in_icu
+        AND d.device_category = 'imv'
+    GROUP BY ALL
+    ORDER BY location_name, day
+    """
+    sat_metrics = materialize(con, "sat_metrics", q_sat_metrics, [daily_anchors, sat_days])
+    print(f"SAT metrics: {sat_metrics.shape[0]:,} unit-days")
+    sat_metrics.limit(5).df()
+    return q_sat_metrics, sat_metrics
+
+
+@app.cell
+def _(CONTROLLED_MODES, con, daily_anchors, materialize, sbt_events):
+    # SBT: patients on a controlled IMV mode at 7 AM (unit as of 7 AM), their SBT and extubation
+    # between 7 AM and 7 PM, and whether they are still off the ventilator at 7 PM
+    q_sbt_metrics = f"""
+    WITH daytime_events AS (
+        -- SBT and first extubation flags between 7 AM and 7 PM of each day
+        FROM sbt_events
+        SELECT hospitalization_id
+            , event_date: event_dttm::DATE
+            , sbt_done: MAX(sbt_done)
+            , extubated: MAX(_extub_1st)
+        WHERE hour(event_dttm) BETWEEN 7 AND 18
+            AND (sbt_done = 1 OR _extub_1st = 1)
+        GROUP BY ALL
+    )
+    FROM daily_anchors d
+    LEFT JOIN daytime_events s
+        ON s.hospitalization_id = d.hospitalization_id
+        AND s.event_date = d.day
+    -- Ventilation state at 7 PM
+    LEFT JOIN daily_anchors pm
+        ON pm.hospitalization_id = d.hospitalization_id
+        AND pm.day = d.day
+        AND pm.anchor = '7PM'
+    SELECT d.location_name
+        , d.day
+        , total_IMV_patients_7AM: COUNT(*)
+        , sbt_pressure_support_7AM_7PM_N: COALESCE(SUM(s.sbt_done), 0)
+        , any_extubation_7AM_7PM: COALESCE(SUM(s.extubated), 0)
+        , sbt_successful_extubation_7PM_N: COUNT(*) FILTER (
+            WHERE s.extubated = 1 AND pm.device_category IS DISTINCT FROM 'imv'
+        )
+    WHERE d.anchor = '7AM'
+        AND d.in_icu
+        AND d.device_category = 'imv'
+        AND d.mode_category IN ({', '.join([f"'{m}'" for m in CONTROLLED_MODES])})
+    GROUP BY ALL
+    ORDER BY d.location_name, d.day
+    """
+    sbt_metrics = materialize(con, "sbt_metrics", q_sbt_metrics, [daily_anchors, sbt_events])
+    print(f"SBT metrics: {sbt_metrics.shape[0]:,} unit-days")
+    sbt_metrics.limit(5).df()
+    return q_sbt_metrics, sbt_metrics
+
+
+@app.cell
+def _(
+    END_DATE,
+    SITE_NAME,
+    START_DATE,
+    bed_strain,
+    con,
+    lpv_hours,
+    lpv_metrics,
+    new_watermark,
+    os,
+    overall_summary_all,
+    pd,
+    refresh_days,
+    run_log,
+    sat_metrics,
+    sbt_metrics,
+    sofa_days,
+    watermark_path,
+    with_hosp_ids,
+):
+    from refresh import merge_unit_days, write_watermark
+
+    # Save per-unit daily tables partitioned by unit; an incremental refresh replaces only the refreshed days
+    backend_outputs = {
+        "overall_summary": overall_summary_all,
+        "bed_strain": bed_strain.df(),
+        "lpv_metrics": lpv_metrics.df(),
+        "lpv_hours": with_hosp_ids(con, lpv_hours.alias),
+        "sat_metrics": sat_metrics.df(),
+        "sbt_metrics": sbt_metrics.df(),
+        "sofa_days": with_hosp_ids(con, sofa_days.alias),
+    }
+    os.makedirs("output/intermediate", exist_ok=True)
+    for table_name, table_df in backend_outputs.items():
+        table_path = f"output/intermediate/{SITE_NAME}_{table_name}"
+        with run_log.stage(f"save_{table_name}", rows_in=len(table_df)) as _record:
+            # Days outside the reporting period only see part of their patients
+            table_df = table_df[pd.to_datetime(table_df['day']).between(
+                pd.Timestamp(START_DATE or pd.Timestamp.min), pd.Timestamp(END_DATE or pd.Timestamp.max)
+            )]
+            table_df = merge_unit_days(table_path, table_df, refresh_days)
+            table_df.to_parquet(
+                table_path,
+                partition_cols=["location_name"],
+                index=False,
+                existing_data_behavior="delete_matching",
+            )
+            _record['rows_out'] = len(table_df)
+        print(f"Saved {table_name}: {len(table_df):,} rows")
+
+    # Record what has been processed for the next incremental refresh
+    write_watermark(watermark_path, new_watermark)
+    return (backend_outputs,)
+
+
 if __name__ == "__main__":
     app.run()
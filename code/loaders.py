@@ -0,0 +1,338 @@
+"""
+DuckDB loaders for the CLIF tables used by `backend.py`.
+
+Each table is scanned straight from parquet (or a view over it) with only the
+columns that `sat.sql`, `sbt.sql`, `sofa.sql` and the backend outputs use, so DuckDB skips
+every other column chunk on disk. Row filters (assessment and medication
+categories, the reporting date range and the refresh cohort) are part of the
+same scan. The functions return SQL, which `backend.py` materializes as
+tables in the pipeline database. `AdtWindow` reads the ADT and hospitalization
+rows of the dashboard the same way, for the days it displays.
+
+The date range and the refresh cohort both select whole hospitalizations: all
+SAT/SBT logic is partitioned by `hospitalization_id`, so keeping a
+hospitalization's full history reproduces its rows exactly.
+
+Values are normalized once, in the scan: category columns are lower-cased,
+and `hospitalization_id` is replaced by a dense integer key from the cohort
+table, so every downstream join and filter works on integers and plain
+lower-case values. `with_hosp_ids` maps the keys back for exported files.
+"""
+
+import duckdb
+import pandas as pd
+
+# Columns read from each table; entries may be SQL expressions with a `name:` alias
+RESP_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm',
+    'device_category: LOWER(device_category)', 'device_name', 'mode_category: LOWER(mode_category)', 'mode_name',
+    'fio2_set', 'peep_set', 'pressure_support_set', 'tidal_volume_set',
+    'tracheostomy: COALESCE(tracheostomy, 0)::INTEGER',
+]
+HOSP_COLUMNS = [
+    'patient_id', 'hospitalization_id', 'admission_dttm', 'discharge_dttm',
+    'discharge_category: LOWER(TRIM(discharge_category))',
+]
+ADT_COLUMNS = [
+    'hospitalization_id', 'in_dttm', 'out_dttm', 'location_name', 'location_category: LOWER(location_category)',
+]
+CODE_STATUS_COLUMNS = [
+    'hospitalization_id', 'start_dttm', 'code_status_category',
+]
+RASS_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm', 'rass: assessment_value::FLOAT',
+]
+MEDS_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm: admin_dttm', 'med_category: LOWER(med_category)', 'med_dose',
+]
+VITALS_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm', 'vital_category: LOWER(vital_category)', 'vital_value',
+]
+GCS_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm', 'gcs_total: assessment_value::FLOAT',
+]
+LABS_COLUMNS = [
+    'hospitalization_id', 'recorded_dttm: lab_collect_dttm', 'lab_category: LOWER(lab_category)',
+    'lab_value: lab_value_numeric',
+]
+VASOACTIVE_COLUMNS = MEDS_COLUMNS + ['med_dose_unit: LOWER(med_dose_unit)']
+
+# Continuous medications of the SAT definitions, by group: sedation is any opioid or sedative
+SAT_MED_GROUPS = {
+    'opioid': ['fentanyl', 'hydromorphone', 'morphine'],
+    'sedative': ['propofol', 'lorazepam', 'midazolam'],
+    'paralytic': ['cisatracurium', 'vecuronium', 'rocuronium'],
+}
+
+# Low-cardinality string columns held as pandas categoricals (see `categorize`)
+CATEGORY_COLUMNS = [
+    'location_name', 'location_category', 'next_location_category', 'discharge_category',
+    'device_category', 'mode_category',
+]
+
+# Vitals whose most recent value per hospitalization is kept in the vitals summary
+LATEST_VITALS = ['height_cm', 'weight_kg']
+
+# Inputs of the SOFA-2 score (`sofa.sql`)
+SOFA_LABS = ['creatinine', 'bilirubin_total', 'platelet_count', 'po2_arterial']
+SOFA_VITALS = ['map', 'spo2']
+VASOACTIVE_MEDS = [
+    'norepinephrine', 'epinephrine', 'dopamine', 'dobutamine', 'vasopressin', 'phenylephrine', 'milrinone',
+    'angiotensin',
+]
+
+
+def _sql_list(values) -> str:
+    return ', '.join(f"'{v}'" for v in values)
+
+
+def _relation(source: str) -> str:
+    """A parquet path is quoted; anything else is a table or view name."""
+    return f"'{source}'" if source.endswith('.parquet') else source
+
+
+def _keys_sql(ids_query: str) -> str:
+    """Dense integer `hosp_key` (1..n, in `hospitalization_id` order) of every id returned by `ids_query`."""
+    return f"""
+    FROM (
+        FROM ({ids_query})
+        SELECT DISTINCT hospitalization_id
+        WHERE hospitalization_id IS NOT NULL
+    )
+    SELECT hospitalization_id
+        , hosp_key: (ROW_NUMBER() OVER (ORDER BY hospitalization_id))::INTEGER
+    """
+
+
+def register_cohort(hosp_source: str, start_date=None, end_date=None, hosp_ids=None, con=None) -> str:
+    """
+    Register the hospitalizations to load, with their integer keys, as the `cohort` table.
+
+    A hospitalization is kept when its stay overlaps `[start_date, end_date]`
+    (inclusive dates, in the session time zone) and, if given, it is in
+    `hosp_ids`; without any filter every hospitalization is kept. The table
+    maps each `hospitalization_id` to its `hosp_key` and back. Keys follow the
+    id order, so the same cohort always gets the same keys.
+    """
+    con = con or duckdb
+    if hosp_ids is not None:
+        con.register('_cohort_hosp_ids', pd.DataFrame({'hospitalization_id': pd.Series(hosp_ids, dtype=object)}))
+    if start_date is None and end_date is None and hosp_ids is not None:
+        # Refresh cohort only; ids need not be in the hospitalization table
+        con.execute(f"CREATE OR REPLACE TEMP TABLE cohort AS {_keys_sql('FROM _cohort_hosp_ids')}")
+        return 'cohort'
+
+    filters = ['hospitalization_id IS NOT NULL']
+    if end_date is not None:
+        filters.append(f"admission_dttm < '{pd.Timestamp(end_date).date()}'::DATE + 1")
+    if start_date is not None:
+        filters.append(f"(discharge_dttm IS NULL OR discharge_dttm >= '{pd.Timestamp(start_date).date()}'::DATE)")
+    if hosp_ids is not None:
+        filters.append('hospitalization_id IN (FROM _cohort_hosp_ids SELECT hospitalization_id)')
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE cohort AS
+    {_keys_sql(f"FROM {_relation(hosp_source)} SELECT hospitalization_id WHERE {' AND '.join(filters)}")}
+    """)
+    return 'cohort'
+
+
+def scan_sql(source: str, columns, where=None, cohort=None) -> str:
+    """
+    SQL reading `columns` from a parquet file or view, restricted by `where` and to the `cohort` table.
+
+    With a cohort, `hospitalization_id` in the result is the cohort's integer
+    `hosp_key`. The result can be used on its own or as a subquery (e.g. under
+    a PIVOT).
+    """
+    scan = (
+        f"FROM {_relation(source)}\n"
+        f"SELECT {', '.join(columns)}"
+        + (f"\nWHERE {where}" if where else "")
+    )
+    if cohort is None:
+        return scan
+    return (
+        f"FROM ({scan}) t\n"
+        f"JOIN {cohort} k ON k.hospitalization_id = t.hospitalization_id\n"
+        f"SELECT t.* REPLACE (k.hosp_key AS hospitalization_id)"
+    )
+
+
+def with_hosp_ids(con, table: str, cohort: str = 'cohort', day_key: bool = False) -> pd.DataFrame:
+    """
+    Rows of `table` with integer keys mapped back to `hospitalization_id`, for export.
+
+    With `day_key`, the exported `hosp_id_day_key` string ('{hospitalization_id}_{event_date}')
+    is added after `event_date`; inside the pipeline day-level tables are keyed
+    by (`hospitalization_id`, `event_date`). Tables without `hospitalization_id`
+    are returned as they are.
+    """
+    columns = con.table(table).columns
+    if 'hospitalization_id' not in columns:
+        return con.table(table).df()
+    select = []
+    for column in columns:
+        select.append('k.hospitalization_id' if column == 'hospitalization_id' else f't."{column}"')
+        if day_key and column == 'event_date':
+            select.append("CONCAT(k.hospitalization_id, '_', t.event_date) AS hosp_id_day_key")
+    return con.execute(f"""
+    FROM {table} t
+    LEFT JOIN {cohort} k ON k.hosp_key = t.hospitalization_id
+    SELECT {', '.join(select)}
+    """).df()
+
+
+def categorize(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with its `CATEGORY_COLUMNS` as pandas categoricals."""
+    return df.astype({c: 'category' for c in CATEGORY_COLUMNS if c in df})
+
+
+def rass_sql(assessments_source: str, cohort=None) -> str:
+    """RASS assessments from the patient assessments table."""
+    return scan_sql(assessments_source, RASS_COLUMNS, "LOWER(assessment_category) = 'rass'", cohort)
+
+
+def gcs_sql(assessments_source: str, cohort=None) -> str:
+    """Glasgow Coma Scale totals from the patient assessments table."""
+    return scan_sql(assessments_source, GCS_COLUMNS, "LOWER(assessment_category) = 'gcs_total'", cohort)
+
+
+def labs_sql(labs_source: str, labs, cohort=None) -> str:
+    """Numeric results of the lab categories in `labs`, timed at collection."""
+    return scan_sql(
+        labs_source, LABS_COLUMNS,
+        f"LOWER(lab_category) IN ({_sql_list(labs)}) AND lab_value_numeric IS NOT NULL", cohort,
+    )
+
+
+def vitals_sql(vitals_source: str, vitals, cohort=None) -> str:
+    """Rows of the vital categories in `vitals`."""
+    return scan_sql(
+        vitals_source, VITALS_COLUMNS,
+        f"LOWER(vital_category) IN ({_sql_list(vitals)}) AND vital_value IS NOT NULL", cohort,
+    )
+
+
+def vasoactive_sql(meds_source: str, meds, cohort=None) -> str:
+    """Continuous doses of the vasopressors and inotropes in `meds`, in long format with their units."""
+    return scan_sql(meds_source, VASOACTIVE_COLUMNS, f"LOWER(med_category) IN ({_sql_list(meds)})", cohort)
+
+
+def meds_changes_sql(meds_source: str, med_groups: dict, cohort=None) -> str:
+    """
+    Dose change points of the continuous medications in `med_groups` (group -> medications), in long format.
+
+    One row per hospitalization, medication and time at which the medication's
+    dose differs from its previous dose (the largest dose when several are
+    charted at once), with the medication's `med_group`. Rows without a dose
+    are skipped, so a dose holds until the medication's next change point.
+    Sorted by hospitalization, medication and time.
+    """
+    meds = [med for group_meds in med_groups.values() for med in group_meds]
+    filtered = scan_sql(
+        meds_source, MEDS_COLUMNS, f"LOWER(med_category) IN ({_sql_list(meds)}) AND med_dose IS NOT NULL", cohort,
+    )
+    med_group = ' '.join(
+        f"WHEN med_category IN ({_sql_list(group_meds)}) THEN '{group}'" for group, group_meds in med_groups.items()
+    )
+    return f"""
+    FROM (
+        FROM ({filtered})
+        SELECT hospitalization_id, med_category, recorded_dttm
+            , med_dose: MAX(med_dose)
+            , med_group: ANY_VALUE(CASE {med_group} END)
+        GROUP BY hospitalization_id, med_category, recorded_dttm
+    )
+    QUALIFY med_dose IS DISTINCT FROM LAG(med_dose) OVER (
+        PARTITION BY hospitalization_id, med_category ORDER BY recorded_dttm
+    )
+    ORDER BY hospitalization_id, med_category, recorded_dttm
+    """
+
+
+def vitals_summary_sql(vitals_source: str, cohort=None) -> str:
+    """
+    Per-hospitalization vitals summary from a single scan of the vitals table.
+
+    One row per hospitalization with the last `recorded_dttm` of any vital and
+    the most recent value of each of `LATEST_VITALS`.
+    """
+    latest = ''.join(
+        f"""
+        , {v}: ARG_MAX(vital_value, recorded_dttm) FILTER (WHERE vital_category = '{v}' AND vital_value IS NOT NULL)"""
+        for v in LATEST_VITALS
+    )
+    return f"""
+    FROM ({scan_sql(vitals_source, VITALS_COLUMNS, cohort=cohort)})
+    SELECT hospitalization_id
+        -- Last vitals timestamp of any category (SBT outcome after extubation)
+        , recorded_dttm: MAX(recorded_dttm){latest}
+    GROUP BY hospitalization_id
+    """
+
+
+# Hospitalization columns the dashboard's overall summary reads (`overall_summary.build_next_adt_index`)
+DASHBOARD_HOSP_COLUMNS = ['hospitalization_id', 'discharge_dttm', 'discharge_category: LOWER(TRIM(discharge_category))']
+
+
+class AdtWindow:
+    """
+    ADT and hospitalization rows for the dashboard, read lazily for a window of days.
+
+    Only `ADT_COLUMNS` / `DASHBOARD_HOSP_COLUMNS` are read, and the
+    window is pushed into the scan: ADT segments overlapping it (with a few
+    days after it, for the location a patient moves to) and the
+    hospitalizations of those segments. Frames are normalized as in the
+    backend (integer `hospitalization_id` keys, lower-cased categorical
+    columns). A window inside the one already loaded is served from memory;
+    any other one replaces it.
+    """
+
+    # Clinical days end at 7 AM the next day and floor transfers look 24 hours past an ICU discharge
+    LOOKAHEAD_DAYS = 3
+
+    def __init__(self, con, adt_source: str, hosp_source: str):
+        self.con = con
+        self.adt_source = adt_source
+        self.hosp_source = hosp_source
+        self.window = None
+        self.adt_df = None
+        self.hosp_df = None
+
+    def locations(self) -> pd.DataFrame:
+        """Distinct location name, category and type of the ADT table."""
+        return self.con.execute(f"""
+        FROM {_relation(self.adt_source)}
+        SELECT DISTINCT location_name, location_category: LOWER(location_category), location_type
+        """).df()
+
+    def date_bounds(self):
+        """Earliest and latest `in_dttm`/`out_dttm` of the ADT table, `(None, None)` when it has none."""
+        return self.con.execute(f"""
+        FROM {_relation(self.adt_source)}
+        SELECT LEAST(MIN(in_dttm), MIN(out_dttm)), GREATEST(MAX(in_dttm), MAX(out_dttm))
+        """).fetchone()
+
+    def load(self, start_date, end_date):
+        """`(adt_df, hosp_df)` covering the clinical days `[start_date, end_date]`."""
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        if self.window is not None and self.window[0] <= start_date and end_date <= self.window[1]:
+            return self.adt_df, self.hosp_df
+
+        window = (
+            f"(in_dttm IS NULL OR in_dttm < '{end_date.date()}'::DATE + {1 + self.LOOKAHEAD_DAYS}) "
+            f"AND (out_dttm IS NULL OR out_dttm >= '{start_date.date()}'::DATE)"
+        )
+        # Integer keys of the hospitalizations in the window
+        self.con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _window_keys AS
+        {_keys_sql(scan_sql(self.adt_source, ['hospitalization_id'], window))}
+        """)
+        self.adt_df = categorize(
+            self.con.execute(scan_sql(self.adt_source, ADT_COLUMNS, window, cohort='_window_keys')).df()
+        )
+        self.hosp_df = categorize(
+            self.con.execute(scan_sql(self.hosp_source, DASHBOARD_HOSP_COLUMNS, cohort='_window_keys')).df()
+        )
+        self.window = (start_date, end_date)
+        return self.adt_df, self.hosp_df
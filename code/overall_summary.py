@@ -0,0 +1,213 @@
+"""
+Vectorized engine for the dashboard's overall summary table.
+
+Every day in the reporting period is a clinical day running from 7 AM to 7 AM
+the next morning. Instead of re-filtering the ADT table once per day, ADT
+segments are binned into clinical days in one pass and the 7 AM / 7 PM census
+snapshots are answered with sorted searches, so the cost grows with the number
+of ADT rows rather than days x rows. The location each segment is discharged to
+is looked up once for the whole table by `build_next_adt_index`.
+
+The ADT and hospitalization frames are the ones `loaders.py` reads, with
+lower-cased categories. The output matches
+`specs/backend_outputs/overall_summary.csv`.
+"""
+
+import numpy as np
+import pandas as pd
+
+DAY_START_HOUR = 7
+CENSUS_HOURS = {"census_7AM": 7, "census_7PM": 19}
+
+# Discharge categories are lower-cased at load
+FACILITY_CATEGORIES = [
+    'skilled nursing facility (snf)',
+    'long term care hospital (ltach)',
+    'acute inpatient rehab facility',
+    'assisted living'
+]
+
+SUMMARY_COLUMNS = [
+    'location_name', 'day', 'total_admissions', 'census_7AM', 'census_7PM',
+    'total_discharges', 'floor_transfers', 'deaths_in_icu',
+    'discharges_to_hospice', 'discharges_to_facility',
+    'sofa_median', 'sofa_q1', 'sofa_q3'
+]
+SOFA_COLUMNS = ['sofa_median', 'sofa_q1', 'sofa_q3']
+
+
+def clinical_day(dttm: pd.Series, tz=None) -> pd.Series:
+    """
+    Map timestamps to the calendar date of the 7 AM-to-7 AM clinical day they fall in.
+
+    Binning is done on local wall-clock time so DST transitions never move a
+    timestamp across the 7 AM boundary.
+    """
+    if dttm.dt.tz is not None:
+        dttm = dttm.dt.tz_convert(tz).dt.tz_localize(None) if tz is not None else dttm.dt.tz_localize(None)
+    return (dttm - pd.Timedelta(hours=DAY_START_HOUR)).dt.floor('D').astype('datetime64[ns]')
+
+
+def _as_ns(values) -> np.ndarray:
+    """Absolute (UTC) datetime64[ns] array for sorted searches."""
+    return np.asarray(values, dtype='datetime64[ns]')
+
+
+def census_at(location_adt: pd.DataFrame, snapshot_times: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Count ADT segments present at each snapshot time.
+
+    A segment is present at T when `in_dttm <= T` and `out_dttm` is missing or
+    after T. That count equals the segments that started by T minus those that
+    started and ended by T, both of which are sorted searches.
+    """
+    in_dttm = location_adt['in_dttm']
+    out_dttm = location_adt['out_dttm']
+    has_in = in_dttm.notna()
+    closed = has_in & out_dttm.notna()
+
+    in_sorted = np.sort(_as_ns(in_dttm[has_in].values))
+    # A closed segment stops counting once both its in and out times have passed
+    closed_sorted = np.sort(np.maximum(
+        _as_ns(in_dttm[closed].values), _as_ns(out_dttm[closed].values)
+    ))
+
+    t = _as_ns(snapshot_times.values)
+    started = np.searchsorted(in_sorted, t, side='right')
+    finished = np.searchsorted(closed_sorted, t, side='right')
+    return started - finished
+
+
+def _daily_counts(locations: pd.Series, days: pd.Series, unit_days: pd.MultiIndex) -> np.ndarray:
+    """Count rows per (unit, clinical day), aligned to `unit_days` with zeros for empty days."""
+    counts = pd.DataFrame({'location_name': locations.to_numpy(), 'day': days.to_numpy()}).value_counts()
+    return counts.reindex(unit_days, fill_value=0).to_numpy()
+
+
+def build_next_adt_index(adt_df: pd.DataFrame, hosp_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Annotate every ADT segment with the location that follows it and its hospital discharge.
+
+    `next_location_category` / `next_in_dttm` come from the first ADT segment of the
+    same hospitalization with `in_dttm >= out_dttm` (a forward as-of join), and
+    `discharge_category` / `discharge_dttm` from the hospitalization table. Built
+    once per load, it turns floor transfer and disposition counts into column filters.
+    """
+    adt_index = adt_df[['hospitalization_id', 'location_name', 'location_category', 'in_dttm', 'out_dttm']]
+
+    next_segments = (
+        adt_index.loc[adt_index['in_dttm'].notna(), ['hospitalization_id', 'in_dttm', 'location_category']]
+        .rename(columns={'in_dttm': 'next_in_dttm', 'location_category': 'next_location_category'})
+        .sort_values('next_in_dttm', kind='stable')
+    )
+    discharged = adt_index[adt_index['out_dttm'].notna()].sort_values('out_dttm', kind='stable')
+    next_location = pd.merge_asof(
+        discharged[['hospitalization_id', 'out_dttm']].reset_index(),
+        next_segments,
+        left_on='out_dttm',
+        right_on='next_in_dttm',
+        by='hospitalization_id',
+        direction='forward',
+        allow_exact_matches=True
+    ).set_index('index')[['next_location_category', 'next_in_dttm']]
+
+    adt_index = adt_index.join(next_location)
+    # hospitalization_id is the primary key of the hospitalization table
+    hosp_discharge = hosp_df[['hospitalization_id', 'discharge_category', 'discharge_dttm']].drop_duplicates('hospitalization_id')
+    return adt_index.merge(hosp_discharge, on='hospitalization_id', how='left')
+
+
+def summarize_units(adt_index: pd.DataFrame, locations, start_date, end_date, tz=None) -> pd.DataFrame:
+    """
+    Build the daily overall summary for several units over an inclusive date range.
+
+    `adt_index` is the output of `build_next_adt_index`. Days are binned in `tz`
+    (defaults to the timezone of `in_dttm`; ignored for naive timestamps). Returns one row per unit and day,
+    with `day` as the midnight timestamp of the clinical day (not the `'%m/%d/%y'`
+    string the dashboard used to build). SOFA columns are left empty
+    (see `add_sofa`).
+    """
+    locations = list(locations)
+    date_list = pd.date_range(start=pd.Timestamp(start_date), end=pd.Timestamp(end_date), freq='D')
+    unit_days = pd.MultiIndex.from_product([locations, date_list], names=['location_name', 'day'])
+    if tz is None or adt_index['in_dttm'].dt.tz is None:
+        # Naive timestamps are already in local time
+        tz = adt_index['in_dttm'].dt.tz
+
+    unit_adt = adt_index[adt_index['location_name'].isin(locations)]
+
+    # Total admissions: in_dttm within the clinical day (7 AM to 7 AM next day)
+    admissions = _daily_counts(unit_adt['location_name'], clinical_day(unit_adt['in_dttm'], tz), unit_days)
+
+    # Census: patients present at the 7 AM / 7 PM snapshot of each day, one sorted search per unit
+    adt_by_unit = dict(tuple(unit_adt.groupby('location_name', observed=True)))
+    census = {
+        col: np.concatenate([
+            census_at(adt_by_unit.get(loc, unit_adt.iloc[:0]),
+                      (date_list + pd.Timedelta(hours=hour)).tz_localize(tz))
+            for loc in locations
+        ]) if locations else np.array([], dtype=int)
+        for col, hour in CENSUS_HOURS.items()
+    }
+
+    # Total discharges from ICU: out_dttm within the clinical day
+    icu_discharges = unit_adt.assign(_day=clinical_day(unit_adt['out_dttm'], tz))
+    icu_discharges = icu_discharges[icu_discharges['_day'].isin(date_list)]
+
+    def _counts(mask):
+        return _daily_counts(icu_discharges.loc[mask, 'location_name'], icu_discharges.loc[mask, '_day'], unit_days)
+
+    # Floor transfers: next ADT location within 24 hours is ward or stepdown
+    floor_transfer = (
+        (icu_discharges['next_in_dttm'] <= icu_discharges['out_dttm'] + pd.Timedelta(hours=24))
+        & icu_discharges['next_location_category'].isin(['ward', 'stepdown'])
+    )
+
+    # Discharge dispositions count only when the hospital discharge falls on the same clinical day
+    same_day = clinical_day(icu_discharges['discharge_dttm'], tz) == icu_discharges['_day']
+    category = icu_discharges['discharge_category']
+
+    return pd.DataFrame({
+        'location_name': unit_days.get_level_values('location_name'),
+        'day': unit_days.get_level_values('day'),
+        'total_admissions': admissions,
+        'census_7AM': census['census_7AM'],
+        'census_7PM': census['census_7PM'],
+        'total_discharges': _counts(slice(None)),
+        'floor_transfers': _counts(floor_transfer),
+        'deaths_in_icu': _counts(same_day & (category == 'expired')),
+        'discharges_to_hospice': _counts(same_day & (category == 'hospice')),
+        'discharges_to_facility': _counts(same_day & category.isin(FACILITY_CATEGORIES)),
+        'sofa_median': None,  # To be calculated later
+        'sofa_q1': None,
+        'sofa_q3': None
+    }, columns=SUMMARY_COLUMNS)
+
+
+def add_sofa(summary: pd.DataFrame, sofa_metrics: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fill the SOFA columns of a summary from per-unit, per-day SOFA-2 quantiles.
+
+    `sofa_metrics` has `location_name`, `day` and the `SOFA_COLUMNS` (the
+    `sofa_metrics` stage of `backend.py`); unit-days without a score stay empty.
+    """
+    sofa = sofa_metrics[['location_name', 'day', *SOFA_COLUMNS]].assign(
+        day=pd.to_datetime(sofa_metrics['day']).astype(summary['day'].dtype)
+    )
+    return summary.drop(columns=SOFA_COLUMNS).merge(sofa, on=['location_name', 'day'], how='left')[SUMMARY_COLUMNS]
+
+
+def add_census(summary: pd.DataFrame, census: pd.DataFrame) -> pd.DataFrame:
+    """
+    Replace the census columns of a summary with per-unit, per-day anchor counts.
+
+    `census` has `location_name`, `day` and the `CENSUS_HOURS` columns (counted
+    from the `daily_anchors` snapshot of `backend.py`); unit-days without a
+    row had nobody present.
+    """
+    census = census[['location_name', 'day', *CENSUS_HOURS]].assign(
+        day=pd.to_datetime(census['day']).astype(summary['day'].dtype)
+    )
+    merged = summary.drop(columns=list(CENSUS_HOURS)).merge(census, on=['location_name', 'day'], how='left')
+    merged[list(CENSUS_HOURS)] = merged[list(CENSUS_HOURS)].fillna(0).astype(int)
+    return merged[SUMMARY_COLUMNS]
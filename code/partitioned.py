@@ -0,0 +1,182 @@
+"""
+Partitioned execution of pipeline stages: hash buckets in parallel, or admission-month chunks out of core.
+
+All SAT and SBT logic is partitioned by `hospitalization_id`, so a stage can
+run on disjoint groups of hospitalizations and the results concatenated. The
+stage's input tables are written once as parquet split into buckets, either N
+hash buckets of `hospitalization_id` or one chunk per admission month; a
+process pool then runs the stage's SQL on one bucket per task, each worker
+with its own in-memory DuckDB holding only that bucket, and each bucket's
+output is streamed to parquet before being loaded back into the pipeline
+database.
+
+Peak memory per worker is bounded by the size of one bucket, and by
+`memory_limit / workers` when a memory limit is set (DuckDB spills to the temp
+directory beyond it); the worker count sets how many buckets run at once.
+"""
+
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import duckdb
+
+BUCKET_COLUMN = '_bucket'
+
+
+def _bucket_files(table_dir: str, bucket: int) -> list:
+    return sorted(glob.glob(f"{table_dir}/{BUCKET_COLUMN}={bucket}/*.parquet"))
+
+
+def hash_buckets(buckets: int):
+    """Split hospitalizations into `buckets` hash buckets: (bucket expression, bucket ids, scheme key)."""
+    return f"hash(hospitalization_id) % {buckets}", list(range(buckets)), f"hash:{buckets}"
+
+
+def admission_month_chunks(con, hosp_table: str = 'hosp_df'):
+    """
+    Split hospitalizations by admission month: (bucket expression, bucket ids, scheme key).
+
+    Chunk ids count months since 1970-01 in the session time zone;
+    hospitalizations without an admission time go to chunk -1.
+    """
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE _admission_month_chunks AS
+    FROM {hosp_table}
+    SELECT hospitalization_id
+        , chunk: ANY_VALUE(date_diff('month', DATE '1970-01-01', admission_dttm::DATE))
+    GROUP BY hospitalization_id
+    """)
+    chunks = [c for (c,) in con.execute(
+        "FROM _admission_month_chunks SELECT DISTINCT chunk WHERE chunk IS NOT NULL ORDER BY chunk"
+    ).fetchall()]
+    hosp_key = con.execute("FROM _pipeline_stages SELECT key WHERE name = ?", [hosp_table]).fetchone()
+    bucket_expr = """COALESCE((
+        FROM _admission_month_chunks c
+        SELECT c.chunk
+        WHERE c.hospitalization_id = t.hospitalization_id
+    ), -1)"""
+    return bucket_expr, [-1] + chunks, f"admission_month:{hosp_key[0] if hosp_key else None}"
+
+
+def partition_table(con, table: str, bucket_expr: str, scheme: str, table_dir: str) -> str:
+    """
+    Write `table` as parquet split by `bucket_expr` (evaluated over the table aliased `t`).
+
+    The split is skipped when `table_dir` already holds the same stage (by its
+    key in the pipeline database) split with the same scheme.
+    """
+    stored = con.execute("FROM _pipeline_stages SELECT key WHERE name = ?", [table]).fetchone()
+    marker = Path(table_dir) / '_stage_key'
+    key = f"{stored[0] if stored else None}:{scheme}"
+    if stored is not None and marker.exists() and marker.read_text() == key:
+        return table_dir
+
+    shutil.rmtree(table_dir, ignore_errors=True)
+    Path(table_dir).mkdir(parents=True)
+    con.execute(f"""
+    COPY (
+        FROM {table} t
+        SELECT t.*, {BUCKET_COLUMN}: {bucket_expr}
+    ) TO '{table_dir}' (FORMAT PARQUET, PARTITION_BY ({BUCKET_COLUMN}))
+    """)
+    if not glob.glob(f"{table_dir}/*/*.parquet"):
+        # Empty table: no bucket was written; keep a file with its schema for every bucket to read
+        Path(f"{table_dir}/empty").mkdir()
+        con.execute(f"COPY (FROM {table} LIMIT 0) TO '{table_dir}/empty/empty.parquet' (FORMAT PARQUET)")
+    marker.write_text(key)
+    return table_dir
+
+
+def _run_bucket(query: str, input_dirs: dict, bucket: int, timezone: str, threads: int, out_path: str,
+                memory_limit=None, temp_directory=None) -> int:
+    """Run `query` on one bucket of its inputs in a fresh in-memory DuckDB; returns the output row count."""
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{timezone}'")
+    con.execute(f"SET threads = {threads}")
+    if memory_limit is not None:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    if temp_directory is not None:
+        con.execute(f"SET temp_directory = '{temp_directory}'")
+    for name, table_dir in input_dirs.items():
+        files = _bucket_files(table_dir, bucket)
+        if files:
+            con.execute(f"CREATE VIEW {name} AS FROM read_parquet({files!r})")
+        else:
+            # Empty bucket: keep the table's schema
+            con.execute(f"""
+            CREATE VIEW {name} AS
+            FROM read_parquet('{table_dir}/*/*.parquet', hive_partitioning = false)
+            LIMIT 0
+            """)
+    con.execute(f"COPY ({query}) TO '{out_path}' (FORMAT PARQUET)")
+    n_rows = con.execute(f"FROM '{out_path}' SELECT COUNT(*)").fetchone()[0]
+    con.close()
+    return n_rows
+
+
+def run_partitioned(con, name: str, query: str, tables: dict, partitioning, workers: int,
+                    work_dir: str, timezone: str, memory_limit=None, temp_directory=None) -> None:
+    """
+    Build table `name` from `query` by running it on each bucket in a process pool.
+
+    `tables` maps each table name used in `query` to the pipeline table that
+    provides it, and `partitioning` is the output of `hash_buckets` or
+    `admission_month_chunks`. `memory_limit` is split evenly across workers.
+    Output row order across buckets is not preserved.
+    """
+    bucket_expr, buckets, scheme = partitioning
+    input_dirs = {
+        query_name: partition_table(con, table, bucket_expr, scheme, f"{work_dir}/inputs/{table}")
+        for query_name, table in tables.items()
+    }
+    out_dir = Path(work_dir) / 'outputs' / name
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    worker_memory = None if memory_limit is None else f"{parse_memory(memory_limit) // workers}B"
+    # Spawned workers do not inherit the parent's open database
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        futures = [
+            pool.submit(
+                _run_bucket, query, input_dirs, b, timezone, threads, str(out_dir / f"bucket_{b}.parquet"),
+                worker_memory, None if temp_directory is None else f"{temp_directory}/{name}_bucket_{b}",
+            )
+            for b in buckets
+        ]
+        n_rows = sum(f.result() for f in futures)
+
+    con.execute(f"CREATE OR REPLACE TABLE {name} AS FROM read_parquet('{out_dir}/*.parquet')")
+    print(f"Ran {name} in {len(buckets)} buckets on {workers} workers: {n_rows:,} rows")
+
+
+def parse_memory(limit: str) -> int:
+    """Bytes in a DuckDB-style memory size such as '8GB' or '512MiB'."""
+    units = {'b': 1, 'kb': 10**3, 'mb': 10**6, 'gb': 10**9, 'tb': 10**12,
+             'kib': 2**10, 'mib': 2**20, 'gib': 2**30, 'tib': 2**40}
+    number = limit.strip().lower().rstrip('abcdefghijklmnopqrstuvwxyz ')
+    unit = limit.strip().lower()[len(number):].strip() or 'b'
+    return int(float(number) * units[unit])
+
+
+def partitioned_build(tables: dict, buckets: int, workers: int, work_dir: str, timezone: str,
+                      chunk_by_admission_month: bool = False, memory_limit=None, temp_directory=None):
+    """
+    A `build` for `pipeline_db.materialize` that runs the stage with `run_partitioned`.
+
+    Buckets are admission months when `chunk_by_admission_month` is set, and
+    `buckets` hash buckets otherwise. Returns None (build the table in one
+    query) when neither applies.
+    """
+    if not chunk_by_admission_month and buckets <= 1:
+        return None
+
+    def build(con, name, query):
+        partitioning = admission_month_chunks(con) if chunk_by_admission_month else hash_buckets(buckets)
+        run_partitioned(con, name, query, tables, partitioning, workers, work_dir, timezone,
+                        memory_limit, temp_directory)
+    return build
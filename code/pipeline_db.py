@@ -0,0 +1,120 @@
+"""
+Persistent DuckDB database for the `backend.py` pipeline.
+
+The CLIF parquet files are exposed as views, and every intermediate stage
+(loaded base tables, SAT/SBT events and day-level results) is materialized as
+a table in one database file. Each stage is stored with a key built from its
+SQL text and the inputs it was computed from; when a restart finds the same
+key, the table is reused instead of recomputed. Any change to a source file,
+the reporting period or the refresh cohort changes the keys and rebuilds the
+affected stages.
+
+The database file is locked while a connection is open, so only one pipeline
+run can use it at a time.
+"""
+
+import functools
+import hashlib
+import json
+from pathlib import Path
+
+import duckdb
+
+
+def connect(db_path, timezone: str, memory_limit=None, temp_directory=None) -> duckdb.DuckDBPyConnection:
+    """
+    Open (or create) the pipeline database with the site's time zone.
+
+    With `memory_limit` (e.g. '8GB') DuckDB keeps its memory use under the
+    limit and spills sorts, joins and aggregations to `temp_directory`.
+    """
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect(str(db_path))
+    # Dates and 7 AM anchors in SQL are evaluated in the site's local time
+    con.execute(f"SET TimeZone = '{timezone}'")
+    if memory_limit is not None:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    if temp_directory is not None:
+        Path(temp_directory).mkdir(parents=True, exist_ok=True)
+        con.execute(f"SET temp_directory = '{temp_directory}'")
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS _pipeline_stages (
+        name VARCHAR PRIMARY KEY,
+        key VARCHAR,
+        built_at TIMESTAMPTZ
+    )
+    """)
+    return con
+
+
+@functools.lru_cache(maxsize=None)
+def _read_sql(path: str, mtime_ns: int) -> str:
+    return Path(path).read_text()
+
+
+def read_sql(path) -> str:
+    """SQL text of a script, read from disk once per version of the file."""
+    return _read_sql(str(path), Path(path).stat().st_mtime_ns)
+
+
+def file_fingerprint(paths) -> dict:
+    """Size and modification time of each source file, for stage keys."""
+    fingerprint = {}
+    for path in paths:
+        stat = Path(path).stat()
+        fingerprint[str(path)] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+def stage_key(*parts) -> str:
+    """Stable hash of JSON-serializable parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def create_views(con, sources: dict) -> None:
+    """Expose each `{view name: parquet path}` as a view over the file."""
+    for name, path in sources.items():
+        con.execute(f"CREATE OR REPLACE VIEW {name} AS FROM '{path}'")
+
+
+def _input_keys(con, inputs) -> list:
+    """Stage keys of upstream tables (passed as relations); other inputs are kept as given."""
+    return [
+        con.execute("FROM _pipeline_stages SELECT key WHERE name = ?", [x.alias]).fetchone()[0]
+        if isinstance(x, duckdb.DuckDBPyRelation) else x
+        for x in inputs
+    ]
+
+
+def materialize(con, name: str, query: str, inputs, build=None) -> duckdb.DuckDBPyRelation:
+    """
+    Store the result of `query` as table `name`, unless it already holds the result for the same inputs.
+
+    `inputs` lists everything the result depends on besides the SQL text:
+    upstream stages (the relations returned by `materialize`, whose own keys
+    are used) and plain values such as source fingerprints or the cohort.
+    `build(con, name, query)` replaces the default `CREATE TABLE ... AS` (e.g.
+    to run the query in parallel partitions). Returns the table.
+    """
+    query = query.strip().rstrip(';')
+    key = stage_key(query, _input_keys(con, inputs))
+    stored = con.execute(
+        """
+        FROM _pipeline_stages s
+        SEMI JOIN duckdb_tables() t
+            ON t.table_name = s.name AND t.schema_name = 'main' AND NOT t.temporary
+        SELECT key
+        WHERE s.name = ?
+        """,
+        [name],
+    ).fetchone()
+    if stored is None or stored[0] != key:
+        if build is None:
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS {query}")
+        else:
+            build(con, name, query)
+        con.execute("INSERT OR REPLACE INTO _pipeline_stages VALUES (?, ?, now())", [name, key])
+        print(f"Materialized {name}")
+    else:
+        print(f"Reused {name}")
+    return con.table(name)
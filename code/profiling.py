@@ -0,0 +1,148 @@
+"""
+Run log of pipeline stages: wall time, rows in and out, peak memory and DuckDB query profiles.
+
+`backend.py` and `app.py` wrap each load and aggregation step in a `RunLog`.
+Every stage appends one record; SQL stages built in the pipeline database
+also save DuckDB's query profile (the per-operator timings and cardinalities
+that `EXPLAIN ANALYZE` reports) as JSON, and the record lists the CPU time of
+each materialized CTE in it. After every stage the run is written to
+`{log_dir}/{component}_{run id}/` as `run_log.json` (records) and
+`run_log.parquet` (one row per stage), so all runs can be compared with
+
+    FROM read_parquet('output/intermediate/{site}_run_logs/*/run_log.parquet')
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from pipeline_db import materialize as _materialize
+
+# Columns of run_log.parquet, the same for every run
+RECORD_COLUMNS = {
+    'run_id': 'string', 'component': 'string', 'stage': 'string', 'started_at': 'string', 'status': 'string',
+    'rows_in': 'Int64', 'rows_out': 'Int64', 'wall_s': 'float64', 'cpu_s': 'float64',
+    'peak_rss_mb': 'float64', 'peak_rss_children_mb': 'float64', 'duckdb_peak_memory_mb': 'float64',
+    'profile': 'string', 'cte_cpu_s': 'string',
+}
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished child processes (MB), or None."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in KB on Linux
+    return tuple(resource.getrusage(who).ru_maxrss / 1024 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def cte_timings(profile: dict) -> dict:
+    """CPU seconds spent computing each materialized CTE in a DuckDB JSON query profile."""
+    timings = {}
+    stack = [profile]
+    while stack:
+        node = stack.pop()
+        children = node.get('children', [])
+        name = node.get('extra_info', {}).get('CTE Name')
+        if node.get('operator_type') == 'CTE' and name and children:
+            # The first child computes the CTE, the second is the query that reads it
+            timings[name] = timings.get(name, 0) + children[0].get('cpu_time', 0)
+        stack.extend(children)
+    return timings
+
+
+class RunLog:
+    """Stage records of one run of `component`, saved under `log_dir`."""
+
+    def __init__(self, log_dir, component: str, profile_queries: bool = True):
+        self.run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.component = component
+        self.run_dir = Path(log_dir) / f"{component}_{self.run_id}"
+        self.profile_queries = profile_queries
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        """
+        Time the enclosed step and record it as stage `name`.
+
+        Yields the record; set `record['rows_out']` (or any other field) inside
+        the block.
+        """
+        record = {
+            'run_id': self.run_id,
+            'component': self.component,
+            'stage': name,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'status': 'ran',
+            'rows_in': rows_in,
+            'rows_out': None,
+        }
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['status'] = 'failed'
+            raise
+        finally:
+            record['wall_s'] = round(time.perf_counter() - start, 4)
+            record['peak_rss_mb'], record['peak_rss_children_mb'] = peak_rss_mb()
+            self.records.append(record)
+            self.save()
+
+    def materialize(self, con, name: str, query: str, inputs, build=None) -> duckdb.DuckDBPyRelation:
+        """
+        `pipeline_db.materialize`, recorded as a stage.
+
+        Rows in are the rows of the upstream stages among `inputs`. When the
+        table is rebuilt in one query, DuckDB profiles it into
+        `{name}.profile.json`; partitioned builds run in worker processes and
+        record only time, rows and memory.
+        """
+        upstream = [x for x in inputs if isinstance(x, duckdb.DuckDBPyRelation)]
+        with self.stage(name, sum(x.shape[0] for x in upstream) if upstream else None) as record:
+            record['status'] = 'reused'
+
+            def logged_build(con, name, query):
+                if build is not None:
+                    record['status'] = 'built (partitioned)'
+                    build(con, name, query)
+                    return
+                record['status'] = 'built'
+                if not self.profile_queries:
+                    con.execute(f"CREATE OR REPLACE TABLE {name} AS {query}")
+                    return
+                self.run_dir.mkdir(parents=True, exist_ok=True)
+                profile_path = self.run_dir / f"{name}.profile.json"
+                con.execute("SET enable_profiling = 'json'")
+                con.execute(f"SET profiling_output = '{profile_path}'")
+                try:
+                    con.execute(f"CREATE OR REPLACE TABLE {name} AS {query}")
+                finally:
+                    con.execute("PRAGMA disable_profiling")
+                profile = json.loads(profile_path.read_text())
+                record['profile'] = profile_path.name
+                record['cpu_s'] = round(profile.get('cpu_time', 0), 4)
+                record['duckdb_peak_memory_mb'] = round(profile.get('system_peak_buffer_memory', 0) / 2**20, 1)
+                record['cte_cpu_s'] = {k: round(v, 4) for k, v in cte_timings(profile).items()}
+
+            table = _materialize(con, name, query, inputs, logged_build)
+            record['rows_out'] = table.shape[0]
+        return table
+
+    def save(self) -> None:
+        """Write the records so far to `run_log.json` and `run_log.parquet`."""
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        (self.run_dir / 'run_log.json').write_text(json.dumps(self.records, indent=2, default=str))
+        table = pd.DataFrame(self.records).reindex(columns=list(RECORD_COLUMNS))
+        table['cte_cpu_s'] = table['cte_cpu_s'].map(lambda x: json.dumps(x) if isinstance(x, dict) else None)
+        table.astype(RECORD_COLUMNS).to_parquet(self.run_dir / 'run_log.parquet', index=False)
@@ -0,0 +1,169 @@
+"""
+Incremental refresh of the backend outputs with a high-water mark.
+
+After a full run, `backend.py` stores the latest timestamp seen in each source
+table (the watermark). On the next run only rows newer than the watermark are
+looked at: the clinical days they touch are recomputed for every
+hospitalization present in an ICU on those days, and the results are merged
+into the existing outputs.
+
+All SAT/SBT logic is partitioned by `hospitalization_id`, so running the
+pipeline on that cohort reproduces the full-history rows exactly. Rows that
+arrive late with timestamps older than the watermark are not detected; delete
+the watermark file to force a full rebuild.
+"""
+
+import json
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+
+def watermark_sources(data_dir: str, resp_p_path: str) -> dict:
+    """Source tables and the timestamp columns whose new values trigger a refresh."""
+    return {
+        "adt": (f"{data_dir}/clif_adt.parquet", ["in_dttm", "out_dttm"]),
+        "hospitalization": (f"{data_dir}/clif_hospitalization.parquet", ["admission_dttm", "discharge_dttm"]),
+        "code_status": (f"{data_dir}/clif_code_status.parquet", ["start_dttm"]),
+        "vitals": (f"{data_dir}/clif_vitals.parquet", ["recorded_dttm"]),
+        "labs": (f"{data_dir}/clif_labs.parquet", ["lab_collect_dttm"]),
+        "patient_assessments": (f"{data_dir}/clif_patient_assessments.parquet", ["recorded_dttm"]),
+        "medication_admin_continuous": (f"{data_dir}/clif_medication_admin_continuous.parquet", ["admin_dttm"]),
+        "resp_p": (resp_p_path, ["recorded_dttm"]),
+    }
+
+
+def read_watermark(watermark_path):
+    """Watermark of the last run as {source: {column: timestamp string}}, or None."""
+    watermark_path = Path(watermark_path)
+    if not watermark_path.exists():
+        return None
+    return json.loads(watermark_path.read_text())
+
+
+def current_watermark(sources: dict, con=None) -> dict:
+    """Latest value of every watermark column in the current extract."""
+    con = con or duckdb
+    watermark = {}
+    for source, (path, columns) in sources.items():
+        row = con.sql(f"FROM '{path}' SELECT {', '.join(f'MAX({c})' for c in columns)}").fetchone()
+        watermark[source] = {c: None if v is None else str(pd.Timestamp(v)) for c, v in zip(columns, row)}
+    return watermark
+
+
+def write_watermark(watermark_path, watermark: dict) -> None:
+    Path(watermark_path).write_text(json.dumps(watermark, indent=2))
+
+
+def extract_end(watermark: dict):
+    """Latest timestamp of any watermark column: the end of the extract, where open ADT segments stop."""
+    marks = [pd.Timestamp(v) for columns in watermark.values() for v in columns.values() if v is not None]
+    return max(marks) if marks else None
+
+
+def _newer_than(column: str, mark) -> str:
+    return f"{column} IS NOT NULL" + (f" AND {column} > '{mark}'::TIMESTAMPTZ" if mark else "")
+
+
+def refresh_scope(sources: dict, watermark: dict, con=None, end=None):
+    """
+    Find what a refresh has to recompute.
+
+    Returns `(refresh_days, refresh_hosp_ids)`: the clinical days touched by rows
+    newer than the watermark, and the hospitalizations with new rows plus every
+    hospitalization in an ICU on any of those days. The day before each new row
+    is included because SBT outcomes look 24 hours ahead of an extubation.
+
+    ADT segments with no `out_dttm` run to `end`, the end of the current extract
+    (taken from the sources when not given). Their days after the end of the
+    previous extract are touched as well, since the patient is still there.
+    """
+    con = con or duckdb
+    end = end if end is not None else extract_end(current_watermark(sources, con))
+    last_end = extract_end(watermark)
+    new_rows = [
+        f"SELECT hospitalization_id, dttm: {c} FROM '{path}' WHERE {_newer_than(c, watermark.get(source, {}).get(c))}"
+        for source, (path, columns) in sources.items()
+        for c in columns
+    ]
+    adt_path = sources["adt"][0]
+    adt_mark = watermark.get("adt", {})
+
+    q_scope = f"""
+    WITH new_rows AS (
+        {' UNION ALL '.join(new_rows)}
+    )
+    , adt_days AS (
+        FROM '{adt_path}'
+        SELECT hospitalization_id
+            , location_category
+            , in_dttm
+            , out_dttm
+            , day: UNNEST(generate_series(
+                (in_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+                , (COALESCE(out_dttm, '{end}'::TIMESTAMPTZ)::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+                , INTERVAL 1 DAY
+            ))::DATE
+        WHERE in_dttm IS NOT NULL
+    )
+    , touched_days AS (
+        SELECT DISTINCT day: UNNEST(generate_series(
+            (dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE - 1
+            , (dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+            , INTERVAL 1 DAY
+        ))::DATE
+        FROM new_rows
+        UNION
+        -- A new ADT segment touches every day it spans, not only the days of its endpoints
+        SELECT day
+        FROM adt_days
+        WHERE ({_newer_than('in_dttm', adt_mark.get('in_dttm'))})
+            OR ({_newer_than('out_dttm', adt_mark.get('out_dttm'))})
+        UNION
+        -- An open segment gains the days since the previous extract ended
+        SELECT day
+        FROM adt_days
+        WHERE out_dttm IS NULL
+            {f"AND day > ('{last_end}'::TIMESTAMPTZ::TIMESTAMP - INTERVAL 7 HOUR)::DATE" if last_end is not None else ""}
+    )
+    """
+    refresh_days = pd.DatetimeIndex(
+        con.sql(q_scope + "FROM touched_days SELECT day ORDER BY day").df()['day']
+    ).astype('datetime64[ns]')
+    refresh_hosp_ids = con.sql(q_scope + """
+    SELECT hospitalization_id
+    FROM adt_days
+    SEMI JOIN touched_days USING (day)
+    WHERE LOWER(location_category) = 'icu'
+    UNION
+    SELECT hospitalization_id
+    FROM new_rows
+    """).df()['hospitalization_id']
+    return refresh_days, refresh_hosp_ids
+
+
+def merge_hospitalizations(path, new_df: pd.DataFrame, refresh_hosp_ids) -> pd.DataFrame:
+    """Replace the refreshed hospitalizations' rows in an existing hospitalization-level output."""
+    if refresh_hosp_ids is None or not Path(path).exists():
+        return new_df
+    existing = pd.read_parquet(path)
+    kept = existing[~existing['hospitalization_id'].isin(refresh_hosp_ids)]
+    return pd.concat([kept, new_df], ignore_index=True)
+
+
+def merge_unit_days(path, new_df: pd.DataFrame, refresh_days) -> pd.DataFrame:
+    """
+    Replace the refreshed days' rows in an existing per-unit, per-day output.
+
+    All saved rows of the refreshed days are dropped, so `new_df` must hold every
+    row those days have in a full run: dense tables (the overall summary) need a
+    row for every unit, including units none of the refreshed patients were in.
+    """
+    if refresh_days is None or not Path(path).exists():
+        return new_df
+    existing = pd.read_parquet(path)
+    existing['location_name'] = existing['location_name'].astype(str)
+    kept = existing[~pd.to_datetime(existing['day']).isin(refresh_days)]
+    refreshed = new_df[pd.to_datetime(new_df['day']).isin(refresh_days)]
+    return pd.concat([kept, refreshed], ignore_index=True)[new_df.columns].sort_values(['location_name', 'day'])
@@ -3,7 +3,8 @@
 --
 -- Required input tables (raw CLIF tables):
 --   - resp_df: respiratory_support table with device_category, recorded_dttm
---   - meds_df: medication_admin_continuous pivoted wide with sedation/paralytic columns
+--   - meds_df: medication_admin_continuous dose change points per drug (long), with med_group
+--     'opioid', 'sedative' (sedation is either) or 'paralytic'
 --   - rass_df: patient_assessments filtered to RASS
 --   - adt_df: ADT table with location_category
 --   - hosp_df: hospitalization table
@@ -21,29 +22,41 @@ WITH base_times AS (
     SELECT hospitalization_id, in_dttm AS event_dttm FROM adt_df
 )
 
+-- Step 0b: Medication state at every dose change; each drug the hospitalization received is
+-- looked up as of the change time, so every drug's dose is carried forward on its own
+, med_state AS (
+    FROM (FROM meds_df SELECT DISTINCT hospitalization_id, recorded_dttm) c
+    JOIN (FROM meds_df SELECT DISTINCT hospitalization_id, med_category, med_group) d
+        ON d.hospitalization_id = c.hospitalization_id
+    ASOF LEFT JOIN meds_df m
+        ON m.hospitalization_id = c.hospitalization_id
+        AND m.med_category = d.med_category
+        AND m.recorded_dttm <= c.recorded_dttm
+    SELECT c.hospitalization_id
+        , c.recorded_dttm
+        , COALESCE(MAX(m.med_dose) FILTER (WHERE d.med_group IN ('opioid', 'sedative')), 0) AS max_sedation_dose
+        , MIN(m.med_dose) FILTER (WHERE d.med_group IN ('opioid', 'sedative') AND m.med_dose > 0)
+            AS min_sedation_dose_active
+        , COALESCE(MAX(m.med_dose) FILTER (WHERE d.med_group = 'sedative'), 0) AS max_non_opioid_dose
+        , COALESCE(MAX(m.med_dose) FILTER (WHERE d.med_group = 'paralytic'), 0) AS max_paralytics
+    GROUP BY c.hospitalization_id, c.recorded_dttm
+)
+
 -- Step 1: Build unified timeline with forward-filled values
 , t1 AS (
     SELECT
         bt.hospitalization_id
         , bt.event_dttm
         , bt.event_dttm::DATE AS event_date
-        , CONCAT(bt.hospitalization_id, '_', bt.event_dttm::DATE) AS hosp_id_day_key
 
         -- Respiratory support (forward-filled)
         , r.device_category
 
-        -- Sedation medications (forward-filled, NULL treated as 0 for comparison)
-        , COALESCE(m.fentanyl, 0) AS fentanyl
-        , COALESCE(m.propofol, 0) AS propofol
-        , COALESCE(m.lorazepam, 0) AS lorazepam
-        , COALESCE(m.midazolam, 0) AS midazolam
-        , COALESCE(m.hydromorphone, 0) AS hydromorphone
-        , COALESCE(m.morphine, 0) AS morphine
-
-        -- Paralytic medications (forward-filled)
-        , COALESCE(m.cisatracurium, 0) AS cisatracurium
-        , COALESCE(m.vecuronium, 0) AS vecuronium
-        , COALESCE(m.rocuronium, 0) AS rocuronium
+        -- Medication state (forward-filled per drug, 0 before the first dose)
+        , COALESCE(m.max_sedation_dose, 0) AS max_sedation_dose
+        , m.min_sedation_dose_active
+        , COALESCE(m.max_non_opioid_dose, 0) AS max_non_opioid_dose
+        , COALESCE(m.max_paralytics, 0) AS max_paralytics
 
         -- RASS score
         , ra.rass
@@ -55,7 +68,7 @@ WITH base_times AS (
     ASOF LEFT JOIN resp_df r
         ON r.hospitalization_id = bt.hospitalization_id
         AND r.recorded_dttm <= bt.event_dttm
-    ASOF LEFT JOIN meds_df m
+    ASOF LEFT JOIN med_state m
         ON m.hospitalization_id = bt.hospitalization_id
         AND m.recorded_dttm <= bt.event_dttm
     ASOF LEFT JOIN rass_df ra
@@ -69,40 +82,17 @@ WITH base_times AS (
 -- Step 2: Compute derived sedation/paralytic metrics
 , t2 AS (
     SELECT *
-        -- Minimum sedation dose (any active sedation)
-        , LEAST(
-            NULLIF(fentanyl, 0),
-            NULLIF(propofol, 0),
-            NULLIF(lorazepam, 0),
-            NULLIF(midazolam, 0),
-            NULLIF(hydromorphone, 0),
-            NULLIF(morphine, 0)
-        ) AS min_sedation_dose_active
-
         -- Check if ANY sedation is active (dose > 0)
-        , CASE WHEN fentanyl > 0 OR propofol > 0 OR lorazepam > 0
-               OR midazolam > 0 OR hydromorphone > 0 OR morphine > 0
-          THEN 1 ELSE 0 END AS has_active_sedation
+        , CASE WHEN max_sedation_dose > 0 THEN 1 ELSE 0 END AS has_active_sedation
 
         -- Non-opioid sedatives only (propofol, lorazepam, midazolam)
-        , CASE WHEN propofol > 0 OR lorazepam > 0 OR midazolam > 0
-          THEN 1 ELSE 0 END AS has_active_non_opioid_sedation
-
-        -- Max paralytic dose
-        , GREATEST(
-            COALESCE(cisatracurium, 0),
-            COALESCE(vecuronium, 0),
-            COALESCE(rocuronium, 0)
-        ) AS max_paralytics
+        , CASE WHEN max_non_opioid_dose > 0 THEN 1 ELSE 0 END AS has_active_non_opioid_sedation
 
         -- All sedation meds are zero/null
-        , CASE WHEN fentanyl <= 0 AND propofol <= 0 AND lorazepam <= 0
-               AND midazolam <= 0 AND hydromorphone <= 0 AND morphine <= 0
-          THEN 1 ELSE 0 END AS all_sedation_zero
+        , CASE WHEN max_sedation_dose <= 0 THEN 1 ELSE 0 END AS all_sedation_zero
 
         -- Non-opioid sedatives are zero/null
-        , CASE WHEN propofol <= 0 AND lorazepam <= 0 AND midazolam <= 0
-          THEN 1 ELSE 0 END AS non_opioid_sedation_zero
+        , CASE WHEN max_non_opioid_dose <= 0 THEN 1 ELSE 0 END AS non_opioid_sedation_zero
 
     FROM t1
 )
@@ -112,8 +102,8 @@ WITH base_times AS (
 , t3 AS (
     SELECT *
         , CASE
-            WHEN LOWER(device_category) = 'imv'
-                AND LOWER(location_category) = 'icu'
+            WHEN device_category = 'imv'
+                AND location_category = 'icu'
                 AND has_active_sedation = 1
                 AND max_paralytics <= 0
             THEN 1 ELSE 0
@@ -166,8 +156,7 @@ WITH base_times AS (
 , overnight_eligibility AS (
     SELECT DISTINCT
         e.hospitalization_id
-        , e.block_start_dttm::DATE + INTERVAL 1 DAY AS eligible_date  -- The "next day" that this overnight qualifies
-        , CONCAT(e.hospitalization_id, '_', (e.block_start_dttm::DATE + INTERVAL 1 DAY)) AS hosp_id_day_key
+        , e.block_start_dttm::DATE + 1 AS eligible_date  -- The "next day" that this overnight qualifies
         , 1 AS sat_eligible
     FROM eligibility_blocks_with_duration e
     WHERE e.block_duration_mins >= 240  -- 4 hours
@@ -198,212 +187,155 @@ WITH base_times AS (
           END AS _non_opioid_cessation_event
     FROM t5
     LEFT JOIN overnight_eligibility oe
-        ON t5.hosp_id_day_key = oe.hosp_id_day_key
+        ON oe.hospitalization_id = t5.hospitalization_id
+        AND oe.eligible_date = t5.event_date
     WINDOW w AS (PARTITION BY t5.hospitalization_id ORDER BY event_dttm)
 )
 
--- Step 8: Compute SAT flags using window functions for time-based lookups
+-- Step 8: Forward/backward time-window aggregates for every event
+-- Window frames over event_dttm replace per-row correlated lookups into t6.
+-- (event_dttm is unique per hospitalization, so EXCLUDE CURRENT ROW gives open intervals.)
+, t7 AS (
+    SELECT *
+        -- (t, t + 30 min]: rows where sedation is active or the patient is off IMV / out of the ICU
+        , COUNT(*) FILTER (
+            WHERE has_active_sedation = 1
+                OR device_category != 'imv'
+                OR location_category != 'icu'
+          ) OVER fw30 AS _fw30_sedation_or_off_imv_icu
+        , COUNT(*) FILTER (
+            WHERE has_active_non_opioid_sedation = 1
+                OR device_category != 'imv'
+                OR location_category != 'icu'
+          ) OVER fw30 AS _fw30_non_opioid_or_off_imv_icu
+        , COUNT(*) FILTER (WHERE has_active_sedation = 1) OVER fw30 AS _fw30_sedation
+        , COALESCE(MAX(max_sedation_dose) OVER fw30, 0)
+            AS _fw30_max_sedation_dose
+
+        -- [t, t + 30 min]: RASS measurements and negative RASS measurements
+        , COUNT(rass) OVER fw30_incl AS _fw30_rass_n
+        , COUNT(*) FILTER (WHERE rass < 0) OVER fw30_incl AS _fw30_rass_neg_n
+
+        -- [t, t + 45 min]: last RASS measurement
+        , LAST_VALUE(rass IGNORE NULLS) OVER fw45_incl AS _fw45_last_rass
+
+        -- [t - 30 min, t): max sedation dose and first RASS measurement
+        , COALESCE(MAX(max_sedation_dose) OVER pr30, 0)
+            AS _pr30_max_sedation_dose
+        , FIRST_VALUE(rass IGNORE NULLS) OVER pr30 AS _pr30_first_rass
+    FROM t6
+    WINDOW
+        fw30 AS (PARTITION BY hospitalization_id ORDER BY event_dttm
+            RANGE BETWEEN CURRENT ROW AND INTERVAL 30 MINUTE FOLLOWING EXCLUDE CURRENT ROW)
+        , fw30_incl AS (PARTITION BY hospitalization_id ORDER BY event_dttm
+            RANGE BETWEEN CURRENT ROW AND INTERVAL 30 MINUTE FOLLOWING)
+        , fw45_incl AS (PARTITION BY hospitalization_id ORDER BY event_dttm
+            RANGE BETWEEN CURRENT ROW AND INTERVAL 45 MINUTE FOLLOWING)
+        , pr30 AS (PARTITION BY hospitalization_id ORDER BY event_dttm
+            RANGE BETWEEN INTERVAL 30 MINUTE PRECEDING AND CURRENT ROW EXCLUDE CURRENT ROW)
+)
+
+-- Step 9: Compute SAT flags from the window aggregates
 -- For each potential SAT event, check conditions in forward/backward windows
 , t_events AS (
     SELECT
-        t6.hospitalization_id
-        , t6.event_dttm
-        , t6.event_date
-        , t6.hosp_id_day_key
-        , t6.device_category
-        , t6.location_category
-        , t6.fentanyl, t6.propofol, t6.lorazepam, t6.midazolam, t6.hydromorphone, t6.morphine
-        , t6.rass
-        , t6.has_active_sedation
-        , t6.all_sedation_zero
-        , t6.non_opioid_sedation_zero
-        , t6.max_paralytics
-        , t6.sat_eligible
-        , t6._sedation_cessation_event
-        , t6._non_opioid_cessation_event
+        t7.hospitalization_id
+        , t7.event_dttm
+        , t7.event_date
+        , t7.device_category
+        , t7.location_category
+        , t7.max_sedation_dose
+        , t7.rass
+        , t7.has_active_sedation
+        , t7.all_sedation_zero
+        , t7.non_opioid_sedation_zero
+        , t7.max_paralytics
+        , t7.sat_eligible
+        , t7._sedation_cessation_event
+        , t7._non_opioid_cessation_event
 
         -- Flag 1: SAT_EHR_delivery
         -- All sedation meds = 0 for 30 min forward window, patient on IMV+ICU
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._sedation_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
-                AND NOT EXISTS (
-                    SELECT 1 FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm > t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                      AND (t_fw.has_active_sedation = 1
-                           OR LOWER(t_fw.device_category) != 'imv'
-                           OR LOWER(t_fw.location_category) != 'icu')
-                )
+            WHEN t7.sat_eligible = 1
+                AND t7._sedation_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
+                AND t7._fw30_sedation_or_off_imv_icu = 0
             THEN 1 ELSE 0
           END AS SAT_EHR_delivery
 
         -- Flag 2: SAT_modified_delivery
         -- Non-opioid sedatives (propofol, lorazepam, midazolam) = 0 for 30 min, patient on IMV+ICU
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._non_opioid_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
-                AND NOT EXISTS (
-                    SELECT 1 FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm > t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                      AND (t_fw.has_active_non_opioid_sedation = 1
-                           OR LOWER(t_fw.device_category) != 'imv'
-                           OR LOWER(t_fw.location_category) != 'icu')
-                )
+            WHEN t7.sat_eligible = 1
+                AND t7._non_opioid_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
+                AND t7._fw30_non_opioid_or_off_imv_icu = 0
             THEN 1 ELSE 0
           END AS SAT_modified_delivery
 
         -- Flag 3: SAT_rass_nonneg_30
         -- All RASS measurements in next 30 min are >= 0
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._sedation_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
-                AND EXISTS (
-                    SELECT 1 FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm >= t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                      AND t_fw.rass IS NOT NULL
-                )
-                AND NOT EXISTS (
-                    SELECT 1 FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm >= t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                      AND t_fw.rass IS NOT NULL
-                      AND t_fw.rass < 0
-                )
+            WHEN t7.sat_eligible = 1
+                AND t7._sedation_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
+                AND t7._fw30_rass_n > 0
+                AND t7._fw30_rass_neg_n = 0
             THEN 1 ELSE 0
           END AS SAT_rass_nonneg_30
 
         -- Flag 4: SAT_med_halved_rass_pos
         -- Sedation reduced by >= 50% from prior 30 min AND last RASS in 45 min >= 0
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._sedation_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
+            WHEN t7.sat_eligible = 1
+                AND t7._sedation_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
                 -- Check if last RASS in 45 min is >= 0
-                AND (
-                    SELECT t_fw.rass
-                    FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm >= t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 45 MINUTE
-                      AND t_fw.rass IS NOT NULL
-                    ORDER BY t_fw.event_dttm DESC
-                    LIMIT 1
-                ) >= 0
+                AND t7._fw45_last_rass >= 0
                 -- Check if meds are halved (forward max <= 50% of prior max)
-                AND (
-                    SELECT GREATEST(
-                        COALESCE(MAX(t_fw.fentanyl), 0),
-                        COALESCE(MAX(t_fw.propofol), 0),
-                        COALESCE(MAX(t_fw.lorazepam), 0),
-                        COALESCE(MAX(t_fw.midazolam), 0),
-                        COALESCE(MAX(t_fw.hydromorphone), 0),
-                        COALESCE(MAX(t_fw.morphine), 0)
-                    )
-                    FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm > t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                ) <= 0.5 * (
-                    SELECT GREATEST(
-                        COALESCE(MAX(t_pr.fentanyl), 0),
-                        COALESCE(MAX(t_pr.propofol), 0),
-                        COALESCE(MAX(t_pr.lorazepam), 0),
-                        COALESCE(MAX(t_pr.midazolam), 0),
-                        COALESCE(MAX(t_pr.hydromorphone), 0),
-                        COALESCE(MAX(t_pr.morphine), 0)
-                    )
-                    FROM t6 t_pr
-                    WHERE t_pr.hospitalization_id = t6.hospitalization_id
-                      AND t_pr.event_dttm >= t6.event_dttm - INTERVAL 30 MINUTE
-                      AND t_pr.event_dttm < t6.event_dttm
-                )
+                AND t7._fw30_max_sedation_dose <= 0.5 * t7._pr30_max_sedation_dose
             THEN 1 ELSE 0
           END AS SAT_med_halved_rass_pos
 
         -- Flag 5: SAT_no_meds_rass_pos_45
         -- No sedation meds for 30 min AND last RASS in 45 min >= 0
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._sedation_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
+            WHEN t7.sat_eligible = 1
+                AND t7._sedation_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
                 -- No meds for 30 min (same as SAT_EHR_delivery condition)
-                AND NOT EXISTS (
-                    SELECT 1 FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm > t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 30 MINUTE
-                      AND t_fw.has_active_sedation = 1
-                )
+                AND t7._fw30_sedation = 0
                 -- Last RASS in 45 min >= 0
-                AND (
-                    SELECT t_fw.rass
-                    FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm >= t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 45 MINUTE
-                      AND t_fw.rass IS NOT NULL
-                    ORDER BY t_fw.event_dttm DESC
-                    LIMIT 1
-                ) >= 0
+                AND t7._fw45_last_rass >= 0
             THEN 1 ELSE 0
           END AS SAT_no_meds_rass_pos_45
 
         -- Flag 6: SAT_rass_first_neg_30_last45_nonneg
         -- First RASS in prior 30 min < 0 AND last RASS in next 45 min >= 0
         , CASE
-            WHEN t6.sat_eligible = 1
-                AND t6._sedation_cessation_event = 1
-                AND LOWER(t6.device_category) = 'imv'
-                AND LOWER(t6.location_category) = 'icu'
-                -- First RASS in prior 30 min < 0
-                AND (
-                    SELECT t_pr.rass
-                    FROM t6 t_pr
-                    WHERE t_pr.hospitalization_id = t6.hospitalization_id
-                      AND t_pr.event_dttm >= t6.event_dttm - INTERVAL 30 MINUTE
-                      AND t_pr.event_dttm < t6.event_dttm
-                      AND t_pr.rass IS NOT NULL
-                    ORDER BY t_pr.event_dttm ASC
-                    LIMIT 1
-                ) < 0
-                -- Last RASS in next 45 min >= 0
-                AND (
-                    SELECT t_fw.rass
-                    FROM t6 t_fw
-                    WHERE t_fw.hospitalization_id = t6.hospitalization_id
-                      AND t_fw.event_dttm >= t6.event_dttm
-                      AND t_fw.event_dttm <= t6.event_dttm + INTERVAL 45 MINUTE
-                      AND t_fw.rass IS NOT NULL
-                    ORDER BY t_fw.event_dttm DESC
-                    LIMIT 1
-                ) >= 0
+            WHEN t7.sat_eligible = 1
+                AND t7._sedation_cessation_event = 1
+                AND t7.device_category = 'imv'
+                AND t7.location_category = 'icu'
+                AND t7._pr30_first_rass < 0
+                AND t7._fw45_last_rass >= 0
             THEN 1 ELSE 0
           END AS SAT_rass_first_neg_30_last45_nonneg
 
-    FROM t6
+    FROM t7
 )
 
--- Step 9: Aggregate to day level
+-- Step 10: Aggregate to day level
 , t_days AS (
     SELECT
         hospitalization_id
         , event_date
-        , hosp_id_day_key
         , MAX(sat_eligible) AS sat_eligible
         , MAX(SAT_EHR_delivery) AS SAT_EHR_delivery
         , MAX(SAT_modified_delivery) AS SAT_modified_delivery
@@ -414,8 +346,12 @@ WITH base_times AS (
         -- First event time for each flag (for timing analysis)
         , MIN(CASE WHEN SAT_EHR_delivery = 1 THEN event_dttm END) AS SAT_EHR_delivery_first_dttm
         , MIN(CASE WHEN SAT_modified_delivery = 1 THEN event_dttm END) AS SAT_modified_delivery_first_dttm
+        -- Flags delivered between 7 AM and 7 PM (dashboard daytime window)
+        , COALESCE(MAX(SAT_EHR_delivery) FILTER (WHERE hour(event_dttm) BETWEEN 7 AND 18), 0) AS SAT_EHR_delivery_7AM_7PM
+        , COALESCE(MAX(SAT_modified_delivery) FILTER (WHERE hour(event_dttm) BETWEEN 7 AND 18), 0) AS SAT_modified_delivery_7AM_7PM
+        , COALESCE(MAX(SAT_med_halved_rass_pos) FILTER (WHERE hour(event_dttm) BETWEEN 7 AND 18), 0) AS SAT_med_halved_rass_pos_7AM_7PM
     FROM t_events
-    GROUP BY hospitalization_id, event_date, hosp_id_day_key
+    GROUP BY hospitalization_id, event_date
 )
 
 -- Final output: Select either t_events or t_days based on your needs
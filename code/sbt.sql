@@ -138,7 +138,8 @@ WITH t1 AS (
         , _withdrawl_lst: CASE
             WHEN _extub_1st = 1 
             AND TRIM(LOWER(code_status_category)) != 'full'
-            AND TRIM(LOWER(discharge_category)) in ('hospice', 'expired')
+            -- discharge_category is lower-cased and trimmed at load (loaders.HOSP_COLUMNS)
+            AND discharge_category in ('hospice', 'expired')
             THEN 1 ELSE 0 END
         , _success_extub: CASE
             WHEN _extub_1st = 1
@@ -149,7 +150,7 @@ WITH t1 AS (
             WHEN _extub_1st = 1
             AND _last_vitals_within_24h_of_extub = 1
             AND _fail_extub = 0
-            AND TRIM(LOWER(discharge_category)) in ('hospice', 'expired')
+            AND discharge_category in ('hospice', 'expired')
             -- AND _withdrawl_lst = 0
             THEN 1 ELSE 0 END
 )
@@ -0,0 +1,297 @@
+-- SOFA-2 (Sequential Organ Failure Assessment, 2025 update) from CLIF tables
+-- Daily maximum SOFA-2 per hospitalization, ICU unit and clinical day
+--
+-- Required input tables:
+--   - adt_df: ADT table with location_name, location_category
+--   - hosp_df: hospitalization table (end of ADT segments without out_dttm)
+--   - resp_p: waterfall-processed respiratory support (device_category, fio2_set)
+--   - sofa_labs: creatinine, bilirubin_total, platelet_count and po2_arterial (lab_category, lab_value)
+--   - sofa_vitals: map and spo2 (vital_category, vital_value)
+--   - gcs_df: GCS totals
+--   - vasoactive_df: vasopressor and inotrope doses with their units
+--   - vitals_summary: latest weight_kg per hospitalization
+--
+-- Every ICU patient-hour is scored on one shared grid, with one as-of join per source:
+-- each hour takes the latest state of the labs, GCS and vasoactive drips at or before it.
+-- Each source is reduced to states valid from recorded_dttm until the next one (next_dttm),
+-- so the as-of join is an equi-join on hospitalization_id with a range condition, which
+-- DuckDB runs as a hash join.
+-- Labs and GCS older than 24 hours count as missing, and a missing component scores 0.
+-- MAP and SpO2/FiO2 use the worst value charted in the hour ending at the grid point.
+-- Renal replacement therapy, urine output, ECMO and mechanical circulatory support are not
+-- among the inputs, so kidney, respiratory and cardiovascular scores come from creatinine,
+-- oxygenation and MAP/vasoactive doses alone. Norepinephrine and epinephrine doses charted
+-- in units other than mcg/kg/min, mcg/kg/hr, mg/kg/hr, mcg/min, mcg/hr or mg/hr count as 0.
+--
+-- Output: one row per hospitalization, ICU unit and clinical day with the maximum hourly
+-- SOFA-2 total and the maximum of each component
+
+-- Step 0: Grid of whole hours (UTC, i.e. local clock hours outside half-hour time zones) inside each ICU stay
+WITH icu_hours AS (
+    FROM adt_df a
+    LEFT JOIN hosp_df h USING (hospitalization_id)
+    SELECT a.hospitalization_id
+        , a.location_name
+        , hour_dttm: UNNEST(range(
+            to_timestamp(((epoch_us(a.in_dttm) - 1) // 3600000000 + 1) * 3600)
+            , COALESCE(a.out_dttm, h.discharge_dttm)
+            , INTERVAL 1 HOUR
+        ))
+    WHERE a.location_category = 'icu'
+        AND a.in_dttm IS NOT NULL
+)
+
+-- Step 1: Respiratory support in effect from each resp_p row
+, resp_state AS (
+    FROM resp_p
+    SELECT hospitalization_id
+        , recorded_dttm
+        , next_dttm: COALESCE(LEAD(recorded_dttm) OVER (PARTITION BY hospitalization_id ORDER BY recorded_dttm), 'infinity')
+        -- SOFA-2 respiratory scores 3 and 4 require advanced ventilatory support
+        , advanced_support: device_category IN ('imv', 'nippv', 'cpap', 'high flow nc')
+        -- FiO2 as a fraction
+        , fio2: CASE
+            WHEN device_category = 'room air' THEN 0.21
+            WHEN fio2_set > 1 THEN fio2_set / 100
+            ELSE fio2_set
+        END
+)
+
+-- Step 2: Oxygenation scores at each arterial blood gas (PaO2/FiO2) and SpO2 below 98% (SpO2/FiO2)
+--         Patients without respiratory support rows are on room air
+, pf_scores AS (
+    FROM (FROM sofa_labs WHERE lab_category = 'po2_arterial') l
+    LEFT JOIN resp_state r
+        ON r.hospitalization_id = l.hospitalization_id
+        AND r.recorded_dttm <= l.recorded_dttm
+        AND r.next_dttm > l.recorded_dttm
+    SELECT l.hospitalization_id
+        , l.recorded_dttm
+        , pf_ratio: l.lab_value / NULLIF(CASE WHEN r.recorded_dttm IS NULL THEN 0.21 ELSE r.fio2 END, 0)
+        , sofa_respiratory: CASE
+            WHEN pf_ratio <= 75 AND r.advanced_support THEN 4
+            WHEN pf_ratio <= 150 AND r.advanced_support THEN 3
+            WHEN pf_ratio <= 225 THEN 2
+            WHEN pf_ratio <= 300 THEN 1
+            WHEN pf_ratio > 300 THEN 0
+        END
+)
+, sf_scores AS (
+    FROM (FROM sofa_vitals WHERE vital_category = 'spo2' AND vital_value < 98) v
+    LEFT JOIN resp_state r
+        ON r.hospitalization_id = v.hospitalization_id
+        AND r.recorded_dttm <= v.recorded_dttm
+        AND r.next_dttm > v.recorded_dttm
+    SELECT v.hospitalization_id
+        , v.recorded_dttm
+        , sf_ratio: v.vital_value / NULLIF(CASE WHEN r.recorded_dttm IS NULL THEN 0.21 ELSE r.fio2 END, 0)
+        , sofa_respiratory: CASE
+            WHEN sf_ratio <= 120 AND r.advanced_support THEN 4
+            WHEN sf_ratio <= 200 AND r.advanced_support THEN 3
+            WHEN sf_ratio <= 250 THEN 2
+            WHEN sf_ratio <= 300 THEN 1
+            WHEN sf_ratio > 300 THEN 0
+        END
+)
+, vitals_hourly AS (
+    -- Lowest MAP and worst SpO2/FiO2 score per grid hour, at the end of the hour they were charted in
+    FROM (
+        FROM sofa_vitals
+        SELECT hospitalization_id, recorded_dttm, map: vital_value
+        WHERE vital_category = 'map'
+        UNION ALL BY NAME
+        FROM sf_scores
+        SELECT hospitalization_id, recorded_dttm, sf_score: sofa_respiratory
+    )
+    SELECT hospitalization_id
+        -- Hours since the epoch; cheaper than time zone-aware truncation
+        , hour_epoch: (epoch_us(recorded_dttm) - 1) // 3600000000 + 1
+        , hour_dttm: to_timestamp(hour_epoch * 3600)
+        , map_min: MIN(map)
+        , sf_score: MAX(sf_score)
+    GROUP BY hospitalization_id, hour_epoch
+)
+
+-- Step 3: Latest liver, kidney, hemostasis and PaO2/FiO2 scores at each lab time, with the time each was measured
+, lab_scores AS (
+    FROM (
+        -- One row per collection time
+        FROM (
+            FROM sofa_labs
+            SELECT hospitalization_id, recorded_dttm, lab_category, lab_value
+            WHERE lab_category <> 'po2_arterial'
+            UNION ALL BY NAME
+            FROM pf_scores
+            SELECT hospitalization_id, recorded_dttm, sofa_respiratory
+        )
+        SELECT hospitalization_id
+            , recorded_dttm
+            , sofa_liver: MAX(CASE
+                WHEN lab_value > 12 THEN 4
+                WHEN lab_value > 6 THEN 3
+                WHEN lab_value > 3 THEN 2
+                WHEN lab_value > 1.2 THEN 1
+                ELSE 0
+            END) FILTER (WHERE lab_category = 'bilirubin_total')
+            , sofa_kidney: MAX(CASE
+                WHEN lab_value > 3.5 THEN 3
+                WHEN lab_value > 2 THEN 2
+                WHEN lab_value > 1.2 THEN 1
+                ELSE 0
+            END) FILTER (WHERE lab_category = 'creatinine')
+            , sofa_hemostasis: MAX(CASE
+                WHEN lab_value <= 50 THEN 4
+                WHEN lab_value <= 80 THEN 3
+                WHEN lab_value <= 100 THEN 2
+                WHEN lab_value <= 150 THEN 1
+                ELSE 0
+            END) FILTER (WHERE lab_category = 'platelet_count')
+            , sofa_respiratory: MAX(sofa_respiratory)
+        GROUP BY hospitalization_id, recorded_dttm
+    )
+    SELECT hospitalization_id
+        , recorded_dttm
+        , next_dttm: COALESCE(LEAD(recorded_dttm) OVER w, 'infinity')
+        , sofa_liver: LAST_VALUE(sofa_liver IGNORE NULLS) OVER w
+        , liver_dttm: LAST_VALUE(CASE WHEN sofa_liver IS NOT NULL THEN recorded_dttm END IGNORE NULLS) OVER w
+        , sofa_kidney: LAST_VALUE(sofa_kidney IGNORE NULLS) OVER w
+        , kidney_dttm: LAST_VALUE(CASE WHEN sofa_kidney IS NOT NULL THEN recorded_dttm END IGNORE NULLS) OVER w
+        , sofa_hemostasis: LAST_VALUE(sofa_hemostasis IGNORE NULLS) OVER w
+        , hemostasis_dttm: LAST_VALUE(CASE WHEN sofa_hemostasis IS NOT NULL THEN recorded_dttm END IGNORE NULLS) OVER w
+        , pf_score: LAST_VALUE(sofa_respiratory IGNORE NULLS) OVER w
+        , pf_dttm: LAST_VALUE(CASE WHEN sofa_respiratory IS NOT NULL THEN recorded_dttm END IGNORE NULLS) OVER w
+    WINDOW w AS (
+        PARTITION BY hospitalization_id ORDER BY recorded_dttm ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    )
+)
+
+-- Step 4: GCS in effect from each assessment, the lowest when several share a time
+, gcs_state AS (
+    FROM gcs_df
+    SELECT hospitalization_id
+        , recorded_dttm
+        , next_dttm: COALESCE(LEAD(recorded_dttm) OVER (PARTITION BY hospitalization_id ORDER BY recorded_dttm), 'infinity')
+        , gcs_total: MIN(gcs_total)
+    WHERE gcs_total IS NOT NULL
+    GROUP BY hospitalization_id, recorded_dttm
+)
+
+-- Step 5: Vasoactive doses in effect at each change, forward-filled per drug
+--         Norepinephrine and epinephrine in mcg/kg/min; the others only need to be running
+, vasoactive_state AS (
+    FROM (
+        FROM (
+            FROM vasoactive_df d
+            LEFT JOIN vitals_summary w USING (hospitalization_id)
+            SELECT d.hospitalization_id
+                , d.recorded_dttm
+                , d.med_category
+                , d.med_dose
+                , dose_mcg_kg_min: COALESCE(CASE d.med_dose_unit
+                    WHEN 'mcg/kg/min' THEN d.med_dose
+                    WHEN 'mcg/kg/hr' THEN d.med_dose / 60
+                    WHEN 'mg/kg/hr' THEN d.med_dose * 1000 / 60
+                    WHEN 'mcg/min' THEN d.med_dose / NULLIF(w.weight_kg, 0)
+                    WHEN 'mcg/hr' THEN d.med_dose / 60 / NULLIF(w.weight_kg, 0)
+                    WHEN 'mg/hr' THEN d.med_dose * 1000 / 60 / NULLIF(w.weight_kg, 0)
+                END, 0)
+            WHERE d.med_dose IS NOT NULL
+        )
+        SELECT hospitalization_id
+            , recorded_dttm
+            , norepinephrine: MAX(dose_mcg_kg_min) FILTER (WHERE med_category = 'norepinephrine')
+            , epinephrine: MAX(dose_mcg_kg_min) FILTER (WHERE med_category = 'epinephrine')
+            , dopamine: MAX(med_dose) FILTER (WHERE med_category = 'dopamine')
+            , dobutamine: MAX(med_dose) FILTER (WHERE med_category = 'dobutamine')
+            , vasopressin: MAX(med_dose) FILTER (WHERE med_category = 'vasopressin')
+            , phenylephrine: MAX(med_dose) FILTER (WHERE med_category = 'phenylephrine')
+            , milrinone: MAX(med_dose) FILTER (WHERE med_category = 'milrinone')
+            , angiotensin: MAX(med_dose) FILTER (WHERE med_category = 'angiotensin')
+        GROUP BY hospitalization_id, recorded_dttm
+    )
+    SELECT hospitalization_id
+        , recorded_dttm
+        , next_dttm: COALESCE(LEAD(recorded_dttm) OVER w, 'infinity')
+        , ne_epi_dose: COALESCE(LAST_VALUE(norepinephrine IGNORE NULLS) OVER w, 0)
+            + COALESCE(LAST_VALUE(epinephrine IGNORE NULLS) OVER w, 0)
+        , other_vasoactive: COALESCE(GREATEST(
+            LAST_VALUE(dopamine IGNORE NULLS) OVER w
+            , LAST_VALUE(dobutamine IGNORE NULLS) OVER w
+            , LAST_VALUE(vasopressin IGNORE NULLS) OVER w
+            , LAST_VALUE(phenylephrine IGNORE NULLS) OVER w
+            , LAST_VALUE(milrinone IGNORE NULLS) OVER w
+            , LAST_VALUE(angiotensin IGNORE NULLS) OVER w
+        ), 0) > 0
+    WINDOW w AS (
+        PARTITION BY hospitalization_id ORDER BY recorded_dttm ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    )
+)
+
+-- Step 6: Score every ICU patient-hour
+, hourly AS (
+    FROM icu_hours g
+    LEFT JOIN lab_scores l
+        ON l.hospitalization_id = g.hospitalization_id
+        AND l.recorded_dttm <= g.hour_dttm
+        AND l.next_dttm > g.hour_dttm
+    LEFT JOIN gcs_state c
+        ON c.hospitalization_id = g.hospitalization_id
+        AND c.recorded_dttm <= g.hour_dttm
+        AND c.next_dttm > g.hour_dttm
+    LEFT JOIN vasoactive_state m
+        ON m.hospitalization_id = g.hospitalization_id
+        AND m.recorded_dttm <= g.hour_dttm
+        AND m.next_dttm > g.hour_dttm
+    LEFT JOIN vitals_hourly v
+        ON v.hospitalization_id = g.hospitalization_id
+        AND v.hour_dttm = g.hour_dttm
+    SELECT g.hospitalization_id
+        , g.location_name
+        , g.hour_dttm
+        , sofa_brain: CASE
+            WHEN c.recorded_dttm <= g.hour_dttm - INTERVAL 24 HOUR THEN 0
+            WHEN c.gcs_total <= 5 THEN 4
+            WHEN c.gcs_total <= 8 THEN 3
+            WHEN c.gcs_total <= 12 THEN 2
+            WHEN c.gcs_total <= 14 THEN 1
+            ELSE 0
+        END
+        , sofa_respiratory: COALESCE(
+            CASE WHEN l.pf_dttm > g.hour_dttm - INTERVAL 24 HOUR THEN l.pf_score END, v.sf_score, 0
+        )
+        , sofa_cardiovascular: CASE
+            WHEN m.ne_epi_dose > 0.4 OR (m.ne_epi_dose > 0.2 AND m.other_vasoactive) THEN 4
+            WHEN m.ne_epi_dose > 0.2 OR (m.ne_epi_dose > 0 AND m.other_vasoactive) THEN 3
+            WHEN m.ne_epi_dose > 0 OR m.other_vasoactive THEN 2
+            WHEN v.map_min < 70 THEN 1
+            ELSE 0
+        END
+        , sofa_liver: CASE WHEN l.liver_dttm > g.hour_dttm - INTERVAL 24 HOUR THEN l.sofa_liver ELSE 0 END
+        , sofa_kidney: CASE WHEN l.kidney_dttm > g.hour_dttm - INTERVAL 24 HOUR THEN l.sofa_kidney ELSE 0 END
+        , sofa_hemostasis: CASE
+            WHEN l.hemostasis_dttm > g.hour_dttm - INTERVAL 24 HOUR THEN l.sofa_hemostasis ELSE 0
+        END
+)
+
+-- Step 7: Daily maximum per hospitalization and ICU unit
+--         Clinical days are looked up once per distinct hour instead of converting every grid row to local time
+, clinical_days AS (
+    FROM (FROM icu_hours SELECT DISTINCT hour_dttm)
+    SELECT hour_dttm
+        , day: (hour_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+)
+FROM hourly
+JOIN clinical_days USING (hour_dttm)
+SELECT hospitalization_id
+    , location_name
+    , day
+    , sofa_max: MAX(sofa_brain + sofa_respiratory + sofa_cardiovascular + sofa_liver + sofa_kidney + sofa_hemostasis)
+    , sofa_brain: MAX(sofa_brain)
+    , sofa_respiratory: MAX(sofa_respiratory)
+    , sofa_cardiovascular: MAX(sofa_cardiovascular)
+    , sofa_liver: MAX(sofa_liver)
+    , sofa_kidney: MAX(sofa_kidney)
+    , sofa_hemostasis: MAX(sofa_hemostasis)
+    , icu_hours: COUNT(*)
+GROUP BY hospitalization_id, location_name, day
+ORDER BY hospitalization_id, day, location_name
@@ -0,0 +1,293 @@
+"""
+SQL of the backend stages that the tests and benchmarks run as well.
+
+`backend.py` materializes these queries in the pipeline database; keeping the
+SQL here lets `tests/` and `benchmarks/` run exactly the same text on small
+fixtures instead of a copy of it.
+"""
+
+# Controlled ventilator modes of the lung-protective ventilation metrics (mode_category is lower-cased at load)
+CONTROLLED_MODES = [
+    'assist control-volume control',
+    'pressure control',
+    'pressure-regulated volume control',
+]
+
+# Most recent height for each hospitalization, from the vitals summary
+HEIGHT_SQL = """
+FROM vitals_summary
+SELECT hospitalization_id, height_cm
+WHERE height_cm IS NOT NULL
+"""
+
+# Ideal body weight of each hospitalization with a height, from `hosp_df`, `patient_df` and `height_df`
+IBW_SQL = """
+WITH hosp_patient AS (
+    -- Join hospitalization with patient to get sex_category per hospitalization
+    FROM hosp_df h
+    LEFT JOIN patient_df p USING (patient_id)
+    SELECT h.hospitalization_id, p.sex_category
+)
+, hosp_with_height AS (
+    -- Join with height
+    FROM hosp_patient hp
+    LEFT JOIN height_df ht USING (hospitalization_id)
+    SELECT hp.hospitalization_id
+        , hp.sex_category
+        , ht.height_cm
+)
+SELECT hospitalization_id
+    , sex_category
+    , height_cm
+    -- Calculate IBW based on sex
+    -- Female: IBW = 45.5 + 0.9 × (height_cm - 152)
+    -- Male: IBW = 50 + 0.9 × (height_cm - 152)
+    , CASE
+        WHEN LOWER(sex_category) = 'female' THEN 45.5 + 0.9 * (height_cm - 152)
+        WHEN LOWER(sex_category) = 'male' THEN 50.0 + 0.9 * (height_cm - 152)
+        ELSE NULL
+      END AS ibw_kg
+FROM hosp_with_height
+WHERE height_cm IS NOT NULL
+"""
+
+# Overall, by-mode, by-unit and by-day low tidal volume rollups from one scan of `resp_p` (GROUPING SETS),
+# with `ibw_df` and the ADT location (`adt_df`) of each row
+LTV_ROLLUPS_SQL = f"""
+WITH distinct_segments AS (
+    -- One ADT segment per hospitalization and in_dttm, so a row cannot match duplicated segments twice
+    FROM adt_df
+    SELECT hospitalization_id, location_name, in_dttm, out_dttm
+    QUALIFY ROW_NUMBER() OVER (
+        PARTITION BY hospitalization_id, in_dttm ORDER BY out_dttm DESC NULLS FIRST, location_name
+    ) = 1
+)
+, adt_segments AS (
+    -- ADT segments cut at the next segment's in_dttm, so each time falls in at most one
+    FROM distinct_segments
+    SELECT hospitalization_id
+        , location_name
+        , in_dttm
+        , out_dttm: COALESCE(
+            LEAST(out_dttm, LEAD(in_dttm) OVER (PARTITION BY hospitalization_id ORDER BY in_dttm)), 'infinity'
+        )
+)
+, controlled_mode_rows AS (
+    -- IMV rows on controlled modes with IBW and the ADT location at that time
+    FROM resp_p r
+    LEFT JOIN ibw_df i USING (hospitalization_id)
+    LEFT JOIN adt_segments a
+        ON a.hospitalization_id = r.hospitalization_id
+        AND a.in_dttm <= r.recorded_dttm
+        AND a.out_dttm > r.recorded_dttm
+    SELECT r.mode_category
+        , a.location_name
+        -- Clinical day (7 AM to 7 AM local time)
+        , day: (r.recorded_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+        -- Rows with valid IBW and TV for calculation
+        , is_valid: CASE WHEN i.ibw_kg IS NOT NULL AND r.tidal_volume_set IS NOT NULL THEN 1 ELSE 0 END
+        -- Flag for low tidal volume (< 8 cc/kg)
+        , is_low_tv: CASE WHEN is_valid = 1 AND (r.tidal_volume_set / i.ibw_kg) < 8 THEN 1 ELSE 0 END
+    WHERE r.device_category = 'imv'
+        AND r.mode_category IN ({', '.join(f"'{m}'" for m in CONTROLLED_MODES)})
+)
+FROM controlled_mode_rows
+SELECT rollup: CASE
+        WHEN GROUPING(mode_category) = 0 THEN 'mode'
+        WHEN GROUPING(location_name) = 0 THEN 'unit'
+        WHEN GROUPING(day) = 0 THEN 'day'
+        ELSE 'overall'
+      END
+    , mode_category
+    , location_name
+    , day
+    , total_controlled_mode_rows: COUNT(*)
+    , rows_with_valid_data: SUM(is_valid)::BIGINT
+    , low_tv_rows: SUM(is_low_tv)::BIGINT
+    , low_tv_percentage: ROUND(100.0 * SUM(is_low_tv) / NULLIF(SUM(is_valid), 0), 1)
+GROUP BY GROUPING SETS ((), (mode_category), (location_name), (day))
+"""
+
+
+def bed_strain_sql(adt_source: str, extract_end, bed_capacity: dict) -> str:
+    """
+    Occupied beds of every ICU unit at the top of every hour, up to `extract_end`.
+
+    `adt_source` is a query over the whole ADT table (`loaders.ADT_COLUMNS`). Segments with no
+    `out_dttm` are still open and count until the end of the extract. Units missing from
+    `bed_capacity` ({unit: beds}) use their highest occupancy over the extract as capacity.
+    """
+    capacity_rows = ", ".join(
+        "('{}', {})".format(str(unit).replace("'", "''"), int(beds)) for unit, beds in bed_capacity.items()
+    )
+    return f"""
+    WITH bed_capacity (location_name, beds) AS (
+        {f"VALUES {capacity_rows}" if capacity_rows else "SELECT NULL::VARCHAR, NULL::INTEGER WHERE false"}
+    )
+    , icu_adt AS (
+        FROM ({adt_source})
+        SELECT location_name
+            , in_dttm
+            -- Open segments stay open: the patient is still in the unit
+            , out_dttm: CASE WHEN out_dttm IS NOT NULL THEN GREATEST(in_dttm, out_dttm) END
+        WHERE location_category = 'icu'
+            AND in_dttm IS NOT NULL
+    )
+    , occupancy AS (
+        -- +1 when a patient enters the unit, -1 when they leave; the running sum is the census from that moment on
+        FROM (
+            FROM icu_adt SELECT location_name, event_dttm: in_dttm, change: 1
+            UNION ALL
+            FROM icu_adt SELECT location_name, out_dttm, -1 WHERE out_dttm IS NOT NULL
+        )
+        SELECT location_name
+            , event_dttm
+            , occupied_beds: SUM(SUM(change)) OVER (PARTITION BY location_name ORDER BY event_dttm)::INTEGER
+        GROUP BY location_name, event_dttm
+    )
+    , hours AS (
+        -- Every hour from a unit's first admission to the end of the extract
+        FROM (
+            FROM icu_adt
+            SELECT location_name, first_hour: date_trunc('hour', MIN(in_dttm))
+            GROUP BY location_name
+        )
+        SELECT location_name
+            , hour_dttm: UNNEST(generate_series(first_hour, '{extract_end}'::TIMESTAMPTZ, INTERVAL 1 HOUR))
+    )
+    , hourly AS (
+        -- A patient admitted at the hour counts, one transferred out at the hour does not
+        FROM hours h
+        ASOF LEFT JOIN occupancy o
+            ON o.location_name = h.location_name
+            AND o.event_dttm <= h.hour_dttm
+        LEFT JOIN bed_capacity c ON c.location_name = h.location_name
+        SELECT h.location_name
+            , day: (h.hour_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+            , h.hour_dttm
+            , occupied_beds: COALESCE(o.occupied_beds, 0)
+            , bed_capacity: COALESCE(c.beds, MAX(COALESCE(o.occupied_beds, 0)) OVER (PARTITION BY h.location_name))
+    )
+    FROM hourly
+    SELECT *
+        , pct_beds_occupied: ROUND(100 * occupied_beds / NULLIF(bed_capacity, 0), 1)
+    ORDER BY location_name, hour_dttm
+    """
+
+
+def lpv_hours_sql(extract_end) -> str:
+    """
+    Every hour on a controlled IMV mode, with the tidal volume per kg IBW and the ICU unit at that hour.
+
+    Reads the `resp_p`, `hosp_df`, `ibw_df` and `adt_df` tables of the pipeline. The last respiratory
+    row of a patient not yet discharged holds until `extract_end`, and no hour runs past it.
+    """
+    return f"""
+    WITH resp_state AS (
+        -- Each resp_p row holds from its recorded_dttm until the next row (or hospital discharge, or the end
+        -- of the extract for patients still in hospital), with mode and tidal volume forward-filled from earlier rows
+        FROM resp_p r
+        LEFT JOIN hosp_df h USING (hospitalization_id)
+        SELECT r.hospitalization_id
+            , seg_start: r.recorded_dttm
+            , seg_end: LEAST(
+                COALESCE(LEAD(r.recorded_dttm) OVER w, h.discharge_dttm, '{extract_end}'::TIMESTAMPTZ)
+                , '{extract_end}'::TIMESTAMPTZ
+            )
+            , device_category: r.device_category
+            , mode_category: LAST_VALUE(r.mode_category IGNORE NULLS) OVER w_fill
+            , tidal_volume_set: LAST_VALUE(r.tidal_volume_set IGNORE NULLS) OVER w_fill
+        WINDOW w AS (PARTITION BY r.hospitalization_id ORDER BY r.recorded_dttm)
+            , w_fill AS (w ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+    )
+    , controlled_hours AS (
+        -- One row per clock hour starting inside a controlled-mode IMV segment
+        FROM resp_state
+        SELECT hospitalization_id
+            , tidal_volume_set
+            , hour_dttm: UNNEST(range(
+                date_trunc('hour', seg_start - INTERVAL 1 MICROSECOND) + INTERVAL 1 HOUR, seg_end, INTERVAL 1 HOUR
+            ))
+        WHERE device_category = 'imv'
+            AND mode_category IN ({', '.join(f"'{m}'" for m in CONTROLLED_MODES)})
+            AND seg_end > seg_start
+    )
+    FROM controlled_hours c
+    LEFT JOIN ibw_df i USING (hospitalization_id)
+    ASOF JOIN adt_df a
+        ON a.hospitalization_id = c.hospitalization_id
+        AND a.in_dttm <= c.hour_dttm
+    SELECT a.location_name
+        , day: (c.hour_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+        , c.hospitalization_id
+        , c.hour_dttm
+        , vt_cc_kg: c.tidal_volume_set / NULLIF(i.ibw_kg, 0)
+    WHERE a.location_category = 'icu'
+        AND (a.out_dttm IS NULL OR a.out_dttm > c.hour_dttm)
+    ORDER BY location_name, hour_dttm, hospitalization_id
+    """
+
+
+def daily_anchors_sql(extract_end) -> str:
+    """
+    Location, ventilator and sedation state of every ICU hospitalization-day at the 7 AM and 7 PM anchors.
+
+    Reads the `adt_df`, `resp_p` and `meds_df` tables of the pipeline. ICU segments with no
+    `out_dttm` touch every clinical day up to the one of `extract_end`.
+    """
+    return f"""
+    WITH anchors AS (
+        -- Every clinical day touched by an ICU stay, at both anchor times; open stays run to the end of the extract
+        FROM (
+            FROM adt_df
+            SELECT DISTINCT hospitalization_id
+                , day: UNNEST(generate_series(
+                    (in_dttm::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+                    , (COALESCE(out_dttm, '{extract_end}'::TIMESTAMPTZ)::TIMESTAMP - INTERVAL 7 HOUR)::DATE
+                    , INTERVAL 1 DAY
+                ))::DATE
+            WHERE location_category = 'icu'
+                AND in_dttm IS NOT NULL
+        )
+        CROSS JOIN (VALUES ('7AM', 7), ('7PM', 19)) AS a(anchor, anchor_hour)
+        SELECT hospitalization_id, day, anchor
+            , anchor_dttm: day + to_hours(anchor_hour)
+    )
+    , sedation_state AS (
+        -- Each drug's dose as of the anchor, from its change points
+        FROM anchors d
+        JOIN (FROM meds_df SELECT DISTINCT hospitalization_id, med_category WHERE med_group IN ('opioid', 'sedative')) s
+            ON s.hospitalization_id = d.hospitalization_id
+        ASOF JOIN meds_df m
+            ON m.hospitalization_id = d.hospitalization_id
+            AND m.med_category = s.med_category
+            AND m.recorded_dttm <= d.anchor_dttm
+        SELECT d.hospitalization_id, d.day, d.anchor
+            , active_sedation: MAX(m.med_dose) > 0
+        GROUP BY d.hospitalization_id, d.day, d.anchor
+    )
+    FROM anchors d
+    ASOF LEFT JOIN adt_df a
+        ON a.hospitalization_id = d.hospitalization_id
+        AND a.in_dttm <= d.anchor_dttm
+    ASOF LEFT JOIN resp_p r
+        ON r.hospitalization_id = d.hospitalization_id
+        AND r.recorded_dttm <= d.anchor_dttm
+    LEFT JOIN sedation_state m
+        ON m.hospitalization_id = d.hospitalization_id
+        AND m.day = d.day
+        AND m.anchor = d.anchor
+    SELECT d.hospitalization_id
+        , d.day
+        , d.anchor
+        , d.anchor_dttm
+        -- The ADT segment the patient is in at the anchor, if any
+        , in_bed: a.in_dttm IS NOT NULL AND (a.out_dttm IS NULL OR a.out_dttm > d.anchor_dttm)
+        , location_name: CASE WHEN in_bed THEN a.location_name END
+        , location_category: CASE WHEN in_bed THEN a.location_category END
+        , in_icu: COALESCE(in_bed AND a.location_category = 'icu', false)
+        , r.device_category
+        , r.mode_category
+        , active_sedation: COALESCE(m.active_sedation, false)
+    ORDER BY d.hospitalization_id, d.day, d.anchor
+    """
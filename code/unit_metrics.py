@@ -0,0 +1,86 @@
+"""
+Dashboard access to the per-unit, per-day tables written by `backend.py`.
+
+Each table is saved under `output/intermediate/{site}_{table}/`, partitioned by
+`location_name`, with a `day` column holding the clinical day. Reading one
+unit touches only that unit's partition.
+
+`UnitCube` keeps a unit's additive daily metrics as prefix sums, so the
+totals of any reporting period cost two row lookups.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def output_path(output_dir, site_name: str, table: str) -> Path:
+    """Location of a backend output table."""
+    return Path(output_dir) / f"{site_name.lower()}_{table}"
+
+
+def read_unit_days(table_path, location_name: str, start_date, end_date, columns=None):
+    """
+    Rows of one unit with `day` in `[start_date, end_date]`, sorted by day.
+
+    Returns None when the table has not been built. Days without any rows
+    (e.g. nobody ventilated) are simply absent.
+    """
+    if not Path(table_path).exists():
+        return None
+    unit_days = pd.read_parquet(table_path, columns=columns, filters=[
+        ('location_name', '==', location_name),
+        ('day', '>=', pd.Timestamp(start_date)),
+        ('day', '<=', pd.Timestamp(end_date)),
+    ])
+    if 'location_name' in unit_days:
+        unit_days['location_name'] = unit_days['location_name'].astype(str)
+    return unit_days.sort_values('day').reset_index(drop=True)
+
+
+def percent(numerator, denominator, digits: int = 1):
+    """`100 * numerator / denominator`, or "N/A" when the denominator is zero or missing."""
+    if denominator is None or pd.isna(denominator) or denominator == 0:
+        return "N/A"
+    return round(100 * numerator / denominator, digits)
+
+
+class UnitCube:
+    """
+    Prefix sums of one unit's additive daily metrics over a fixed span of days.
+
+    Row `i` of `prefix` holds the totals of the first `i` days, so the totals
+    of any reporting period are the difference of two rows, whatever its
+    length. Days of the span without a row count as zero.
+    """
+
+    def __init__(self, daily: pd.DataFrame, columns, first_day, last_day):
+        self.days = pd.date_range(pd.Timestamp(first_day), pd.Timestamp(last_day), freq='D')
+        self.columns = list(columns)
+        values = (
+            daily.assign(day=pd.to_datetime(daily['day']))
+            .groupby('day')[self.columns].sum()
+            .reindex(self.days, fill_value=0)
+            .to_numpy(dtype=float)
+        )
+        self.prefix = np.vstack([np.zeros((1, len(self.columns))), np.cumsum(values, axis=0)])
+
+    def span(self, start_date, end_date):
+        """Positions `[i, j)` of the days of `[start_date, end_date]` within the span."""
+        i = self.days.searchsorted(pd.Timestamp(start_date), side='left')
+        j = self.days.searchsorted(pd.Timestamp(end_date), side='right')
+        return i, max(i, j)
+
+    def totals(self, start_date, end_date) -> pd.Series:
+        """Sum of every column over `[start_date, end_date]`, with the number of days as `n_days`."""
+        i, j = self.span(start_date, end_date)
+        return pd.Series([*(self.prefix[j] - self.prefix[i]), j - i], index=[*self.columns, 'n_days'])
+
+
+def day_slice(rows: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+    """Rows of a frame sorted by `day` with `day` in `[start_date, end_date]`, by binary search."""
+    days = rows['day'].to_numpy(dtype='datetime64[ns]')
+    i = days.searchsorted(np.datetime64(pd.Timestamp(start_date)), side='left')
+    j = days.searchsorted(np.datetime64(pd.Timestamp(end_date)), side='right')
+    return rows.iloc[i:j]
@@ -0,0 +1,69 @@
+"""Hourly bed strain (`stage_sql.bed_strain_sql`) against the census of `overall_summary.census_at`."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from overall_summary import census_at
+from stage_sql import bed_strain_sql
+
+TZ = 'America/Chicago'
+EXTRACT_END = pd.Timestamp('2024-03-12 10:30', tz=TZ)
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize(TZ)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def adt_df():
+    # H3 and H5 are still in the unit at the end of the extract; H6 is on a ward
+    return pd.DataFrame({
+        'hospitalization_id': ['H1', 'H2', 'H3', 'H4', 'H5', 'H6'],
+        'location_name': ['MICU', 'MICU', 'MICU', 'SICU', 'SICU', 'WARD-1'],
+        'location_category': ['icu', 'icu', 'icu', 'icu', 'icu', 'ward'],
+        'in_dttm': _ts(['2024-03-09 06:30', '2024-03-09 08:00', '2024-03-10 04:00',
+                        '2024-03-09 12:00', '2024-03-11 07:00', '2024-03-09 09:00']),
+        'out_dttm': _ts(['2024-03-10 09:00', '2024-03-09 10:00', None,
+                         '2024-03-11 07:00', None, '2024-03-12 08:00']),
+    })
+
+
+def _bed_strain(con, adt_df, bed_capacity=None):
+    con.register('adt', adt_df)
+    return con.execute(bed_strain_sql("FROM adt", EXTRACT_END, bed_capacity or {})).df()
+
+
+def test_occupancy_matches_census(con, adt_df):
+    strain = _bed_strain(con, adt_df)
+    assert set(strain['location_name']) == {'MICU', 'SICU'}
+    for unit, rows in strain.groupby('location_name'):
+        hours = pd.DatetimeIndex(rows['hour_dttm']).tz_convert(TZ)
+        expected = census_at(adt_df[adt_df['location_name'] == unit], hours)
+        assert rows['occupied_beds'].tolist() == expected.tolist()
+
+
+def test_open_segments_run_to_extract_end(con, adt_df):
+    strain = _bed_strain(con, adt_df)
+    last = strain.groupby('location_name')['hour_dttm'].max().dt.tz_convert(TZ)
+    assert (last == EXTRACT_END.floor('h')).all()
+    final = strain.sort_values('hour_dttm').groupby('location_name')['occupied_beds'].last()
+    assert final.to_dict() == {'MICU': 1, 'SICU': 1}
+
+
+def test_capacity_from_config_or_extract_max(con, adt_df):
+    strain = _bed_strain(con, adt_df, {'MICU': 4})
+    capacity = strain.groupby('location_name')['bed_capacity'].unique()
+    assert capacity['MICU'].tolist() == [4]
+    # SICU is not configured: its busiest hour over the whole extract
+    assert capacity['SICU'].tolist() == [1]
+    micu = strain[strain['location_name'] == 'MICU']
+    assert (micu['pct_beds_occupied'] == (100 * micu['occupied_beds'] / 4).round(1)).all()
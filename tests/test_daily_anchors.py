@@ -0,0 +1,71 @@
+"""The 7 AM / 7 PM anchor snapshots behind the unit census and the SAT/SBT daily cohorts."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from stage_sql import daily_anchors_sql
+
+TZ = 'America/Chicago'
+EXTRACT_END = pd.Timestamp('2024-05-04 12:00', tz=TZ)
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize(TZ)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+    # H1 leaves the MICU on May 2; H2 is still in the SICU at the end of the extract
+    adt_df = pd.DataFrame({
+        'hospitalization_id': [1, 1, 2],
+        'location_name': ['MICU', 'WARD-1', 'SICU'],
+        'location_category': ['icu', 'ward', 'icu'],
+        'in_dttm': _ts(['2024-05-01 10:00', '2024-05-02 12:00', '2024-05-02 08:00']),
+        'out_dttm': _ts(['2024-05-02 12:00', '2024-05-03 10:00', None]),
+    })
+    resp_p = pd.DataFrame({
+        'hospitalization_id': [2],
+        'recorded_dttm': _ts(['2024-05-02 09:00']),
+        'device_category': ['imv'],
+        'mode_category': ['assist control-volume control'],
+    })
+    meds_df = pd.DataFrame({
+        'hospitalization_id': [2, 2],
+        'med_category': ['propofol', 'propofol'],
+        'recorded_dttm': _ts(['2024-05-02 09:00', '2024-05-03 20:00']),
+        'med_dose': [20.0, 0.0],
+        'med_group': ['sedative', 'sedative'],
+    })
+    for name, df in {'adt_df': adt_df, 'resp_p': resp_p, 'meds_df': meds_df}.items():
+        con.register(name, df)
+    yield con
+    con.close()
+
+
+def _anchors(con):
+    return con.execute(daily_anchors_sql(EXTRACT_END)).df().assign(day=lambda df: pd.to_datetime(df['day']))
+
+
+def test_open_segment_runs_to_extract_end(con):
+    h2 = _anchors(con).query('hospitalization_id == 2')
+    # Every clinical day from admission to the day of the extract end, at both anchors
+    assert sorted(h2['day'].unique()) == list(pd.date_range('2024-05-02', '2024-05-04', freq='D'))
+    assert h2['in_icu'].tolist() == [False, True, True, True, True, True]
+    assert (h2.loc[h2['in_icu'], 'location_name'] == 'SICU').all()
+
+
+def test_anchor_state(con):
+    anchors = _anchors(con).set_index(['hospitalization_id', 'day', 'anchor'])
+    h1 = anchors.loc[1]
+    # H1's ICU stay touches May 1 and 2; at 7 PM on May 2 they are on the ward
+    assert h1.index.get_level_values('day').unique().tolist() == list(pd.to_datetime(['2024-05-01', '2024-05-02']))
+    assert h1['location_name'].tolist() == [None, 'MICU', 'MICU', 'WARD-1']
+    assert h1['in_icu'].tolist() == [False, True, True, False]
+
+    h2 = anchors.loc[2]
+    assert h2['device_category'].tolist() == [None] + ['imv'] * 5
+    # Propofol runs from May 2, 9 AM until it is stopped at 8 PM on May 3
+    assert h2['active_sedation'].tolist() == [False, True, True, True, False, False]
@@ -0,0 +1,66 @@
+"""Hourly lung-protective ventilation rows (`stage_sql.lpv_hours_sql`)."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from stage_sql import lpv_hours_sql
+
+TZ = 'America/Chicago'
+EXTRACT_END = pd.Timestamp('2024-05-02 12:30', tz=TZ)
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize(TZ)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+    # H1 is discharged on May 1; H2 is still ventilated in the MICU at the end of the extract
+    tables = {
+        'resp_p': pd.DataFrame({
+            'hospitalization_id': [1, 1, 2],
+            'recorded_dttm': _ts(['2024-05-01 08:30', '2024-05-01 10:00', '2024-05-02 06:15']),
+            'device_category': ['imv', 'nasal cannula', 'imv'],
+            'mode_category': ['assist control-volume control', None, 'pressure control'],
+            'tidal_volume_set': [420.0, None, 500.0],
+        }),
+        'hosp_df': pd.DataFrame({
+            'hospitalization_id': [1, 2],
+            'discharge_dttm': _ts(['2024-05-01 18:00', None]),
+        }),
+        'ibw_df': pd.DataFrame({'hospitalization_id': [1, 2], 'ibw_kg': [60.0, 50.0]}),
+        'adt_df': pd.DataFrame({
+            'hospitalization_id': [1, 2],
+            'location_name': ['SICU', 'MICU'],
+            'location_category': ['icu', 'icu'],
+            'in_dttm': _ts(['2024-05-01 08:00', '2024-05-02 06:00']),
+            'out_dttm': _ts(['2024-05-01 18:00', None]),
+        }),
+    }
+    for name, df in tables.items():
+        con.register(name, df)
+    yield con
+    con.close()
+
+
+def _lpv_hours(con):
+    hours = con.execute(lpv_hours_sql(EXTRACT_END)).df()
+    return hours.assign(hour_dttm=hours['hour_dttm'].dt.tz_convert(TZ))
+
+
+def test_undischarged_patient_counts_until_extract_end(con):
+    h2 = _lpv_hours(con).query('hospitalization_id == 2')
+    # Every clock hour from 7 AM to noon; none past the end of the extract
+    assert h2['hour_dttm'].tolist() == list(pd.date_range('2024-05-02 07:00', '2024-05-02 12:00', freq='h', tz=TZ))
+    assert (h2['location_name'] == 'MICU').all()
+    assert (h2['vt_cc_kg'] == 10.0).all()
+
+
+def test_segment_ends_at_the_next_row(con):
+    h1 = _lpv_hours(con).query('hospitalization_id == 1')
+    # On a controlled mode from 8:30 until the 10:00 extubation
+    assert h1['hour_dttm'].tolist() == [pd.Timestamp('2024-05-01 09:00', tz=TZ)]
+    assert h1['vt_cc_kg'].tolist() == [7.0]
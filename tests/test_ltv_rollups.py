@@ -0,0 +1,60 @@
+"""Low tidal volume rollups (`stage_sql.LTV_ROLLUPS_SQL`)."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from stage_sql import LTV_ROLLUPS_SQL
+
+TZ = 'America/Chicago'
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize(TZ)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+    # H1's MICU segment is in the ADT table twice; they are ventilated either side of 7 AM on May 2
+    tables = {
+        'resp_p': pd.DataFrame({
+            'hospitalization_id': [1, 1, 1],
+            'recorded_dttm': _ts(['2024-05-02 06:59', '2024-05-02 07:00', '2024-05-02 13:00']),
+            'device_category': ['imv', 'imv', 'imv'],
+            'mode_category': ['assist control-volume control'] * 3,
+            'tidal_volume_set': [420.0, 540.0, None],
+        }),
+        'ibw_df': pd.DataFrame({'hospitalization_id': [1], 'ibw_kg': [60.0]}),
+        'adt_df': pd.DataFrame({
+            'hospitalization_id': [1, 1],
+            'location_name': ['MICU', 'MICU'],
+            'in_dttm': _ts(['2024-05-01 20:00', '2024-05-01 20:00']),
+            'out_dttm': _ts(['2024-05-03 10:00', '2024-05-03 10:00']),
+        }),
+    }
+    for name, df in tables.items():
+        con.register(name, df)
+    yield con
+    con.close()
+
+
+def _rollups(con):
+    rollups = con.execute(LTV_ROLLUPS_SQL).df()
+    return {name: rows.drop(columns='rollup') for name, rows in rollups.groupby('rollup')}
+
+
+def test_duplicated_segment_counts_each_row_once(con):
+    unit = _rollups(con)['unit'].set_index('location_name')
+    assert unit.loc['MICU', 'total_controlled_mode_rows'] == 3
+    assert unit.loc['MICU', 'rows_with_valid_data'] == 2
+    assert unit.loc['MICU', 'low_tv_rows'] == 1
+
+
+def test_days_start_at_7am_local_time(con):
+    day = _rollups(con)['day'].assign(day=lambda df: pd.to_datetime(df['day'])).set_index('day')
+    assert day['total_controlled_mode_rows'].to_dict() == {
+        pd.Timestamp('2024-05-01'): 1, pd.Timestamp('2024-05-02'): 2,
+    }
+    assert day['low_tv_percentage'].to_dict() == {pd.Timestamp('2024-05-01'): 100.0, pd.Timestamp('2024-05-02'): 0.0}
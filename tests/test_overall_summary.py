@@ -0,0 +1,162 @@
+"""The vectorized overall summary against the per-day loop it replaced (the baseline `app.py`)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from overall_summary import FACILITY_CATEGORIES, build_next_adt_index, census_at, summarize_units
+
+TZ = 'America/Chicago'
+COUNT_COLUMNS = [
+    'total_admissions', 'census_7AM', 'census_7PM', 'total_discharges', 'floor_transfers',
+    'deaths_in_icu', 'discharges_to_hospice', 'discharges_to_facility',
+]
+
+
+def _ts(value):
+    return pd.Timestamp(value, tz=TZ) if value is not None else pd.NaT
+
+
+def _adt(rows):
+    adt = pd.DataFrame(rows, columns=['hospitalization_id', 'location_name', 'location_category', 'in_dttm', 'out_dttm'])
+    adt['in_dttm'] = pd.to_datetime([_ts(v) for v in adt['in_dttm']]).tz_convert(TZ)
+    adt['out_dttm'] = pd.to_datetime([_ts(v) for v in adt['out_dttm']]).tz_convert(TZ)
+    return adt
+
+
+@pytest.fixture
+def adt_df():
+    # Stays around the 2024 DST changes (Mar 10 and Nov 3), with open segments still in the unit
+    return _adt([
+        ('H1', 'MICU', 'icu', '2024-03-08 22:00', '2024-03-10 09:30'),
+        ('H1', 'WARD-1', 'ward', '2024-03-10 10:00', '2024-03-12 12:00'),
+        ('H2', 'MICU', 'icu', '2024-03-09 07:00', '2024-03-09 19:00'),
+        ('H2', 'SICU', 'icu', '2024-03-09 19:00', '2024-03-11 06:59'),
+        ('H3', 'SICU', 'icu', '2024-03-10 01:30', '2024-03-10 03:30'),
+        ('H3', 'STEP-1', 'stepdown', '2024-03-11 04:00', '2024-03-11 08:00'),
+        ('H4', 'MICU', 'icu', '2024-03-10 07:00', None),
+        ('H5', 'SICU', 'icu', '2024-03-11 18:00', None),
+        ('H6', 'MICU', 'icu', '2024-11-02 12:00', '2024-11-03 07:00'),
+        ('H6', 'WARD-1', 'ward', '2024-11-03 09:00', '2024-11-04 08:00'),
+        ('H7', 'MICU', 'icu', '2024-11-02 23:00', '2024-11-03 00:45'),
+        ('H8', 'SICU', 'icu', '2024-11-03 06:59', None),
+        ('H9', 'MICU', 'icu', None, '2024-03-09 12:00'),
+        ('H10', 'MICU', 'icu', '2024-11-03 10:00', '2024-11-04 05:00'),
+    ])
+
+
+@pytest.fixture
+def hosp_df():
+    hosp = pd.DataFrame({
+        'hospitalization_id': ['H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'H7', 'H8', 'H9', 'H10'],
+        'discharge_category': ['home', 'expired', 'hospice', None, None, 'home',
+                               'expired', None, 'home', FACILITY_CATEGORIES[0]],
+        'discharge_dttm': ['2024-03-12 12:00', '2024-03-11 06:59', '2024-03-10 06:00', None, None,
+                           '2024-11-04 08:00', '2024-11-03 00:45', None, '2024-03-09 12:00', '2024-11-04 05:00'],
+    })
+    hosp['discharge_dttm'] = pd.to_datetime([_ts(v) for v in hosp['discharge_dttm']]).tz_convert(TZ)
+    return hosp
+
+
+def _baseline_summary(adt_df, hosp_df, location, start_date, end_date):
+    """The per-day loop of the baseline dashboard (categories lower-cased as at load)."""
+    location_adt = adt_df[adt_df['location_name'] == location]
+    adt_tz = adt_df['in_dttm'].dt.tz
+    records = []
+    for day in pd.date_range(start=start_date, end=end_date, freq='D'):
+        day_start = pd.Timestamp(day.date()).replace(hour=7).tz_localize(adt_tz)
+        day_end = pd.Timestamp((day + pd.Timedelta(days=1)).date()).replace(hour=7).tz_localize(adt_tz)
+        census_7pm = pd.Timestamp(day.date()).replace(hour=19).tz_localize(adt_tz)
+
+        def census(t):
+            return len(location_adt[
+                (location_adt['in_dttm'] <= t) & (location_adt['out_dttm'].isna() | (location_adt['out_dttm'] > t))
+            ])
+
+        icu_discharges = location_adt[(location_adt['out_dttm'] >= day_start) & (location_adt['out_dttm'] < day_end)]
+        with_hosp = icu_discharges.merge(
+            hosp_df[['hospitalization_id', 'discharge_category', 'discharge_dttm']], on='hospitalization_id', how='left'
+        )
+        same_day = (with_hosp['discharge_dttm'] >= day_start) & (with_hosp['discharge_dttm'] < day_end)
+
+        floor_transfers = 0
+        for _, row in icu_discharges.iterrows():
+            next_location = adt_df[
+                (adt_df['hospitalization_id'] == row['hospitalization_id'])
+                & (adt_df['in_dttm'] >= row['out_dttm'])
+                & (adt_df['in_dttm'] <= row['out_dttm'] + pd.Timedelta(hours=24))
+            ].sort_values('in_dttm').head(1)
+            if not next_location.empty and next_location.iloc[0]['location_category'] in ['ward', 'stepdown']:
+                floor_transfers += 1
+
+        records.append({
+            'total_admissions': len(location_adt[
+                (location_adt['in_dttm'] >= day_start) & (location_adt['in_dttm'] < day_end)
+            ]),
+            'census_7AM': census(day_start),
+            'census_7PM': census(census_7pm),
+            'total_discharges': len(icu_discharges),
+            'floor_transfers': floor_transfers,
+            'deaths_in_icu': int((same_day & (with_hosp['discharge_category'] == 'expired')).sum()),
+            'discharges_to_hospice': int((same_day & (with_hosp['discharge_category'] == 'hospice')).sum()),
+            'discharges_to_facility': int((same_day & with_hosp['discharge_category'].isin(FACILITY_CATEGORIES)).sum()),
+        })
+    return pd.DataFrame(records, columns=COUNT_COLUMNS)
+
+
+@pytest.mark.parametrize('start_date, end_date', [
+    ('2024-03-07', '2024-03-13'),
+    ('2024-11-01', '2024-11-06'),
+])
+def test_summarize_units_matches_baseline_loop(adt_df, hosp_df, start_date, end_date):
+    locations = ['MICU', 'SICU']
+    summary = summarize_units(build_next_adt_index(adt_df, hosp_df), locations, start_date, end_date, tz=TZ)
+
+    for location in locations:
+        unit = summary[summary['location_name'] == location].reset_index(drop=True)
+        expected = _baseline_summary(adt_df, hosp_df, location, start_date, end_date)
+        assert list(unit['day']) == list(pd.date_range(start_date, end_date, freq='D'))
+        pd.testing.assert_frame_equal(unit[COUNT_COLUMNS].astype('int64'), expected.astype('int64'))
+
+
+def test_summarize_units_counts_open_segments_on_every_later_day(adt_df, hosp_df):
+    summary = summarize_units(build_next_adt_index(adt_df, hosp_df), ['MICU'], '2024-03-10', '2024-03-20', tz=TZ)
+    # H4 entered MICU at 7 AM on Mar 10 and never left
+    assert (summary['census_7AM'] >= 1).all()
+    assert (summary['census_7PM'] >= 1).all()
+
+
+def test_census_at_matches_brute_force(adt_df):
+    snapshots = pd.date_range('2024-03-08 00:00', '2024-03-13 00:00', freq='30min', tz=TZ)
+    for location, location_adt in adt_df.groupby('location_name'):
+        expected = [
+            int(((location_adt['in_dttm'] <= t)
+                 & (location_adt['out_dttm'].isna() | (location_adt['out_dttm'] > t))).sum())
+            for t in snapshots
+        ]
+        np.testing.assert_array_equal(census_at(location_adt, snapshots), expected, err_msg=location)
+
+
+def test_census_at_spring_forward_snapshots():
+    # 2:30 AM does not exist on Mar 10 in Chicago; 7 AM is 12:00 UTC that day instead of 13:00
+    adt = _adt([('H1', 'MICU', 'icu', '2024-03-10 06:30', '2024-03-10 07:30')])
+    snapshots = pd.DatetimeIndex([_ts('2024-03-10 07:00'), _ts('2024-03-10 19:00')])
+    np.testing.assert_array_equal(census_at(adt, snapshots), [1, 0])
+
+
+def test_build_next_adt_index(adt_df, hosp_df):
+    index = build_next_adt_index(adt_df, hosp_df).set_index(['hospitalization_id', 'location_name'])
+
+    # Next segment starting at or after the transfer out
+    assert index.loc[('H1', 'MICU'), 'next_location_category'] == 'ward'
+    assert index.loc[('H1', 'MICU'), 'next_in_dttm'] == _ts('2024-03-10 10:00')
+    # A segment starting exactly at out_dttm counts
+    assert index.loc[('H2', 'MICU'), 'next_location_category'] == 'icu'
+    assert index.loc[('H2', 'MICU'), 'next_in_dttm'] == _ts('2024-03-09 19:00')
+    # Last segment of a stay and open segments have no next location
+    assert pd.isna(index.loc[('H2', 'SICU'), 'next_location_category'])
+    assert pd.isna(index.loc[('H4', 'MICU'), 'next_location_category'])
+    # Hospital discharge joined from the hospitalization table
+    assert index.loc[('H2', 'SICU'), 'discharge_category'] == 'expired'
+    assert index.loc[('H6', 'MICU'), 'discharge_dttm'] == _ts('2024-11-04 08:00')
+    assert len(index) == len(adt_df)
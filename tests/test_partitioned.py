@@ -0,0 +1,106 @@
+"""Partitioned runs: memory sizes, and bucketed builds against the single-connection build."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from partitioned import parse_memory, partitioned_build
+from pipeline_db import connect, materialize, read_sql
+
+TZ = 'America/Chicago'
+SAT_SQL = Path(__file__).resolve().parent.parent / "code" / "sat.sql"
+SAT_TABLES = {"resp_df": "resp_p", "meds_df": "meds_df", "rass_df": "rass_df", "adt_df": "adt_df"}
+
+
+@pytest.mark.parametrize('limit, expected', [
+    ('8GB', 8 * 10**9),
+    ('512MiB', 512 * 2**20),
+    ('1.5 GiB', int(1.5 * 2**30)),
+    ('100kb', 100 * 10**3),
+    (' 2TB ', 2 * 10**12),
+    ('1024', 1024),
+    ('64B', 64),
+])
+def test_parse_memory(limit, expected):
+    assert parse_memory(limit) == expected
+
+
+def test_parse_memory_rejects_unknown_units():
+    with pytest.raises(KeyError):
+        parse_memory('4 parsecs')
+
+
+def _sat_inputs(n_hosp=16, seed=0):
+    """Three-day ventilated ICU stays with sedation stopped and restarted, starting every 2.5 days from late May."""
+    rng = np.random.default_rng(seed)
+    admission = pd.Timestamp('2024-05-20 14:00', tz=TZ) + pd.to_timedelta(np.arange(n_hosp) * 60, unit='h')
+    hours = pd.to_timedelta(np.arange(72), unit='h')
+    resp, meds, rass = [], [], []
+    for h, start in enumerate(admission, start=1):
+        resp.append(pd.DataFrame({
+            'hospitalization_id': h, 'recorded_dttm': start + hours,
+            'device_category': np.where(rng.random(len(hours)) < 0.95, 'imv', 'nasal cannula'),
+        }))
+        changes = np.sort(rng.choice(len(hours), 8, replace=False))
+        meds.append(pd.DataFrame({
+            'hospitalization_id': h, 'recorded_dttm': start + hours[changes] + pd.Timedelta(minutes=10),
+            'med_category': rng.choice(['propofol', 'fentanyl', 'cisatracurium'], len(changes), p=[0.6, 0.3, 0.1]),
+            'med_dose': np.where(np.arange(len(changes)) % 2 == 0, 50.0, 0.0),
+        }))
+        rass.append(pd.DataFrame({
+            'hospitalization_id': h, 'recorded_dttm': start + hours[::2] + pd.Timedelta(minutes=25),
+            'rass': rng.integers(-4, 2, len(hours[::2])).astype(float),
+        }))
+    meds = pd.concat(meds, ignore_index=True)
+    meds['med_group'] = meds['med_category'].map(
+        {'propofol': 'sedative', 'fentanyl': 'opioid', 'cisatracurium': 'paralytic'}
+    )
+    return {
+        'resp_p': pd.concat(resp, ignore_index=True),
+        'meds_df': meds.drop_duplicates(['hospitalization_id', 'med_category', 'recorded_dttm']),
+        'rass_df': pd.concat(rass, ignore_index=True),
+        'adt_df': pd.DataFrame({
+            'hospitalization_id': np.arange(1, n_hosp + 1), 'in_dttm': admission, 'location_category': 'icu',
+        }),
+        'hosp_df': pd.DataFrame({'hospitalization_id': np.arange(1, n_hosp + 1), 'admission_dttm': admission}),
+    }
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """Pipeline database holding the SAT inputs as stages, and a function building `sat.sql` from them."""
+    con = connect(tmp_path / 'pipeline.duckdb', TZ)
+    for name, df in _sat_inputs().items():
+        con.register(f'_{name}', df)
+        materialize(con, name, f"FROM _{name}", [])
+    # The SAT script reads respiratory support as resp_df
+    con.execute("CREATE VIEW resp_df AS FROM resp_p")
+
+    def sat_days(name, build=None):
+        days = materialize(con, name, read_sql(SAT_SQL), [], build=build).df()
+        return days.sort_values(['hospitalization_id', 'event_date']).reset_index(drop=True)
+
+    yield sat_days
+    con.close()
+
+
+def test_hash_buckets_match_the_single_build(pipeline, tmp_path):
+    single = pipeline('sat_single')
+    bucketed = pipeline('sat_bucketed', partitioned_build(SAT_TABLES, 4, 2, str(tmp_path / 'partitions'), TZ))
+    assert single['hospitalization_id'].nunique() > 1
+    pd.testing.assert_frame_equal(bucketed, single)
+
+
+def test_admission_month_chunks_match_the_single_build(pipeline, tmp_path):
+    stays = _sat_inputs()['resp_p'].groupby('hospitalization_id')['recorded_dttm'].agg(['min', 'max'])
+    # Some stays run into the month after their admission; their rows stay in the admission month's chunk
+    assert (stays['min'].dt.month != stays['max'].dt.month).any()
+
+    single = pipeline('sat_single')
+    chunked = pipeline('sat_chunked', partitioned_build(
+        SAT_TABLES, 1, 2, str(tmp_path / 'partitions'), TZ, chunk_by_admission_month=True,
+    ))
+    assert pd.to_datetime(single['event_date']).dt.month.nunique() > 1
+    pd.testing.assert_frame_equal(chunked, single)
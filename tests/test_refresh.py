@@ -0,0 +1,167 @@
+"""Incremental refresh: the refresh scope and merging refreshed rows into saved outputs."""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from overall_summary import build_next_adt_index, summarize_units
+from refresh import current_watermark, merge_hospitalizations, merge_unit_days, refresh_scope
+
+TZ = 'America/Chicago'
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize(TZ)
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TZ}'")
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def sources(tmp_path):
+    adt = pd.DataFrame({
+        'hospitalization_id': ['H1', 'H2', 'H3', 'H4'],
+        'location_name': ['MICU', 'MICU', 'WARD-1', 'SICU'],
+        'location_category': ['icu', 'icu', 'ward', 'icu'],
+        'in_dttm': _ts(['2024-05-01 08:00', '2024-05-02 10:00', '2024-05-02 10:00', '2024-04-20 08:00']),
+        'out_dttm': _ts(['2024-05-05 08:00', '2024-05-03 10:00', '2024-05-06 10:00', '2024-04-22 08:00']),
+    })
+    vitals = pd.DataFrame({
+        'hospitalization_id': ['H1', 'H2', 'H3', 'H4'],
+        'recorded_dttm': _ts(['2024-05-04 09:00', '2024-05-02 11:00', '2024-05-04 12:00', '2024-04-21 08:00']),
+    })
+    adt.to_parquet(tmp_path / 'clif_adt.parquet')
+    vitals.to_parquet(tmp_path / 'clif_vitals.parquet')
+    return {
+        'adt': (str(tmp_path / 'clif_adt.parquet'), ['in_dttm', 'out_dttm']),
+        'vitals': (str(tmp_path / 'clif_vitals.parquet'), ['recorded_dttm']),
+    }
+
+
+def _append(path, rows: pd.DataFrame):
+    pd.concat([pd.read_parquet(path), rows], ignore_index=True).to_parquet(path)
+
+
+def test_no_new_rows_refreshes_nothing(sources, con):
+    refresh_days, refresh_hosp_ids = refresh_scope(sources, current_watermark(sources, con), con)
+    assert len(refresh_days) == 0
+    assert len(refresh_hosp_ids) == 0
+
+
+def test_new_rows_refresh_their_days_and_the_icu_patients_of_those_days(sources, con):
+    watermark = current_watermark(sources, con)
+    _append(sources['vitals'][0], pd.DataFrame({
+        'hospitalization_id': ['H3'], 'recorded_dttm': _ts(['2024-05-06 09:00']),
+    }))
+
+    refresh_days, refresh_hosp_ids = refresh_scope(sources, watermark, con)
+
+    # The clinical day of the new row (May 6, 9 AM is on the May 6 clinical day) and the day before
+    assert list(refresh_days) == list(pd.to_datetime(['2024-05-05', '2024-05-06']))
+    # H3 has the new row; H1 was in an ICU on May 5 (until 8 AM); H2 and H4 were not in an ICU then
+    assert sorted(refresh_hosp_ids) == ['H1', 'H3']
+
+
+def test_new_adt_segment_touches_every_day_it_spans(sources, con):
+    watermark = current_watermark(sources, con)
+    _append(sources['adt'][0], pd.DataFrame({
+        'hospitalization_id': ['H5'], 'location_name': ['SICU'], 'location_category': ['icu'],
+        'in_dttm': _ts(['2024-05-08 08:00']), 'out_dttm': _ts(['2024-05-11 08:00']),
+    }))
+
+    refresh_days, refresh_hosp_ids = refresh_scope(sources, watermark, con)
+
+    assert list(refresh_days) == list(pd.date_range('2024-05-07', '2024-05-11', freq='D'))
+    assert list(refresh_hosp_ids) == ['H5']
+
+
+def test_open_segment_touches_the_days_since_the_last_extract(sources, con):
+    _append(sources['adt'][0], pd.DataFrame({
+        'hospitalization_id': ['H6'], 'location_name': ['SICU'], 'location_category': ['icu'],
+        'in_dttm': _ts(['2024-05-06 06:00']), 'out_dttm': _ts([None]),
+    }))
+    watermark = current_watermark(sources, con)
+    _append(sources['vitals'][0], pd.DataFrame({
+        'hospitalization_id': ['H6'], 'recorded_dttm': _ts(['2024-05-09 12:00']),
+    }))
+
+    refresh_days, refresh_hosp_ids = refresh_scope(sources, watermark, con)
+
+    # The previous extract ended on the May 6 clinical day; H6 is still in the SICU through May 9
+    assert list(refresh_days) == list(pd.date_range('2024-05-07', '2024-05-09', freq='D'))
+    assert list(refresh_hosp_ids) == ['H6']
+
+
+def _unit_days(rows):
+    return pd.DataFrame(rows, columns=['location_name', 'day', 'census_7AM']).assign(
+        day=lambda df: pd.to_datetime(df['day'])
+    )
+
+
+def test_merge_unit_days_replaces_only_the_refreshed_days(tmp_path):
+    path = tmp_path / 'site_overall_summary'
+    _unit_days([
+        ('MICU', '2024-05-01', 1), ('MICU', '2024-05-02', 2), ('MICU', '2024-05-03', 3),
+        ('SICU', '2024-05-01', 4), ('SICU', '2024-05-02', 5), ('SICU', '2024-05-03', 6),
+    ]).to_parquet(path, partition_cols=['location_name'], index=False)
+    refreshed = _unit_days([
+        ('MICU', '2024-05-01', 10), ('MICU', '2024-05-02', 20), ('MICU', '2024-05-03', 30),
+        ('SICU', '2024-05-02', 50), ('SICU', '2024-05-03', 60),
+    ])
+
+    merged = merge_unit_days(path, refreshed, pd.to_datetime(['2024-05-02', '2024-05-03']))
+
+    # Rows of the refreshed cohort outside the refresh days only saw part of the patients and are not used
+    assert merged.reset_index(drop=True).to_dict('records') == _unit_days([
+        ('MICU', '2024-05-01', 1), ('MICU', '2024-05-02', 20), ('MICU', '2024-05-03', 30),
+        ('SICU', '2024-05-01', 4), ('SICU', '2024-05-02', 50), ('SICU', '2024-05-03', 60),
+    ]).to_dict('records')
+
+
+def test_merge_unit_days_keeps_units_without_refreshed_patients(tmp_path):
+    path = tmp_path / 'site_overall_summary'
+    _unit_days([
+        ('MICU', '2024-05-01', 1), ('MICU', '2024-05-02', 1),
+        ('SICU', '2024-05-01', 2), ('SICU', '2024-05-02', 1),
+    ]).to_parquet(path, partition_cols=['location_name'], index=False)
+    # The refreshed cohort has no SICU patient, but the summary covers every ICU unit of the extract
+    cohort_adt = pd.DataFrame({
+        'hospitalization_id': ['H1'], 'location_name': ['MICU'], 'location_category': ['icu'],
+        'in_dttm': _ts(['2024-05-01 08:00']), 'out_dttm': _ts(['2024-05-03 09:00']),
+    })
+    hosp = pd.DataFrame({'hospitalization_id': ['H1'], 'discharge_category': ['home'], 'discharge_dttm': _ts([None])})
+    refreshed = summarize_units(
+        build_next_adt_index(cohort_adt, hosp), ['MICU', 'SICU'], '2024-05-01', '2024-05-02', tz=TZ
+    )[['location_name', 'day', 'census_7AM']]
+
+    merged = merge_unit_days(path, refreshed, pd.to_datetime(['2024-05-02']))
+
+    assert merged.reset_index(drop=True).to_dict('records') == _unit_days([
+        ('MICU', '2024-05-01', 1), ('MICU', '2024-05-02', 1),
+        ('SICU', '2024-05-01', 2), ('SICU', '2024-05-02', 0),
+    ]).to_dict('records')
+
+
+def test_merge_unit_days_without_saved_output(tmp_path):
+    refreshed = _unit_days([('MICU', '2024-05-01', 1)])
+    assert merge_unit_days(tmp_path / 'missing', refreshed, pd.to_datetime(['2024-05-01'])) is refreshed
+    assert merge_unit_days(tmp_path / 'missing', refreshed, None) is refreshed
+
+
+def test_merge_hospitalizations(tmp_path):
+    path = tmp_path / 'site_sat_days.parquet'
+    pd.DataFrame({'hospitalization_id': ['H1', 'H2'], 'sat_eligible': [1, 1]}).to_parquet(path, index=False)
+    new = pd.DataFrame({'hospitalization_id': ['H2', 'H3'], 'sat_eligible': [0, 1]})
+
+    merged = merge_hospitalizations(path, new, ['H2', 'H3'])
+
+    assert merged.to_dict('records') == [
+        {'hospitalization_id': 'H1', 'sat_eligible': 1},
+        {'hospitalization_id': 'H2', 'sat_eligible': 0},
+        {'hospitalization_id': 'H3', 'sat_eligible': 1},
+    ]
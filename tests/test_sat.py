@@ -0,0 +1,55 @@
+"""SAT day-level eligibility from `sat.sql`."""
+
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pytest
+
+SAT_SQL = Path(__file__).resolve().parent.parent / "code" / "sat.sql"
+
+
+def _ts(values):
+    return pd.to_datetime(pd.Series(values)).dt.tz_localize('UTC')
+
+
+@pytest.fixture
+def con():
+    # Hospitalization 1 is ventilated and sedated in the ICU overnight, and the propofol is stopped at 9 AM
+    hours = pd.date_range('2024-05-01 18:00', '2024-05-02 12:00', freq='h')
+    inputs = {
+        'adt_df': pd.DataFrame({
+            'hospitalization_id': [1], 'in_dttm': _ts(['2024-05-01 18:00']), 'location_category': ['icu'],
+        }),
+        'resp_df': pd.DataFrame({
+            'hospitalization_id': 1, 'recorded_dttm': _ts(hours), 'device_category': 'imv',
+        }),
+        'meds_df': pd.DataFrame({
+            'hospitalization_id': [1, 1], 'med_category': ['propofol', 'propofol'],
+            'recorded_dttm': _ts(['2024-05-01 18:00', '2024-05-02 09:00']), 'med_dose': [50.0, 0.0],
+            'med_group': ['sedative', 'sedative'],
+        }),
+        'rass_df': pd.DataFrame({
+            'hospitalization_id': [1, 1], 'recorded_dttm': _ts(['2024-05-02 08:45', '2024-05-02 09:20']),
+            'rass': [-3.0, 0.0],
+        }),
+    }
+    con = duckdb.connect()
+    con.execute("SET TimeZone = 'UTC'")
+    for name, df in inputs.items():
+        con.register(name, df)
+    yield con
+    con.close()
+
+
+def _sat_days(con):
+    days = con.sql(SAT_SQL.read_text()).df()[['hospitalization_id', 'event_date', 'sat_eligible']]
+    return days.assign(event_date=pd.to_datetime(days['event_date'])).to_dict('records')
+
+
+def test_overnight_block_makes_the_next_day_eligible(con):
+    # The eligibility block starts at 6 PM on May 1 and runs overnight: May 2 (block_start_dttm::DATE + 1)
+    # is eligible, May 1 is not, although the patient already had events that evening
+    assert _sat_days(con) == [
+        {'hospitalization_id': 1, 'event_date': pd.Timestamp('2024-05-02'), 'sat_eligible': 1},
+    ]
@@ -0,0 +1,64 @@
+"""Range sums of `UnitCube` against summing the daily rows directly."""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from unit_metrics import UnitCube, day_slice
+
+COLUMNS = ['sat_eligible', 'sat_delivered']
+
+
+@pytest.fixture
+def daily():
+    rng = np.random.default_rng(0)
+    days = pd.date_range('2024-01-01', '2024-02-29', freq='D')
+    # Some days have no row at all, as in the backend tables
+    days = days[rng.random(len(days)) < 0.8]
+    return pd.DataFrame({
+        'day': days,
+        'sat_eligible': rng.integers(0, 10, len(days)),
+        'sat_delivered': rng.integers(0, 5, len(days)),
+    })
+
+
+def _direct_totals(daily, start_date, end_date):
+    rows = daily[daily['day'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))]
+    return rows[COLUMNS].sum().astype(float)
+
+
+def test_totals_match_direct_sums(daily):
+    cube = UnitCube(daily, COLUMNS, '2024-01-01', '2024-02-29')
+    bounds = pd.date_range('2024-01-01', '2024-02-29', freq='6D')
+    for start_date, end_date in itertools.combinations_with_replacement(bounds, 2):
+        totals = cube.totals(start_date, end_date)
+        pd.testing.assert_series_equal(totals[COLUMNS], _direct_totals(daily, start_date, end_date), check_names=False)
+        assert totals['n_days'] == (end_date - start_date).days + 1
+
+
+def test_totals_clip_to_the_span(daily):
+    cube = UnitCube(daily, COLUMNS, '2024-01-10', '2024-01-31')
+    totals = cube.totals('2023-12-01', '2024-03-31')
+    pd.testing.assert_series_equal(totals[COLUMNS], _direct_totals(daily, '2024-01-10', '2024-01-31'), check_names=False)
+    assert totals['n_days'] == 22
+
+
+def test_empty_and_reversed_ranges(daily):
+    cube = UnitCube(daily, COLUMNS, '2024-01-01', '2024-02-29')
+    for start_date, end_date in [('2024-03-01', '2024-03-31'), ('2024-01-20', '2024-01-10')]:
+        totals = cube.totals(start_date, end_date)
+        assert (totals == 0).all()
+
+
+def test_rows_of_the_same_day_are_added():
+    daily = pd.DataFrame({'day': ['2024-01-01', '2024-01-01', '2024-01-02'], 'sat_eligible': [1, 2, 4]})
+    cube = UnitCube(daily, ['sat_eligible'], '2024-01-01', '2024-01-02')
+    assert cube.totals('2024-01-01', '2024-01-01')['sat_eligible'] == 3
+    assert cube.totals('2024-01-01', '2024-01-02')['sat_eligible'] == 7
+
+
+def test_day_slice(daily):
+    rows = day_slice(daily, '2024-01-15', '2024-02-01')
+    pd.testing.assert_frame_equal(rows, daily[daily['day'].between('2024-01-15', '2024-02-01')])